@@ -1,6 +1,5 @@
 import os
 import re
-import requests
 from tqdm import tqdm
 import pdb
 import argparse
@@ -10,10 +9,9 @@ import sys
 import numpy as np
 import pandas as pd
 
-from bs4 import BeautifulSoup
 from multiprocessing import Pool
 
-from helpers import parallelize
+from Agency_proposal_extractor.agency_extractor import AgencyExtractor, register_agency
 
 
 def clean_text(text):
@@ -31,45 +29,23 @@ def clean_text(text):
     return re_text.replace("\xa0", "")
 
 
-class NIHExtractor():
-    """ Class which contains all the required functions to extract data from the NIH website
+@register_agency
+class NIHExtractor(AgencyExtractor):
+    """ Plugin which extracts the proposals from the NIH website
     """
 
+    agency = 'National Institutes of Health'
 
-    def __init__(self, urls, data, save_filename):
-        """ Constructor
-        
-        :param urls: Array of URLs from which proposal data need to be extracted
-        :type urls: `numpy.ndarray`
-        :param data: List of URLs from which proposal data need to be extracted
-        :type data: class `Pandas.DataFrame`
-        :param save_filename: Filename to save the extracted NIH data
-        :type save_filename: `str`
-        
-        :return: None
-
-        """
-
-        self.urls = urls
-        self.main_data = data
-        self.save_filename = save_filename
+    def parse(self, doc):
+        """ Function to extract the organization and the description of a funding opportunity
 
-    def get_response(self, url):
-        """ Function to retrieve response from NIH page. The processed response will be save as self.soup
+        :param doc: Page parsed by `self.backend`
 
-        :param url: The URL from which response is to be retrieved
-        :type url: `str`
-        
-        :return: Response Data
-        :rtype: class `response`
+        :return: Dictionary of {Department, Description}
+        :rtype: `Dict`
         """
-        payload = {}
-        headers = {}
-        self.response = requests.request(
-            "GET", url, headers=headers, data=payload)
-        response_str = self.response.text
-        self.soup = BeautifulSoup(response_str, "html.parser")
-        return self.response
+        self.soup = doc
+        return {'Department': self.get_organisation(), 'Description': self.get_description()}
 
     def get_organisation(self):
         """ Function to extract the organization details from NIH webpage. The webpage details are obtained from self.soup
@@ -77,26 +53,27 @@ class NIHExtractor():
         :return: Department 
         :rtype:  `str`
         """
+        backend = self.backend
         try:
-            dept = self.soup.findAll(
-                'div', {'class': 'col-md-8 datacolumn'})[1].getText()
+            dept = backend.text(backend.find_all(
+                self.soup, 'div', {'class': 'col-md-8 datacolumn'})[1])
             dept = ' '.join(dept.splitlines())
 
             if not dept == '':
                 return dept
             else:
-                divs = self.soup.findAll('div')
-                div = self.soup.find('div',
-                                     {'class': 'col-md-4 datalabel',
-                                      'data-element-type': 'LINKED_ELEMENT'})
-                dept = divs[divs.index(div) + 1].getText()
+                div = backend.find(self.soup, 'div',
+                                   {'class': 'col-md-4 datalabel',
+                                    'data-element-type': 'LINKED_ELEMENT'})
+                # Value of the label : the next div of the page
+                dept = backend.text(backend.next_element(div, 'div'))
                 dept = ' '.join(dept.splitlines())
 
                 if not dept == '':
                     return dept
                 else:
-                    dept = self.soup.findAll(
-                        'div', {'class': 'col-md-8 datacolumn'})[2].getText()
+                    dept = backend.text(backend.find_all(
+                        self.soup, 'div', {'class': 'col-md-8 datacolumn'})[2])
                     dept = ' '.join(dept.splitlines())
 
                     if not dept == '':
@@ -110,15 +87,20 @@ class NIHExtractor():
         :return: Description 
         :rtype:  `str`
         """
+        backend = self.backend
         try:
-            divs = self.soup.find_all()
-            div_1 = self.soup.find('a', {'name': '_Section_I._Funding'})
-            idx1 = divs.index(div_1)
-
+            divs = backend.elements(self.soup)
+            div_1 = backend.find(self.soup, 'a', {'name': '_Section_I._Funding'})
+            idx1 = [id(i) for i in divs].index(id(div_1))
+
+            # The text ends with the first element containing a link to Section VIII
+            ends = set(id(parent)
+                       for link in backend.find_all(self.soup, 'a', {'href': '#_Section_VIII._Other'})
+                       for parent in backend.ancestors(link))
             desc = []
             for i in divs[idx1:]:
-                desc.append(i.getText())
-                if i.find('a', {'href': '#_Section_VIII._Other'}):
+                desc.append(backend.text(i))
+                if id(i) in ends:
                     break
             desc = ''.join(''.join(desc).splitlines())
 
@@ -126,77 +108,3 @@ class NIHExtractor():
 
         except BaseException:
             return ''
-
-    def extract_page_info(self, url, i):
-        """ Function to extract all details from NIH webpage.
-        
-        :param url: The URL from which proposal details should be extracted
-        :type url: `str'
-        :param i: A placeholde number for idnetifying the URL index
-        :type i: `int  `
-
-        :return: List containing 'URL',keywords for organization, keywords for description 
-        :rtype: `list`
-        """
-
-        try:
-            response = self.get_response(url)
-            if self.get_response(url).status_code == 404:
-                return [url] + [np.nan] * 2
-            org = self.get_organisation()
-            desc = self.get_description()
-            return [url, org, desc]
-        except BaseException:
-            return [url] + [np.nan] * 2
-
-    def extract_all(self, n_cores, output_path):
-        """ Parent function to extract all webpage details from NIH (using URLs extracted from Grants.gov). 
-        The function saves all the details to the 'save_filename' file in 'output_path'
-
-
-        :param n_cores: No: of cores of CPU to be utilized for parallel processing
-        :type n_cores: `int`
-        :param output_path: The path where all the data is saved
-        :type output_path: `str`
-
-
-        :return: None
-        """
-        ipt = [(i, j) for i, j in zip(self.urls, range(len(self.urls)))]
-        descs = []
-
-        # TODELETE
-        # ipt = ipt[:10]
-        descs = parallelize(
-            n_cores=n_cores,
-            func=self.extract_page_info,
-            arg1=ipt)
-
-        cfp_df = pd.DataFrame(
-            descs,
-            columns=[
-                "URL",
-                "Organization",
-                "Description"])
-        final_data = pd.merge(cfp_df,
-                              self.main_data[['OPPORTUNITY NUMBER',
-                                              'OpportunityTitle',
-                                              'AdditionalInformationURL']],
-                              left_on='URL',
-                              right_on='AdditionalInformationURL',
-                              how='left')
-
-        final_data = final_data[['OPPORTUNITY NUMBER', 'URL',
-                                 'OpportunityTitle', 'Organization', 'Description']]
-        final_data.rename(
-            columns={
-                'OpportunityTitle': 'Title',
-                'OPPORTUNITY NUMBER': 'Opportunity Number',
-                'Organization': 'Department'},
-            inplace=True)
-
-        final_data.to_csv(
-            os.path.join(
-                output_path,
-                self.save_filename),
-            index=False)
@@ -1,7 +1,7 @@
-from helpers import parallelize, tokenize
+from helpers import tokenize
+from Agency_proposal_extractor.agency_extractor import AgencyExtractor, register_agency
 import os
 import re
-import requests
 from tqdm import tqdm
 import pdb
 import argparse
@@ -11,7 +11,6 @@ import sys
 import numpy as np
 import pandas as pd
 
-from bs4 import BeautifulSoup
 from multiprocessing import Pool
 
 sys.path.append('..')
@@ -39,8 +38,8 @@ def remove_tags(text):
     return re_text.replace("\xa0", "")
 
 
-def isSection(ele, eleId):
-    return ele.name == 'h3' and ele.find("a", {"id": eleId}) is not None
+# Anchors of the section headers (h3) of a solicitation, the text between two headers is a section
+SECTION_IDS = ["pgm_intr_txt", "pgm_desc_txt", "awd_info"]
 
 
 def clean_text(text):
@@ -50,56 +49,44 @@ def clean_text(text):
     return re_text.replace("\xa0", "")
 
 
-class NSFExtractor():
-    """ Class which contains all the required functions to extract data from the NSF website
+@register_agency
+class NSFExtractor(AgencyExtractor):
+    """ Plugin which extracts the proposals from the NSF website
     """
 
+    agency = 'National Science Foundation'
 
-    def __init__(self, urls, data, save_filename):
-        """ Constructor
-        
-        :param urls: Array of URLs from which proposal data need to be extracted
-        :type urls: `numpy.ndarray`
-        :param data: List of URLs from which proposal data need to be extracted
-        :type data: class `Pandas.DataFrame`
-        :param save_filename: Filename to save the extracted NIH data
-        :type save_filename: `str`
-        
-        :return: data
-		:rtype: `str`
-
-        """
-        self.urls = urls
-        self.main_data = data
-        self.idx = urls
-        self.save_filename = save_filename
-
-    def get_response(self, url):
-        """ Function to retrieve response from NSF page. The processed response will be save as self.soup
+    def fetch(self, url):
+        """ Function to retrieve the solicitation of a NSF proposal : the Grants.gov URL leads to a
+        landing page whose "HTML" link is the solicitation
 
         :param url: The URL from which response is to be retrieved
         :type url: `str`
         
-        :return: Response Data
-        :rtype: class `response`
+        :return: Page of the solicitation (the landing page if it has no HTML version)
+        :rtype: `str`
         """
-        payload = {}
-        headers = {}
-        response = requests.request("GET", url, headers=headers, data=payload)
-        self.soup = BeautifulSoup(response.text, "html.parser")
+        page = super().fetch(url)
         try:
-            nsf_url = self.soup.find_all(
-                "a", href=True, text="HTML")[0]['href']
-            if nsf_url[:5] == '/pubs':
-                nsf_url = "https://www.nsf.gov" + nsf_url
-            self.response = requests.request(
-                "GET", nsf_url, headers=headers, data=payload)
-            response_str = self.response.text
-            self.soup = BeautifulSoup(response_str, "html.parser")
-
-        except BaseException:
-            return ''
-        return self.response
+            nsf_url = self.backend.link_href(self.backend.parse(page), "HTML")
+        except IndexError:
+            return page
+        if nsf_url[:5] == '/pubs':
+            nsf_url = "https://www.nsf.gov" + nsf_url
+        return super().fetch(nsf_url)
+
+    def parse(self, doc):
+        """ Function to extract the department and the description (introduction and program
+        description) of a solicitation
+
+        :param doc: Solicitation parsed by `self.backend`
+
+        :return: Dictionary of {Department, Description}
+        :rtype: `Dict`
+        """
+        self.soup = doc
+        intr, desc = self.get_intro_desc()
+        return {'Department': self.get_dept(), 'Description': intr + ' ' + desc}
 
     def get_title(self):
         """ Function to extract the Title details from NSF webpage. The webpage details are obtained from self.soup
@@ -107,7 +94,8 @@ class NSFExtractor():
         :return: Title 
         :rtype:  `str`
         """
-        return processing(self.idx, remove_tags(self.soup.find("title")))
+        return processing(None, remove_tags(
+            self.backend.markup(self.backend.find(self.soup, "title"))))
 
     def get_dept(self):
         """ Function to extract the Department details from NSF webpage. The webpage details are obtained from self.soup
@@ -116,10 +104,11 @@ class NSFExtractor():
         :rtype:  `str`
         """
 
-        dept_text = self.soup.find("table").find(
-            "table").find("tr").find_all("td")[-1]
-        dept_text = remove_tags(str(dept_text))
-        return processing(self.idx, dept_text)
+        backend = self.backend
+        table = backend.find(backend.find(self.soup, "table"), "table")
+        dept_text = backend.find_all(backend.find(table, "tr"), "td")[-1]
+        dept_text = remove_tags(backend.markup(dept_text))
+        return processing(None, dept_text)
 
     def get_intro_desc(self):
         """ Function to extract the Introduction and Description from NSF webpage. 
@@ -128,100 +117,23 @@ class NSFExtractor():
         :return: Tuple containing the extracted text for introduction / description 
         :rtype:  `Tuple`
         """
-        elements = self.soup.find_all()
+        backend = self.backend
+        elements = backend.elements(self.soup)
+        position = {id(element): idx for idx, element in enumerate(elements)}
+
+        # Only the h3 headers are searched for the section anchors
         idxList = []
-        for idx in range(len(elements)):
-            if isSection(elements[idx], "pgm_intr_txt"):
-                idxList.append(idx)
-            if isSection(elements[idx], "pgm_desc_txt"):
-                idxList.append(idx)
-            if isSection(elements[idx], "awd_info"):
-                idxList.append(idx)
-
-        intr_text = " ".join([remove_tags(str(i))
+        for header in backend.find_all(self.soup, "h3"):
+            for section_id in SECTION_IDS:
+                if backend.find(header, "a", {"id": section_id}) is not None:
+                    idxList.append(position[id(header)])
+
+        intr_text = " ".join([remove_tags(backend.markup(i))
                              for i in elements[idxList[0] + 1:idxList[1]]])
-        desc_text = " ".join([remove_tags(str(i))
+        desc_text = " ".join([remove_tags(backend.markup(i))
                              for i in elements[idxList[1] + 1:idxList[2]]])
 
-        return processing(self.idx, intr_text), processing(self.idx, desc_text)
-
-    def extract_page_info(self, url, i):
-        """ Function to extract all details from NSF webpage.
-        
-        :param url: The URL from which proposal details should be extracted
-        :type url: `str'
-        :param i: A placeholde number for idnetifying the URL index
-        :type i: `int  `
-
-        :return: List containing 'URL',keywords for organization, keywords for description 
-        :rtype: `list`
-        """
-        try:
-            response = self.get_response(url)
-            title = self.get_title()
-            dept = self.get_dept()
-            intr, desc = self.get_intro_desc()
-            return [url, title, dept, intr, desc]
-        except BaseException:
-            return [url] + [np.nan] * 4
-
-    def extract_all(self, n_cores, output_path):
-        """ Parent function to extract all webpage details from NSF (using URLs extracted from Grants.gov). 
-        The function saves all the details to the 'save_filename' file in 'output_path'
-
-
-        :param n_cores: No: of cores of CPU to be utilized for parallel processing
-        :type n_cores: `int`
-        :param output_path: The path where all the data is saved
-        :type output_path: `str`
-
-
-        :return: None
-        """
-
-        ipt = [(i, j) for i, j in zip(self.urls, range(len(self.urls)))]
-        descs = []
-
-        # #TEST
-        # ipt = ipt[:10]
-        # self.extract_page_info(ipt[7][0], ipt[7][1])
-        descs = parallelize(
-            n_cores=n_cores,
-            func=self.extract_page_info,
-            arg1=ipt)
-        cfp_df = pd.DataFrame(
-            descs,
-            columns=[
-                "URL",
-                "Title",
-                "Organization",
-                "Introduction",
-                "Description_"])
-        cfp_df = cfp_df.assign(
-            Description=lambda x: x['Introduction'] +
-            ' ' +
-            x['Description_'])
-        cfp_df.drop(['Introduction', 'Description_'], axis=1)
-        final_data = pd.merge(cfp_df,
-                              self.main_data[['OPPORTUNITY NUMBER',
-                                              'OpportunityTitle',
-                                              'AdditionalInformationURL']],
-                              left_on='URL',
-                              right_on='AdditionalInformationURL',
-                              how='left')
-        final_data = final_data[['OPPORTUNITY NUMBER', 'URL',
-                                 'OpportunityTitle', 'Organization', 'Description']]
-        final_data.rename(
-            columns={
-                'OpportunityTitle': 'Title',
-                'OPPORTUNITY NUMBER': 'Opportunity Number',
-                'Organization': 'Department'},
-            inplace=True)
-        final_data.to_csv(
-            os.path.join(
-                output_path,
-                self.save_filename),
-            index=False)
+        return processing(None, intr_text), processing(None, desc_text)
 
 
 # if __name__ == "__main__":
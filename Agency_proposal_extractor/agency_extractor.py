@@ -0,0 +1,602 @@
+""" Plugin framework of the agency extractors.
+
+An agency plugin is a subclass of `AgencyExtractor` registered with `register_agency`. It only says
+which proposals belong to the agency (`select_urls`) and how to read a page (`parse`), and may change
+how a page is downloaded (`fetch`). Everything else is shared by all the agencies and done by
+`ExtractionEngine`:
+
+- the agencies are extracted together: pages are fetched by a pool of threads (through `http_client`:
+  rate limits, retries) and parsed by a pool of worker processes, both shared by the agencies
+- fetched pages are kept in a page cache, keyed by URL and LastUpdatedDate of the proposal
+- only the new / changed proposals are crawled, the rows of the previous extraction are kept for the others
+- pages which could not be downloaded are retried once the other pages of the agency are queued
+- rows are written to a checkpoint file as soon as their page is parsed; an interrupted extraction
+  resumes from it, and it replaces the output file once every page of the agency is done
+- the outcome of each agency (counts, failed pages, errors) is returned as a report
+
+The plugins are the modules of this package named `*_Extractor.py`, see `load_agency_extractors`.
+"""
+import os
+import csv
+import gzip
+import time
+import hashlib
+import pkgutil
+import importlib
+import traceback
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+import numpy as np
+import pandas as pd
+
+import http_client
+from tqdm import tqdm
+from helpers import atomic_output
+from Agency_proposal_extractor.html_backends import get_backend
+
+
+# Columns of the extracted proposals of every agency
+OUTPUT_COLUMNS = ['Opportunity Number', 'URL', 'Title', 'Department', 'Description']
+
+# Columns filled by the plugins
+PAGE_COLUMNS = ['Department', 'Description']
+
+AGENCY_EXTRACTORS = {}
+
+
+def register_agency(cls):
+    """ Class decorator which registers an agency plugin under its `agency` name (AgencyName in Grants.gov)
+
+    :param cls: Agency plugin
+    :type cls: class `AgencyExtractor`
+
+    :return: The plugin
+    :rtype: class `AgencyExtractor`
+    """
+    AGENCY_EXTRACTORS[cls.agency] = cls
+    return cls
+
+
+def load_agency_extractors():
+    """ Function to import the `*_Extractor` modules of the package so that their plugins are registered
+
+    :return: Dictionary of {agency name : agency plugin}
+    :rtype: `Dict`
+    """
+    package_path = os.path.dirname(os.path.abspath(__file__))
+    for module in pkgutil.iter_modules([package_path]):
+        if module.name.endswith('_Extractor'):
+            importlib.import_module('Agency_proposal_extractor.' + module.name)
+    return AGENCY_EXTRACTORS
+
+
+class PageCache():
+    """ Fetched pages saved as gzipped files, one folder per agency
+    """
+
+    def __init__(self, folder):
+        """ Constructor
+
+        :param folder: Folder of the cached pages
+        :type folder: `str`
+
+        :return: None
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.folder, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.html.gz')
+
+    def get(self, key):
+        """ Function to read a cached page
+
+        :param key: Key of the page
+        :type key: `str`
+
+        :return: Page, None if it is not cached
+        :rtype: `str`
+        """
+        try:
+            with gzip.open(self.path(key), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def put(self, key, page):
+        """ Function to save a page, written atomically as several workers share the cache
+
+        :param key: Key of the page
+        :type key: `str`
+        :param page: Page
+        :type page: `str`
+
+        :return: None
+        """
+        with atomic_output(self.path(key)) as tmp_path:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(page)
+
+    def prune(self, keys):
+        """ Function to remove the pages whose key is not in `keys` (closed or updated proposals)
+
+        :param keys: Keys of the pages to keep
+        :type keys: `Iterable`
+
+        :return: No of pages removed
+        :rtype: `int`
+        """
+        keep = set(os.path.basename(self.path(key)) for key in keys)
+        removed = 0
+        for name in os.listdir(self.folder):
+            if name.endswith('.html.gz') and name not in keep:
+                os.remove(os.path.join(self.folder, name))
+                removed += 1
+        return removed
+
+
+class AgencyExtractor():
+    """ Base class of the agency plugins. A plugin sets `agency` and implements `parse`.
+    """
+
+    # AgencyName of the proposals of the agency in Grants.gov
+    agency = None
+
+    def __init__(self, html_backend='lxml', cache=None):
+        """ Constructor
+
+        :param html_backend: Name of the HTML parsing backend ('lxml' or 'soup')
+        :type html_backend: `str`
+        :param cache: Cache of the fetched pages, None to always fetch them
+        :type cache: class `PageCache`
+
+        :return: None
+        """
+        self.backend = get_backend(html_backend)
+        self.cache = cache
+
+    def select_urls(self, data):
+        """ Function to select the URLs of the proposals of the agency
+
+        :param data: Open proposals (agency file written by extract_proposals.py)
+        :type data: class `Pandas.DataFrame`
+
+        :return: URLs of the proposals
+        :rtype: `numpy.ndarray`
+        """
+        return data[data['AgencyName'] == self.agency]['AdditionalInformationURL'].values
+
+    def fetch(self, url):
+        """ Function to download the page of a proposal
+
+        :param url: URL of the proposal (AdditionalInformationURL)
+        :type url: `str`
+
+        :return: Page
+        :rtype: `str`
+        """
+        response = http_client.get(url)
+        response.raise_for_status()
+        return response.text
+
+    def parse(self, doc):
+        """ Function to extract the fields of a proposal from its page
+
+        :param doc: Page parsed by `self.backend`
+
+        :return: Dictionary of {column of PAGE_COLUMNS : value}
+        :rtype: `Dict`
+        """
+        raise NotImplementedError
+
+    def get_page(self, url, key):
+        """ Function to read the page of a proposal from the cache, or fetch it and cache it
+
+        :param url: URL of the proposal
+        :type url: `str`
+        :param key: Key of the page in the cache
+        :type key: `str`
+
+        :return: Page
+        :rtype: `str`
+        """
+        page = self.cache.get(key) if self.cache is not None else None
+        if page is None:
+            page = self.fetch(url)
+            if self.cache is not None:
+                self.cache.put(key, page)
+        return page
+
+
+_worker_extractors = {}
+
+
+def _set_worker_extractors(extractors):
+    """ Initializer of the parsing processes: the plugins are sent once per worker
+
+    :param extractors: Dictionary of {agency name : plugin instance}
+    :type extractors: `Dict`
+
+    :return: None
+    """
+    _worker_extractors.update(extractors)
+
+
+def _parse_page(agency, page):
+    """ Worker task : parse the page of a proposal with the plugin of its agency
+
+    :param agency: Name of the agency
+    :type agency: `str`
+    :param page: Page
+    :type page: `str`
+
+    :return: Dictionary of {column of PAGE_COLUMNS : value}
+    :rtype: `Dict`
+    """
+    extractor = _worker_extractors[agency]
+    return extractor.parse(extractor.backend.parse(page))
+
+
+def is_retryable(error):
+    """ Function to tell whether a page which could not be fetched is worth another try.
+    4xx answers (eg: 404 for withdrawn proposals) are not.
+
+    :param error: Exception raised by the fetch
+    :type error: `Exception`
+
+    :return: True if the fetch should be retried
+    :rtype: `bool`
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return True
+
+
+class AgencyRun():
+    """ Extraction of one agency: proposals left to crawl, checkpoint file and report
+    """
+
+    def __init__(self, extractor, agency_path, extracted_path, position=0):
+        """ Constructor
+
+        :param extractor: Plugin of the agency
+        :type extractor: class `AgencyExtractor`
+        :param agency_path: Path of the agency file written by extract_proposals.py
+        :type agency_path: `str`
+        :param extracted_path: Path of the extracted proposals of the agency
+        :type extracted_path: `str`
+        :param position: Line of the progress bar of the agency
+        :type position: `int`
+
+        :return: None
+        """
+        self.extractor = extractor
+        self.agency = extractor.agency
+        self.agency_path = agency_path
+        self.extracted_path = extracted_path
+        self.checkpoint_path = extracted_path + '.partial'
+        self.position = position
+        self.tasks = deque()
+        # Pages being fetched, and pages being fetched or parsed
+        self.fetching = 0
+        self.in_flight = 0
+        self.keys = {}
+        self.file = None
+        self.progress = None
+        self.start = time.perf_counter()
+        self.report = {'status': 'running', 'crawled': 0, 'failed': 0, 'unchanged': 0, 'resumed': 0,
+                       'elapsed': 0.0, 'error': None, 'pages': []}
+
+    @property
+    def running(self):
+        return self.report['status'] == 'running'
+
+    def get_previous_extraction(self, data, urls):
+        """ Function to find the proposals which do not need to be crawled again : rows of the previous
+        extraction of the agency, with a description, whose proposal is still open and unchanged
+        (column Changed of the agency file, written by extract_proposals.py in incremental mode).
+
+        :param data: Open proposals of the agency
+        :type data: class `Pandas.DataFrame`
+        :param urls: URLs of the open proposals
+        :type urls: `numpy.ndarray`
+
+        :return: Tuple of (rows of the previous extraction to keep, URLs to crawl)
+        :rtype: `Tuple`
+        """
+        if 'Changed' not in data or not os.path.exists(self.extracted_path):
+            return None, urls
+
+        unchanged = data['AdditionalInformationURL'][data['Changed'].astype(str) != 'True']
+        if os.path.getmtime(self.extracted_path) >= os.path.getmtime(self.agency_path):
+            # The changed proposals of this agency file were already crawled
+            unchanged = data['AdditionalInformationURL']
+
+        previous = pd.read_csv(self.extracted_path)
+        previous = previous[previous['Description'].notna() &
+                            previous['URL'].isin(unchanged)]
+        urls = urls[~pd.Series(urls).isin(previous['URL']).values]
+        return previous, urls
+
+    def get_checkpoint(self, urls):
+        """ Function to read the rows of an interrupted extraction of the same proposals
+
+        :param urls: URLs to crawl
+        :type urls: `numpy.ndarray`
+
+        :return: Tuple of (rows of the checkpoint to keep, URLs to crawl)
+        :rtype: `Tuple`
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None, urls
+        try:
+            resumed = pd.read_csv(self.checkpoint_path)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError):
+            return None, urls
+        resumed = resumed[resumed['Description'].notna() &
+                          resumed['URL'].isin(urls)]
+        urls = urls[~pd.Series(urls).isin(resumed['URL']).values]
+        return resumed, urls
+
+    def get_cache_keys(self, data, urls):
+        """ Function to get the cache key of each URL : the URL and the LastUpdatedDate of its proposal,
+        so that the page of an updated proposal is fetched again
+
+        :param data: Open proposals
+        :type data: class `Pandas.DataFrame`
+        :param urls: URLs of the proposals
+        :type urls: `numpy.ndarray`
+
+        :return: Dictionary of {URL : key}
+        :rtype: `Dict`
+        """
+        if 'LastUpdatedDate' not in data:
+            return {url: str(url) for url in urls}
+        updated = data.groupby('AdditionalInformationURL')['LastUpdatedDate'].max().astype(str)
+        return {url: "%s|%s" % (url, updated.get(url, '')) for url in urls}
+
+    def prepare(self):
+        """ Function to select the proposals to crawl and start the checkpoint file with the rows
+        which are kept (previous extraction) or recovered (checkpoint of an interrupted extraction)
+
+        :return: None
+        """
+        data = pd.read_csv(self.agency_path)
+        urls = pd.unique(self.extractor.select_urls(data))
+        self.keys = self.get_cache_keys(data, urls)
+        # Only the new / changed proposals are crawled
+        previous, urls = self.get_previous_extraction(data, urls)
+        resumed, urls = self.get_checkpoint(urls)
+
+        # Rows of the output for each URL (a URL can be shared by several opportunities)
+        self.opportunities = {}
+        for number, title, url in data[['OPPORTUNITY NUMBER', 'OpportunityTitle',
+                                        'AdditionalInformationURL']].itertuples(index=False):
+            self.opportunities.setdefault(url, []).append((number, title))
+
+        kept = [rows[OUTPUT_COLUMNS] for rows in (previous, resumed) if rows is not None]
+        self.report['unchanged'] = 0 if previous is None else previous['URL'].nunique()
+        self.report['resumed'] = 0 if resumed is None else resumed['URL'].nunique()
+        print("%s : %d proposals to crawl, %d unchanged, %d recovered from the checkpoint" % (
+            self.agency, len(urls), self.report['unchanged'], self.report['resumed']))
+
+        self.file = open(self.checkpoint_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow(OUTPUT_COLUMNS)
+        for rows in kept:
+            rows.to_csv(self.file, header=False, index=False)
+        self.file.flush()
+
+        self.tasks.extend((url, self.keys[url], 0) for url in urls)
+        self.progress = tqdm(total=len(urls), desc=self.agency, position=self.position)
+
+    def write(self, url, fields=None, stage=None, error=None):
+        """ Function to write the rows of a crawled proposal to the checkpoint file.
+        Without fields (the page could not be fetched or parsed), the rows are written with empty
+        department / description and the error is added to the report.
+
+        :param url: URL of the proposal
+        :type url: `str`
+        :param fields: Dictionary of {column of PAGE_COLUMNS : value}
+        :type fields: `Dict`
+        :param stage: 'fetch' or 'parse', step which failed
+        :type stage: `str`
+        :param error: Error of the failed step
+        :type error: `Exception`
+
+        :return: None
+        """
+        if error is None:
+            self.report['crawled'] += 1
+        else:
+            self.report['failed'] += 1
+            self.report['pages'].append({'url': url, 'stage': stage, 'error': repr(error)})
+
+        fields = fields or {}
+        values = [fields.get(column, np.nan) for column in PAGE_COLUMNS]
+        for number, title in self.opportunities.get(url, [(np.nan, np.nan)]):
+            self.writer.writerow(["" if pd.isna(value) else value
+                                  for value in [number, url, title] + values])
+        self.file.flush()
+        self.in_flight -= 1
+        self.progress.update()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.progress is not None:
+            self.progress.close()
+        self.report['elapsed'] = round(time.perf_counter() - self.start, 2)
+
+    def finish(self):
+        """ Function to replace the output file of the agency by the checkpoint, once every page is done
+
+        :return: None
+        """
+        self.close()
+        os.replace(self.checkpoint_path, self.extracted_path)
+        if self.extractor.cache is not None:
+            self.extractor.cache.prune(self.keys.values())
+        self.report['status'] = 'completed'
+
+    def fail(self, error):
+        """ Function to stop the extraction of the agency. The checkpoint file is kept:
+        the next extraction resumes from it.
+
+        :param error: Traceback of the error
+        :type error: `str`
+
+        :return: None
+        """
+        self.close()
+        self.report['status'] = 'failed'
+        self.report['error'] = error
+
+
+class ExtractionEngine():
+    """ Crawls and parses the proposals of several agencies at once, see the module documentation
+    """
+
+    def __init__(self, n_cores, output_path, cache_folder=None, retries=1, fetch_threads=16,
+                 html_backend='lxml'):
+        """ Constructor
+
+        :param n_cores: No of parsing processes, shared by the agencies
+        :type n_cores: `int`
+        :param output_path: Folder of the agency files and of the extracted proposals
+        :type output_path: `str`
+        :param cache_folder: Folder of the page cache, None to disable it
+        :type cache_folder: `str`
+        :param retries: No of times the pages which could not be fetched are retried
+        :type retries: `int`
+        :param fetch_threads: No of pages fetched at a time, shared by the agencies
+        :type fetch_threads: `int`
+        :param html_backend: Name of the HTML parsing backend ('lxml' or 'soup')
+        :type html_backend: `str`
+
+        :return: None
+        """
+        self.n_cores = n_cores
+        self.output_path = output_path
+        self.cache_folder = cache_folder
+        self.retries = retries
+        self.fetch_threads = fetch_threads
+        self.html_backend = html_backend
+        # Pages fetched but not parsed yet are bounded too
+        self.window = fetch_threads + 2 * n_cores
+
+    def create_run(self, extractor_class, agency_filename, save_filename, position=0):
+        """ Function to create the extraction of an agency
+
+        :param extractor_class: Agency plugin
+        :type extractor_class: class `AgencyExtractor`
+        :param agency_filename: Agency file written by extract_proposals.py
+        :type agency_filename: `str`
+        :param save_filename: File of the extracted proposals
+        :type save_filename: `str`
+        :param position: Line of the progress bar of the agency
+        :type position: `int`
+
+        :return: Extraction of the agency
+        :rtype: class `AgencyRun`
+        """
+        cache = None
+        if self.cache_folder:
+            cache = PageCache(os.path.join(self.cache_folder, os.path.splitext(save_filename)[0]))
+        return AgencyRun(
+            extractor=extractor_class(html_backend=self.html_backend, cache=cache),
+            agency_path=os.path.join(self.output_path, agency_filename),
+            extracted_path=os.path.join(self.output_path, save_filename),
+            position=position)
+
+    def next_task(self, runs):
+        """ Function to pick the next page to fetch. The agencies take turns, and an agency cannot hold
+        more than its share of the fetch threads, so that a slow host does not hold up the other agencies.
+
+        :param runs: Extractions in progress
+        :type runs: `List`
+
+        :return: Tuple of (extraction, URL, cache key, attempt), None if no page can be fetched now
+        :rtype: `Tuple`
+        """
+        waiting = [run for run in runs if run.running and run.tasks]
+        if not waiting:
+            return None
+        share = max(1, self.fetch_threads // len(waiting))
+        run = min(waiting, key=lambda run: run.fetching)
+        if run.fetching >= share:
+            return None
+        run.fetching += 1
+        run.in_flight += 1
+        return (run,) + run.tasks.popleft()
+
+    def run(self, jobs):
+        """ Function to extract the proposals of several agencies concurrently
+
+        :param jobs: List of (agency plugin, agency filename, filename of the extracted proposals)
+        :type jobs: `List`
+
+        :return: Dictionary of {agency name : report}, see `AgencyRun.report`
+        :rtype: `Dict`
+        """
+        runs = []
+        for position, (extractor_class, agency_filename, save_filename) in enumerate(jobs):
+            run = self.create_run(extractor_class, agency_filename, save_filename, position)
+            try:
+                run.prepare()
+            except Exception:
+                run.fail(traceback.format_exc())
+            runs.append(run)
+
+        extractors = {run.agency: run.extractor for run in runs if run.running}
+        with ThreadPoolExecutor(self.fetch_threads) as fetchers, \
+                ProcessPoolExecutor(self.n_cores, initializer=_set_worker_extractors,
+                                    initargs=(extractors,)) as parsers:
+            pending = {}
+            while True:
+                while len(pending) < self.window:
+                    task = self.next_task(runs)
+                    if task is None:
+                        break
+                    run, url, key, attempt = task
+                    future = fetchers.submit(run.extractor.get_page, url, key)
+                    pending[future] = ('fetch', run, url, key, attempt)
+
+                for run in runs:
+                    if run.running and not run.tasks and not run.in_flight:
+                        try:
+                            run.finish()
+                        except Exception:
+                            run.fail(traceback.format_exc())
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, run, url, key, attempt = pending.pop(future)
+                    if stage == 'fetch':
+                        run.fetching -= 1
+                    if not run.running:
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        if stage == 'fetch' and attempt < self.retries and is_retryable(error):
+                            run.in_flight -= 1
+                            run.tasks.append((url, key, attempt + 1))
+                        else:
+                            run.write(url, stage=stage, error=error)
+                        continue
+                    try:
+                        if stage == 'fetch':
+                            future = parsers.submit(_parse_page, run.agency, result)
+                            pending[future] = ('parse', run, url, key, attempt)
+                        else:
+                            run.write(url, result)
+                    except Exception:
+                        run.fail(traceback.format_exc())
+
+        return {run.agency: run.report for run in runs}
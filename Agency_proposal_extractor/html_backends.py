@@ -0,0 +1,205 @@
+""" HTML parsing backends of the agency extractors.
+
+A backend parses a page and exposes the few lookups the extractors need, so that the
+extraction logic is written once and the parser can be chosen in config.yml (HTML_BACKEND):
+
+- 'soup' : BeautifulSoup with the pure python html.parser (the original parser)
+- 'lxml' : libxml2 through lxml, lookups done with XPath (several times faster)
+
+Both backends return the same text for a given page, as long as the markup is well formed:
+html.parser nests unclosed tags (e.g. <p>a<p>b) where libxml2 closes them.
+"""
+from bs4 import BeautifulSoup
+
+
+# Strings of these tags are left out of the text of their parents by BeautifulSoup.get_text
+STRING_CONTAINERS = ('script', 'style', 'template', 'rt', 'rp')
+
+
+class SoupBackend():
+    """ BeautifulSoup + html.parser
+    """
+
+    name = 'soup'
+
+    def parse(self, html):
+        """ Function to parse a page
+
+        :param html: Page
+        :type html: `str`
+
+        :return: Document
+        :rtype: class `bs4.BeautifulSoup`
+        """
+        return BeautifulSoup(html, "html.parser")
+
+    def find(self, node, tag, attrs=None):
+        """ Function to get the first descendant of `node` with the given tag and attribute values
+
+        :param node: Document or element
+        :param tag: Tag name
+        :type tag: `str`
+        :param attrs: Dictionary of {attribute : value}
+        :type attrs: `Dict`
+
+        :return: Element, None if there is none
+        """
+        return node.find(tag, attrs or {})
+
+    def find_all(self, node, tag, attrs=None):
+        """ Function to get the descendants of `node` with the given tag and attribute values, in document order
+
+        :param node: Document or element
+        :param tag: Tag name
+        :type tag: `str`
+        :param attrs: Dictionary of {attribute : value}
+        :type attrs: `Dict`
+
+        :return: List of elements
+        :rtype: `List`
+        """
+        return node.find_all(tag, attrs or {})
+
+    def elements(self, doc):
+        """ Function to get all the elements of the document, in document order
+
+        :param doc: Document
+        :type doc: class `bs4.BeautifulSoup`
+
+        :return: List of elements
+        :rtype: `List`
+        """
+        return doc.find_all()
+
+    def ancestors(self, element):
+        return list(element.parents)
+
+    def next_element(self, element, tag):
+        """ Function to get the first element with the given tag after `element` in document order
+        (its descendants included)
+
+        :param element: Element
+        :param tag: Tag name
+        :type tag: `str`
+
+        :return: Element, None if there is none
+        """
+        return element.find_next(tag)
+
+    def link_href(self, doc, text):
+        """ Function to get the target of the first link whose text is `text`
+
+        :param doc: Document
+        :type doc: class `bs4.BeautifulSoup`
+        :param text: Text of the link
+        :type text: `str`
+
+        :return: URL
+        :rtype: `str`
+        """
+        return doc.find_all("a", href=True, text=text)[0]['href']
+
+    def markup(self, element):
+        """ Function to serialize an element to HTML
+
+        :param element: Element
+
+        :return: HTML of the element
+        :rtype: `str`
+        """
+        return str(element)
+
+    def text(self, element):
+        """ Function to get the text of an element (BeautifulSoup.get_text)
+
+        :param element: Element
+
+        :return: Text
+        :rtype: `str`
+        """
+        return element.getText()
+
+
+class LxmlBackend():
+    """ lxml (libxml2): the page is parsed in C and the lookups are XPath queries
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml import etree, html
+        self.etree = etree
+        self.html = html
+        self.parser = html.HTMLParser(encoding='utf-8')
+
+    def __getstate__(self):
+        # The extractors are pickled to the worker processes, modules are not picklable
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def parse(self, html):
+        # lxml refuses str pages starting with an XML declaration (XHTML), bytes are parsed with a fixed encoding
+        return self.html.document_fromstring(html.encode('utf-8'), parser=self.parser)
+
+    def _path(self, tag, attrs):
+        conditions = "".join("[@%s=$v%d]" % (key, i) for i, key in enumerate(attrs))
+        values = {"v%d" % i: value for i, value in enumerate(attrs.values())}
+        return ".//" + tag + conditions, values
+
+    def find(self, node, tag, attrs=None):
+        path, values = self._path(tag, attrs or {})
+        found = node.xpath("(" + path + ")[1]", **values)
+        return found[0] if found else None
+
+    def find_all(self, node, tag, attrs=None):
+        path, values = self._path(tag, attrs or {})
+        return node.xpath(path, **values)
+
+    def elements(self, doc):
+        # Comments and processing instructions are not elements for BeautifulSoup
+        return list(doc.iter(self.etree.Element))
+
+    def ancestors(self, element):
+        return list(element.iterancestors())
+
+    def next_element(self, element, tag):
+        found = element.xpath("(descendant::%s | following::%s)[1]" % (tag, tag))
+        return found[0] if found else None
+
+    def link_href(self, doc, text):
+        return doc.xpath("//a[@href and string(.)=$text]/@href", text=text)[0]
+
+    def markup(self, element):
+        if element is None:
+            # Same as str(None) for a missing tag
+            return str(element)
+        return self.etree.tostring(element, method='html', encoding='unicode', with_tail=False)
+
+    def text(self, element):
+        if element.tag in STRING_CONTAINERS or next(element.iter(*STRING_CONTAINERS), None) is None:
+            return "".join(element.itertext())
+        return "".join(element.xpath(
+            ".//text()[not(%s)]" % " or ".join("ancestor::" + tag for tag in STRING_CONTAINERS)))
+
+
+HTML_BACKENDS = {
+    'soup': SoupBackend,
+    'lxml': LxmlBackend}
+
+
+def get_backend(name='lxml'):
+    """ Function to get a parsing backend by name. Falls back to 'soup' when lxml is not installed.
+
+    :param name: Name of the backend ('lxml' or 'soup')
+    :type name: `str`
+
+    :return: Backend
+    :rtype: class `LxmlBackend` or class `SoupBackend`
+    """
+    try:
+        return HTML_BACKENDS[name]()
+    except ImportError:
+        print("lxml is not installed, parsing with html.parser")
+        return SoupBackend()
@@ -1,14 +1,18 @@
 import os
 import time
+import yaml
 from datetime import datetime
 
-from flask import Flask, request, abort, jsonify, send_from_directory, flash, redirect, url_for
+from flask import Flask, request, abort, jsonify, send_from_directory, flash, redirect, url_for, g, Response
 from werkzeug.utils import secure_filename
 
 from multiprocessing import Pool, Process
 import threading
 import json
-from model import recommend
+from collections import OrderedDict
+from model import recommend, get_data_version
+from tenants import get_tenants, get_default_tenant
+from metrics import span, start_trace, end_trace, server_timing, profile_call, render_metrics, REQUEST_LATENCY, REQUESTS, CACHE_REQUESTS
 from flask_cors import CORS
 import shutil
 from fast_autocomplete import AutoComplete
@@ -18,17 +22,91 @@ with open('Output/proposals_titles_db.json', 'r') as f:
     db = json.load(f)
 autocomplete = AutoComplete(words=db)
 
-# FILES_DIRECTORY = "/usr/src/app/files/"
-FILES_DIRECTORY = "./files/"
 DB_DIRECTORY = "./Output/"
+PROFILE_DIRECTORY = "./profiles/"
+CONFIG_FILE = './config.yml'
+
+# Universities served: the proposals are shared, each university has its own scholar indexes
+with open(CONFIG_FILE) as f:
+    config = yaml.safe_load(f)
+TENANTS = get_tenants(config)
+DEFAULT_TENANT = get_default_tenant(config)
+
+
+class ResponseCache():
+    """ Thread-safe LRU cache of the encoded recommendation responses
+    """
+
+    def __init__(self, maxsize=1024):
+        """ Constructor
+
+        :param maxsize: Maximum no of responses kept
+        :type maxsize: `int`
+
+        :return: None
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Function to get a cached response, marking it as recently used
+
+        :param key: Key of the request (proposal, agency, top_k, university, data version)
+        :type key: `Tuple`
+
+        :return: Encoded response, None if it is not cached
+        :rtype: `bytes`
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        """ Function to cache a response, evicting the least recently used ones beyond `maxsize`
+
+        :param key: Key of the request (proposal, agency, top_k, university, data version)
+        :type key: `Tuple`
+        :param value: Encoded response
+        :type value: `bytes`
+
+        :return: None
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
 
-if not os.path.exists(FILES_DIRECTORY):
-    os.mkdir(FILES_DIRECTORY)
-        
 api = Flask(__name__)
 CORS(api)
-api.config['FILES_DIRECTORY'] = FILES_DIRECTORY
 api.config['DB_DIRECTORY'] = DB_DIRECTORY
+api.config['PROFILE_DIRECTORY'] = PROFILE_DIRECTORY
+# Per-request profiling (?profile=1) is honoured only when explicitly enabled
+api.config['ENABLE_PROFILING'] = os.environ.get('RDASH_ENABLE_PROFILING', '0') == '1'
+recommendations_cache = ResponseCache(int(os.environ.get('RDASH_RESPONSE_CACHE_SIZE', '1024')))
+
+@api.before_request
+def before_request():
+    g.request_start = time.perf_counter()
+    start_trace()
+
+@api.after_request
+def after_request(response):
+    spans = end_trace()
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint)
+    REQUESTS.inc(endpoint, str(response.status_code))
+    if spans:
+        response.headers['Server-Timing'] = server_timing(spans)
+    return response
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @api.route('/test/', methods=['GET'])
 def test():
@@ -53,33 +131,35 @@ def recommend_scholars(pid,agency,top_k):
             top_k = 20
         else:
             top_k = int(top_k)
+        # University whose scholars are recommended (?univ=TAMU)
+        univ_name = request.args.get('univ', DEFAULT_TENANT)
+        if univ_name not in TENANTS:
+            abort(404)
         
-        searchfile = str(pid) + '_' + str(top_k) + '.json'
-        files_path = api.config['FILES_DIRECTORY']
-        
-        if not os.path.exists(files_path):
-            os.mkdir(files_path)
-            
-        db_path = api.config['DB_DIRECTORY']
-        if searchfile in os.listdir(files_path):
-            searchfilepath = files_path + searchfile
-            f = open(searchfilepath)
-            scholars = json.load(f)
-            return jsonify(scholars)
+        # Responses computed from the files of a previous build of Output/ are not reused
+        key = (str(pid), agency, top_k, univ_name, os.path.getmtime(CONFIG_FILE),
+               get_data_version(config, agency, univ_name))
+        scholars = recommendations_cache.get(key)
+        if scholars is not None:
+            CACHE_REQUESTS.inc('recommendations', 'hit')
         else:
-            config_file = './config.yml'
-            output_file = "/files/" + str(pid) + '_' + str(top_k)
+            CACHE_REQUESTS.inc('recommendations', 'miss')
+            config_file = CONFIG_FILE
+            db_path = api.config['DB_DIRECTORY']
+            output_file = None
             proposal_id = pid
             generator = 'Spacy'
             cpu_count = 40
-            r = recommend(config_file,top_k,proposal_id,generator,cpu_count,agency,db_path,output_file)
-            
-            searchfilepath = files_path + searchfile
-            f = open(searchfilepath)
-            scholars = json.load(f)
-            return jsonify(scholars)
-        
-        return pid+","+agency+","+top_k
+            args = (config_file,top_k,proposal_id,generator,cpu_count,agency,db_path,output_file,univ_name)
+            if api.config['ENABLE_PROFILING'] and request.args.get('profile') == '1':
+                scholars, profile_path = profile_call(api.config['PROFILE_DIRECTORY'], 'recommend_' + str(pid), recommend, *args)
+                print("Profile for", pid, "saved to", profile_path)
+            else:
+                scholars = recommend(*args)
+            recommendations_cache.put(key, scholars)
+
+        # The records are already encoded: no re-parsing / re-encoding
+        return Response(scholars, mimetype='application/json')
     else:
         return "Not Allowed"
 
@@ -1,23 +1,339 @@
-from sklearn.metrics.pairwise import cosine_similarity
-# from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import CountVectorizer
 from string import punctuation
 from collections import Counter
 from rake_nltk import Rake
+import numpy as np
+import threading
+import atexit
+import time
 import yake
 import spacy
+import os
 import re
 import warnings
+from pos_lexicon import PosLexicon, KEYWORD_POS, get_lexicon_params
 warnings.filterwarnings("ignore")
 
 
 # from gensim.summarization import keywords
 
 
-rake_nltk_var = Rake()
 stop_words = "english"
 nlp = spacy.load('en_core_web_sm')
-# model = SentenceTransformer('distilbert-base-nli-mean-tokens')
+sentence_models = {}
+extractors = threading.local()
+non_alphanumeric = re.compile('[^A-Za-z0-9]+')
+remove_digits = str.maketrans('', '', '0123456789')
+
+
+def get_sentence_model(model_name='distilbert-base-nli-mean-tokens', device='cpu'):
+    """
+        Function to load a SentenceTransformer model once per process.
+        The model must already be in the local cache (or `model_name` be a local path): nothing is downloaded.
+
+    :param model_name: Name or local path of the model
+    :type model_name: `str`
+    :param device: Device on which the model runs
+    :type device: `str`
+
+    :return: The model
+    :rtype: class `SentenceTransformer`
+    """
+    key = (model_name, device)
+    if key not in sentence_models:
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')
+        os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+        from sentence_transformers import SentenceTransformer
+        sentence_models[key] = SentenceTransformer(model_name, device=device)
+    return sentence_models[key]
+
+
+class TermEmbeddingCache():
+    """ Normalized embeddings of vocabulary terms, keyed by term, so that each candidate
+    n-gram is encoded once and reused across documents, requests and runs.
+    The cache is saved as a `.npz` file holding the terms and their embedding matrix.
+    """
+
+    def __init__(self, model_name='distilbert-base-nli-mean-tokens', path=None):
+        """ Constructor
+
+        :param model_name: Name of the SentenceTransformer model the embeddings come from
+        :type model_name: `str`
+        :param path: Path of the `.npz` file the cache is loaded from / saved to
+        :type path: `str`
+
+        :return: None
+        """
+        self.model_name = model_name
+        self.path = path
+        self.rows = {}
+        # Rows beyond len(rows) are spare capacity
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.n_saved = 0
+        self.saved_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_name, path):
+        """ Function to load the cache from disk (an empty cache is returned if the file
+        is missing or was computed with another model)
+
+        :param model_name: Name of the SentenceTransformer model
+        :type model_name: `str`
+        :param path: Path of the `.npz` file
+        :type path: `str`
+
+        :return: Cache
+        :rtype: class `TermEmbeddingCache`
+        """
+        cache = cls(model_name, path)
+        if path is not None and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['model']) == model_name:
+                    cache.matrix = data['embeddings']
+                    cache.rows = {term: row for row, term in enumerate(data['terms'].tolist())}
+                    cache.n_saved = len(cache.rows)
+        return cache
+
+    def save(self):
+        """ Function to atomically save the cache if new terms were added since it was loaded
+
+        :return: None
+        """
+        from helpers import atomic_output
+
+        # One writer at a time: the temporary file is only unique per process
+        with self.save_lock:
+            with self.lock:
+                if self.path is None or len(self.rows) == self.n_saved:
+                    return
+                terms = np.array(sorted(self.rows, key=self.rows.get))
+                matrix = self.matrix[:len(terms)]
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with atomic_output(self.path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, model=np.array(self.model_name), terms=terms, embeddings=matrix)
+            with self.lock:
+                self.n_saved = len(terms)
+                self.saved_at = time.monotonic()
+
+    def save_if_due(self, interval):
+        """ Function to save the cache in a background thread if new terms were added and the last
+        save is older than `interval` seconds, so that requests never wait for the file to be written
+
+        :param interval: Minimum no of seconds between two saves
+        :type interval: `float`
+
+        :return: None
+        """
+        with self.lock:
+            if self.path is None or len(self.rows) == self.n_saved or \
+                    time.monotonic() - self.saved_at < interval:
+                return
+            # Not due again until this save is done
+            self.saved_at = time.monotonic()
+        threading.Thread(target=self.save, daemon=True).start()
+
+    def add(self, terms, embeddings):
+        """ Function to append the embeddings of new terms, growing the matrix by doubling its capacity
+
+        :param terms: Terms
+        :type terms: `List`
+        :param embeddings: Normalized embeddings (one row per term)
+        :type embeddings: `numpy.ndarray`
+
+        :return: None
+        """
+        new = [i for i, term in enumerate(terms) if term not in self.rows]
+        if not new:
+            return
+        n_rows = len(self.rows)
+        if self.matrix.shape[0] < n_rows + len(new):
+            capacity = max(n_rows + len(new), 2 * self.matrix.shape[0], 1024)
+            matrix = np.zeros((capacity, embeddings.shape[1]), dtype=np.float32)
+            if n_rows:
+                matrix[:n_rows] = self.matrix[:n_rows]
+            self.matrix = matrix
+        self.matrix[n_rows:n_rows + len(new)] = embeddings[new]
+        for row, i in enumerate(new, n_rows):
+            self.rows[terms[i]] = row
+
+    def get(self, terms, model, batch_size=64):
+        """ Function to get the embeddings of terms, encoding only the ones not cached yet.
+        The terms are encoded without holding the lock, so that concurrent requests are not serialized.
+
+        :param terms: Terms
+        :type terms: `List`
+        :param model: Model used to encode the missing terms
+        :type model: class `SentenceTransformer`
+        :param batch_size: No of terms encoded per batch
+        :type batch_size: `int`
+
+        :return: Normalized embeddings (one row per term)
+        :rtype: `numpy.ndarray`
+        """
+        with self.lock:
+            missing = [term for term in dict.fromkeys(terms) if term not in self.rows]
+        if missing:
+            embeddings = np.asarray(model.encode(
+                missing, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+            with self.lock:
+                # Terms encoded meanwhile by another request are kept as they are
+                self.add(missing, embeddings)
+        with self.lock:
+            return self.matrix[[self.rows[term] for term in terms]]
+
+
+term_caches = {}
+bert_settings = {
+    'MODEL': 'distilbert-base-nli-mean-tokens',
+    'DEVICE': 'cpu',
+    'BATCH_SIZE': 64,
+    'USE_MMR': False,
+    'DIVERSITY': 0.5,
+    'TERM_CACHE_PATH': None,
+    'TERM_CACHE_SAVE_INTERVAL': 600}
+
+
+def configure_bert(params, output_path):
+    """
+        Function to set the BERT keyword settings of the process from the BERT section of the configuration file
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param output_path: Directory of the term embedding cache
+    :type output_path: `str`
+
+    :return: None
+    """
+    bert = params.get('BERT', {})
+    for key in ('MODEL', 'DEVICE', 'BATCH_SIZE', 'USE_MMR', 'DIVERSITY', 'TERM_CACHE_SAVE_INTERVAL'):
+        if key in bert:
+            bert_settings[key] = bert[key]
+    filename = bert.get('TERM_CACHE_FILENAME')
+    bert_settings['TERM_CACHE_PATH'] = os.path.join(
+        output_path, filename) if filename else None
+
+
+def get_term_cache():
+    """
+        Function to get the term embedding cache of the configured model, loaded once per process
+
+    :return: The cache
+    :rtype: class `TermEmbeddingCache`
+    """
+    key = (bert_settings['MODEL'], bert_settings['TERM_CACHE_PATH'])
+    if key not in term_caches:
+        term_caches[key] = TermEmbeddingCache.load(*key)
+    return term_caches[key]
+
+
+@atexit.register
+def save_term_caches():
+    """ Function to save the terms added since the last save of every term embedding cache
+
+    :return: None
+    """
+    for cache in list(term_caches.values()):
+        cache.save()
+
+
+def mmr(doc_embedding, candidate_embeddings, top_n, diversity):
+    """
+        Maximal Marginal Relevance: greedily pick the candidate most similar to the document
+        and least similar to the candidates already picked
+
+    :param doc_embedding: Normalized document embedding
+    :type doc_embedding: `numpy.ndarray`
+    :param candidate_embeddings: Normalized candidate embeddings
+    :type candidate_embeddings: `numpy.ndarray`
+    :param top_n: No of candidates to pick
+    :type top_n: `int`
+    :param diversity: Weight of the redundancy penalty, between 0 and 1
+    :type diversity: `float`
+
+    :return: Indices of the picked candidates, in order of selection
+    :rtype: `List`
+    """
+    doc_sim = candidate_embeddings @ doc_embedding
+    cand_sim = candidate_embeddings @ candidate_embeddings.T
+    selected = [int(doc_sim.argmax())]
+    remaining = np.ones(len(doc_sim), dtype=bool)
+    remaining[selected[0]] = False
+    max_redundancy = cand_sim[:, selected[0]].copy()
+
+    for _ in range(min(top_n, len(doc_sim)) - 1):
+        scores = (1 - diversity) * doc_sim - diversity * max_redundancy
+        scores[~remaining] = -np.inf
+        best = int(scores.argmax())
+        selected.append(best)
+        remaining[best] = False
+        np.maximum(max_redundancy, cand_sim[:, best], out=max_redundancy)
+    return selected
+
+
+def bert_batch_keywords(texts, n_gram=1, top_n=5, use_mmr=None, diversity=None):
+    """
+        KeyBERT-style keyword extraction for many texts: the candidate n-grams of all the texts
+        are collected with one CountVectorizer, their embeddings come from the term cache
+        (only unseen terms are encoded) and the documents are encoded in batches.
+        Candidates are ranked by cosine similarity to their document, optionally diversified with MMR.
+
+    :param texts: Texts from which keywords are to be extracted
+    :type texts: `List`
+    :param n_gram: No of continuous sequence of words of the candidates
+    :type n_gram: `int`
+    :param top_n: The number of top keywords returned per text
+    :type top_n: `int`
+    :param use_mmr: If True, diversify the keywords with MMR (default from the BERT settings)
+    :type use_mmr: `bool`
+    :param diversity: Diversity of the MMR selection (default from the BERT settings)
+    :type diversity: `float`
+
+    :return: List of keyword lists (most relevant first), in the same order as texts
+    :rtype: `List`
+    """
+    use_mmr = bert_settings['USE_MMR'] if use_mmr is None else use_mmr
+    diversity = bert_settings['DIVERSITY'] if diversity is None else diversity
+
+    try:
+        count = CountVectorizer(
+            ngram_range=(n_gram, n_gram),
+            stop_words=stop_words).fit(texts)
+    except ValueError:
+        # Empty vocabulary: only stopwords / empty texts
+        return [[] for _ in texts]
+    candidates = count.get_feature_names_out()
+    doc_terms = count.transform(texts).tocsr()
+
+    model = get_sentence_model(bert_settings['MODEL'], bert_settings['DEVICE'])
+    cache = get_term_cache()
+    used = np.unique(doc_terms.indices)
+    term_embeddings = np.zeros((len(candidates), 0), dtype=np.float32)
+    if len(used):
+        embeddings = cache.get(candidates[used].tolist(), model, bert_settings['BATCH_SIZE'])
+        term_embeddings = np.zeros((len(candidates), embeddings.shape[1]), dtype=np.float32)
+        term_embeddings[used] = embeddings
+    doc_embeddings = np.asarray(model.encode(
+        list(texts), batch_size=bert_settings['BATCH_SIZE'], normalize_embeddings=True), dtype=np.float32)
+
+    result = []
+    for i in range(len(texts)):
+        cols = doc_terms.indices[doc_terms.indptr[i]:doc_terms.indptr[i + 1]]
+        if len(cols) == 0:
+            result.append([])
+            continue
+        if use_mmr:
+            order = mmr(doc_embeddings[i], term_embeddings[cols], top_n, diversity)
+        else:
+            sims = term_embeddings[cols] @ doc_embeddings[i]
+            k = min(top_n, len(cols))
+            top = np.argpartition(-sims, k - 1)[:k]
+            order = top[np.argsort(-sims[top])]
+        result.append([candidates[cols[j]] for j in order])
+    return result
 
 
 def countVectorizer(n_gram, text):
@@ -35,14 +351,166 @@ def countVectorizer(n_gram, text):
     count = CountVectorizer(
         ngram_range=n_gram,
         stop_words=stop_words).fit(text)
-    candidates = count.get_feature_names()
+    candidates = list(count.get_feature_names_out())
 
     return candidates
 
 
+def spacy_keywords(doc):
+    """
+        Function to keep the non-stopword, non-punctuation tokens tagged as proper noun, adjective or noun
+
+    :param doc: Document processed by the spaCy pipeline
+    :type doc: class `spacy.tokens.Doc`
+
+    :return: List of extracted keywords
+    :rtype: `List`
+    """
+    result = []
+    pos_tag = KEYWORD_POS
+    for token in doc:
+
+        if (token.text in nlp.Defaults.stop_words or token.text in punctuation):
+            continue
+
+        if (token.pos_ in pos_tag):
+            result.append(token.text)
+
+    return result
+
+
+def spacy_batch_keywords(texts, batch_size=256, n_process=1):
+    """
+        Function to extract Spacy keywords from many texts in one `nlp.pipe` stream.
+        The parser and NER are disabled as only the POS tags are used.
+
+    :param texts: Texts from which keywords are to be extracted
+    :type texts: `List`
+    :param batch_size: No of texts buffered per batch
+    :type batch_size: `int`
+    :param n_process: No of processes used by spaCy
+    :type n_process: `int`
+
+    :return: List of keyword lists, in the same order as texts
+    :rtype: `List`
+    """
+    docs = nlp.pipe(
+        (text.lower() for text in texts),
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=["parser", "ner"])
+    return [spacy_keywords(doc) for doc in docs]
+
+
+lexicons = {}
+lexicon_settings = {
+    'PATH': None,
+    'MIN_COUNT': 5,
+    'MIN_AGREEMENT': 0.99,
+    'WINDOW': 4}
+
+
+def configure_lexicon(params, output_path):
+    """
+        Function to set the POS lexicon settings of the process from the SPACY_LEXICON section of the configuration file
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param output_path: Directory of the lexicon file
+    :type output_path: `str`
+
+    :return: None
+    """
+    lexicon = get_lexicon_params(params)
+    for key in ('MIN_COUNT', 'MIN_AGREEMENT', 'WINDOW'):
+        lexicon_settings[key] = lexicon[key]
+    lexicon_settings['PATH'] = os.path.join(output_path, lexicon['FILENAME'])
+
+
+def get_lexicon():
+    """
+        Function to get the POS lexicon, loaded once per process
+
+    :return: The lexicon, None if it was not learned yet (see pos_lexicon.py)
+    :rtype: class `PosLexicon`
+    """
+    path = lexicon_settings['PATH']
+    key = (path, lexicon_settings['MIN_COUNT'], lexicon_settings['MIN_AGREEMENT'])
+    if key not in lexicons:
+        if path is None or not os.path.exists(path):
+            print("No POS lexicon at %s, every word is tagged by spaCy" % path)
+            lexicons[key] = None
+        else:
+            lexicons[key] = PosLexicon.load(
+                path,
+                min_count=lexicon_settings['MIN_COUNT'],
+                min_agreement=lexicon_settings['MIN_AGREEMENT'])
+    return lexicons[key]
+
+
+def lexicon_batch_keywords(texts, lexicon, window=4, batch_size=256, n_process=1):
+    """
+        Function to extract the Spacy keywords of many texts with the POS lexicon: the texts are only
+        tokenized, the words decided by the lexicon are kept or dropped, and the other words are tagged by
+        spaCy on a window of `window` words on each side (overlapping windows are merged).
+
+    :param texts: Texts from which keywords are to be extracted
+    :type texts: `List`
+    :param lexicon: POS lexicon, None to tag every word with spaCy
+    :type lexicon: class `PosLexicon`
+    :param window: No of words on each side of an undecided word given to the tagger
+    :type window: `int`
+    :param batch_size: No of texts buffered per batch
+    :type batch_size: `int`
+    :param n_process: No of processes used by spaCy for the windows
+    :type n_process: `int`
+
+    :return: List of keyword lists, in the same order as texts
+    :rtype: `List`
+    """
+    docs = list(nlp.tokenizer.pipe((text.lower() for text in texts), batch_size=batch_size))
+
+    # True / False when decided, None when the word has to be tagged
+    decisions, spans = [], []
+    for i, doc in enumerate(docs):
+        keep = []
+        start = end = None
+        for j, token in enumerate(doc):
+            if token.text in nlp.Defaults.stop_words or token.text in punctuation:
+                keep.append(False)
+                continue
+            decision = lexicon.decide(token.text) if lexicon is not None else None
+            keep.append(decision)
+            if decision is None:
+                low, high = max(0, j - window), min(len(doc), j + window + 1)
+                if end is not None and low <= end:
+                    end = high
+                else:
+                    if end is not None:
+                        spans.append((i, start, end))
+                    start, end = low, high
+        if end is not None:
+            spans.append((i, start, end))
+        decisions.append(keep)
+
+    windows = nlp.pipe(
+        (docs[i][start:end].as_doc() for i, start, end in spans),
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=["parser", "ner", "lemmatizer"])
+    for (i, start, end), window_doc in zip(spans, windows):
+        keep = decisions[i]
+        for j, token in enumerate(window_doc, start):
+            if keep[j] is None:
+                keep[j] = token.pos_ in KEYWORD_POS
+
+    return [[token.text for token, kept in zip(doc, keep) if kept]
+            for doc, keep in zip(docs, decisions)]
+
+
 class Keyword_generator():
     """ Class containing various algorithms to generate keywords.
-        Algorithms include Yake, Gensim, Rake, Bert, Spacy.
+        Algorithms include Yake, Gensim, Rake, Bert, Spacy (see also SpacyLexiconGenerator).
         """
     def __init__(self, text):
         """ Constructor
@@ -87,16 +555,11 @@ class Keyword_generator():
         :rtype: `List`
         """
         
-        custom_kw_extractor = yake.KeywordExtractor(
-            lan=language,
-            n=max_ngram_size,
-            dedupLim=deduplication_threshold,
-            top=numOfKeywords,
-            features=None)
-
-        keywords = custom_kw_extractor.extract_keywords(self.text)
-
-        return [i[0] for i in keywords]
+        return YakeGenerator(
+            max_ngram_size,
+            numOfKeywords,
+            language=language,
+            deduplication_threshold=deduplication_threshold).extract(self.text)
 
     def Rake(self):
         """ Function containing RAKE algorithm to extract keywords
@@ -107,16 +570,7 @@ class Keyword_generator():
         :rtype: `List`
         """
 
-        rake_nltk_var.extract_keywords_from_text(self.text)
-        keyword_extracted = rake_nltk_var.get_ranked_phrases()
-
-        modified_keys = [re.sub('[^A-Za-z0-9]+', ' ', i)
-                         for i in keyword_extracted]
-        modified_keys = [''.join([i for i in k if not i.isdigit()])
-                         for k in modified_keys]
-        output = [i for i in modified_keys if len(i) > 1]
-
-        return output
+        return RakeGenerator().extract(self.text)
 
     def BERT(self, n_gram=1, top_n=5):
         """ Function containing BERT algorithm to extract keywords
@@ -130,19 +584,7 @@ class Keyword_generator():
         :rtype: `List`
         """
 
-        stop_words = "english"
-
-        count = CountVectorizer(ngram_range=(
-            n_gram, n_gram), stop_words=stop_words).fit([self.text])
-        candidates = count.get_feature_names()
-
-        doc_embedding = model.encode([self.text])
-        candidate_embeddings = model.encode(candidates)
-        distances = cosine_similarity(doc_embedding, candidate_embeddings)
-        keywords = [candidates[index]
-                    for index in distances.argsort()[0][-top_n:]]
-
-        return keywords
+        return bert_batch_keywords([self.text], n_gram=n_gram, top_n=top_n)[0]
 
     def Spacy(self):
         """ Function containing Spacy algorithm to extract keywords
@@ -153,15 +595,182 @@ class Keyword_generator():
         :rtype: `List`
         """
 
-        result = []
-        pos_tag = ['PROPN', 'ADJ', 'NOUN']
-        doc = nlp(self.text.lower())
-        for token in doc:
+        return spacy_keywords(nlp(self.text.lower()))
 
-            if (token.text in nlp.Defaults.stop_words or token.text in punctuation):
-                continue
 
-            if (token.pos_ in pos_tag):
-                result.append(token.text)
+def get_extractor(key, factory):
+    """
+        Function to get an extractor object of the current thread, created once per key.
+        Extractors keep state between calls (eg: Rake), so they are never shared between threads.
+
+    :param key: Key of the extractor (name and parameters)
+    :type key: `Tuple`
+    :param factory: Function creating the extractor
+    :type factory: `function`
 
-        return result
+    :return: The extractor
+    """
+    cache = getattr(extractors, 'cache', None)
+    if cache is None:
+        cache = extractors.cache = {}
+    if key not in cache:
+        cache[key] = factory()
+    return cache[key]
+
+
+class KeywordGenerator():
+    """ Base class of the keyword generators of the registry. A generator is created
+    with its parameters and extracts keywords from one text (`extract`) or many (`batch_extract`).
+    """
+
+    name = None
+
+    def __init__(self, ngram=1, ntop=10, **options):
+        """ Constructor
+
+        :param ngram: No of words used for Ngram
+        :type ngram: `int`
+        :param ntop: The no of top keywords to be extracted
+        :type ntop: `int`
+        :param options: Options specific to the generator
+        :type options: `Dict`
+
+        :return: None
+        """
+        self.ngram = ngram
+        self.ntop = ntop
+        self.options = options
+
+    def extract(self, text):
+        """ Function to extract keywords from a text
+
+        :param text: The text from which keywords are to be extracted
+        :type text: `str`
+
+        :return: List of extracted keywords
+        :rtype: `List`
+        """
+        return self.batch_extract([text])[0]
+
+    def batch_extract(self, texts):
+        """ Function to extract keywords from many texts
+
+        :param texts: Texts from which keywords are to be extracted
+        :type texts: `List`
+
+        :return: List of keyword lists, in the same order as texts
+        :rtype: `List`
+        """
+        return [self.extract(text) for text in texts]
+
+
+class SpacyGenerator(KeywordGenerator):
+    """ Proper nouns, adjectives and nouns tagged by spaCy
+    """
+
+    name = 'Spacy'
+
+    def extract(self, text):
+        return spacy_keywords(nlp(text.lower()))
+
+    def batch_extract(self, texts):
+        return spacy_batch_keywords(
+            texts,
+            batch_size=self.options.get('batch_size', 256),
+            n_process=self.options.get('n_process', 1))
+
+
+class SpacyLexiconGenerator(KeywordGenerator):
+    """ Keywords of `SpacyGenerator`, with the words tagged by the POS lexicon and only the
+    ambiguous / unknown ones by spaCy (see `lexicon_batch_keywords`)
+    """
+
+    name = 'SpacyLexicon'
+
+    def batch_extract(self, texts):
+        return lexicon_batch_keywords(
+            texts,
+            get_lexicon(),
+            window=lexicon_settings['WINDOW'],
+            batch_size=self.options.get('batch_size', 256),
+            n_process=self.options.get('n_process', 1))
+
+
+class YakeGenerator(KeywordGenerator):
+    """ YAKE keywords, the `yake.KeywordExtractor` is reused for the same parameters
+    """
+
+    name = 'Yake'
+
+    def __init__(self, ngram=1, ntop=10, language="en", deduplication_threshold=0.9, **options):
+        super().__init__(ngram, ntop, **options)
+        self.language = language
+        self.deduplication_threshold = deduplication_threshold
+
+    def extract(self, text):
+        extractor = get_extractor(
+            (self.name, self.language, self.ngram, self.deduplication_threshold, self.ntop),
+            lambda: yake.KeywordExtractor(
+                lan=self.language,
+                n=self.ngram,
+                dedupLim=self.deduplication_threshold,
+                top=self.ntop,
+                features=None))
+        return [i[0] for i in extractor.extract_keywords(text)]
+
+
+class RakeGenerator(KeywordGenerator):
+    """ RAKE phrases with the non alphanumeric characters and the digits removed
+    """
+
+    name = 'Rake'
+
+    def extract(self, text):
+        extractor = get_extractor((self.name,), Rake)
+        extractor.extract_keywords_from_text(text)
+        modified_keys = [non_alphanumeric.sub(' ', i).translate(remove_digits)
+                         for i in extractor.get_ranked_phrases()]
+        return [i for i in modified_keys if len(i) > 1]
+
+
+class BertGenerator(KeywordGenerator):
+    """ KeyBERT-style keywords, see `bert_batch_keywords`
+    """
+
+    name = 'BERT'
+
+    def batch_extract(self, texts):
+        return bert_batch_keywords(
+            texts,
+            n_gram=self.ngram,
+            top_n=self.ntop,
+            use_mmr=self.options.get('use_mmr'),
+            diversity=self.options.get('diversity'))
+
+
+KEYWORD_GENERATORS = {
+    'Spacy': SpacyGenerator,
+    'SpacyLexicon': SpacyLexiconGenerator,
+    'Yake': YakeGenerator,
+    'Rake': RakeGenerator,
+    'BERT': BertGenerator}
+
+
+def get_generator(name, ngram=1, ntop=10, **options):
+    """
+        Function to create a keyword generator of the registry
+
+    :param name: Name of the generator (`Spacy`, `SpacyLexicon`, `Yake`, `Rake` or `BERT`)
+    :type name: `str`
+    :param ngram: No of words used for Ngram
+    :type ngram: `int`
+    :param ntop: The no of top keywords to be extracted
+    :type ntop: `int`
+    :param options: Options specific to the generator
+    :type options: `Dict`
+
+    :return: The generator, None if the name is unknown
+    :rtype: class `KeywordGenerator`
+    """
+    generator = KEYWORD_GENERATORS.get(name)
+    return generator(ngram, ntop, **options) if generator is not None else None
@@ -0,0 +1,122 @@
+""" Benchmark of the concurrent agency extraction against two local stand-ins of agency websites.
+Both serve the saved NIH page, one host is slow (and rate limited), the other one is fast.
+Each agency is extracted alone, then one after the other (as main_extractor did) and then
+concurrently with a single `ExtractionEngine.run`; the concurrent run should take about as long
+as the slowest agency alone.
+
+    python benchmarks/bench_agency_extraction.py --n_pages=200 --slow_latency=0.2 --fast_latency=0.02
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import functools
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+from Agency_proposal_extractor.agency_extractor import ExtractionEngine
+from Agency_proposal_extractor.NIH_Extractor import NIHExtractor
+
+
+class SlowAgency(NIHExtractor):
+    agency = 'Slow agency'
+
+
+class FastAgency(NIHExtractor):
+    agency = 'Fast agency'
+
+
+class StandInHandler(SimpleHTTPRequestHandler):
+    """ Serves the fixtures after `latency` seconds """
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.path = self.path.split('?')[0]
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(folder, latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(StandInHandler, directory=folder))
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_agency_file(path, agency, url, n_pages):
+    pd.DataFrame({
+        'AgencyName': agency,
+        'OPPORTUNITY NUMBER': ['%s-%d' % (agency, i) for i in range(n_pages)],
+        'OpportunityTitle': 'Title',
+        'AdditionalInformationURL': ['%snih_foa.html?%d' % (url, i) for i in range(n_pages)]}).to_csv(path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Concurrent agency extraction benchmark")
+    parser.add_argument('--fixtures', type=str, default=os.path.join(os.path.dirname(__file__), 'fixtures'))
+    parser.add_argument('--n_pages', type=int, default=200)
+    parser.add_argument('--slow_latency', type=float, default=0.2)
+    parser.add_argument('--fast_latency', type=float, default=0.02)
+    parser.add_argument('--slow_rate', type=float, default=20, help='Requests per second allowed on the slow host')
+    parser.add_argument('--n_cores', type=int, default=4)
+    parser.add_argument('--fetch_threads', type=int, default=16)
+    args = parser.parse_args()
+
+    slow = start_server(args.fixtures, args.slow_latency)
+    fast = start_server(args.fixtures, args.fast_latency)
+    slow_host = "127.0.0.1:%d" % slow.server_address[1]
+    http_client.configure_http({'HTTP_POLICY': {
+        'RATE': 1000, 'BURST': 100, 'MAX_CONCURRENCY': args.fetch_threads,
+        'HOSTS': {slow_host: {'RATE': args.slow_rate, 'BURST': 1}}}})
+
+    output_path = tempfile.mkdtemp()
+    jobs = {
+        SlowAgency.agency: (SlowAgency, 'slow.csv', 'slow_cleaned.csv'),
+        FastAgency.agency: (FastAgency, 'fast.csv', 'fast_cleaned.csv')}
+    write_agency_file(os.path.join(output_path, 'slow.csv'), SlowAgency.agency,
+                      "http://%s/" % slow_host, args.n_pages)
+    write_agency_file(os.path.join(output_path, 'fast.csv'), FastAgency.agency,
+                      "http://127.0.0.1:%d/" % fast.server_address[1], args.n_pages)
+    engine = ExtractionEngine(args.n_cores, output_path, fetch_threads=args.fetch_threads)
+
+    def extract(names):
+        for name in names:
+            # Everything is crawled again
+            path = os.path.join(output_path, jobs[name][2])
+            if os.path.exists(path):
+                os.remove(path)
+        start = time.perf_counter()
+        report = engine.run([jobs[name] for name in names])
+        return time.perf_counter() - start, report
+
+    timings = {}
+    for name in jobs:
+        timings[name], _ = extract([name])
+    serial = 0.0
+    for name in jobs:
+        serial += extract([name])[0]
+    concurrent, report = extract(list(jobs))
+
+    print()
+    for name, elapsed in timings.items():
+        print("%-12s alone      : %6.2f s" % (name, elapsed))
+    print("one after the other     : %6.2f s" % serial)
+    print("concurrently            : %6.2f s" % concurrent)
+    for name, agency_report in report.items():
+        print("    %s : %s, %d crawled, %d failed" % (
+            name, agency_report['status'], agency_report['crawled'], agency_report['failed']))
+
+    shutil.rmtree(output_path)
+    slow.shutdown()
+    fast.shutdown()
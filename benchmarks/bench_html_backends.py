@@ -0,0 +1,106 @@
+""" Benchmark of the HTML parsing backends of the agency extractors on saved NSF / NIH pages.
+Times parsing + extraction per page for the original code (html.parser, scans of every element)
+and for each backend, and checks that every backend extracts the same fields as the original code.
+
+    python benchmarks/bench_html_backends.py --fixtures=benchmarks/fixtures --n_repeats=5
+
+Pages are picked by name: nsf_*.html are NSF solicitations, nih_*.html are NIH funding opportunities.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Agency_proposal_extractor.html_backends import HTML_BACKENDS
+from Agency_proposal_extractor.NSF_Extractor import NSFExtractor, processing, remove_tags
+from Agency_proposal_extractor.NIH_Extractor import NIHExtractor, clean_text
+
+
+def legacy_nsf(html):
+    """ Title, department, introduction and description, as extracted before the backends """
+    soup = BeautifulSoup(html, "html.parser")
+    title = processing(None, remove_tags(soup.find("title")))
+    dept = processing(None, remove_tags(str(soup.find("table").find("table").find("tr").find_all("td")[-1])))
+    elements = soup.find_all()
+    idxList = []
+    for idx in range(len(elements)):
+        for section_id in ("pgm_intr_txt", "pgm_desc_txt", "awd_info"):
+            if elements[idx].name == 'h3' and elements[idx].find("a", {"id": section_id}) is not None:
+                idxList.append(idx)
+    intr = " ".join([remove_tags(str(i)) for i in elements[idxList[0] + 1:idxList[1]]])
+    desc = " ".join([remove_tags(str(i)) for i in elements[idxList[1] + 1:idxList[2]]])
+    return [title, dept, processing(None, intr), processing(None, desc)]
+
+
+def legacy_nih(html):
+    """ Organization and description, as extracted before the backends """
+    soup = BeautifulSoup(html, "html.parser")
+    dept = soup.findAll('div', {'class': 'col-md-8 datacolumn'})[1].getText()
+    dept = ' '.join(dept.splitlines())
+    if dept == '':
+        divs = soup.findAll('div')
+        div = soup.find('div', {'class': 'col-md-4 datalabel', 'data-element-type': 'LINKED_ELEMENT'})
+        dept = ' '.join(divs[divs.index(div) + 1].getText().splitlines())
+    divs = soup.find_all()
+    idx1 = divs.index(soup.find('a', {'name': '_Section_I._Funding'}))
+    desc = []
+    for i in divs[idx1:]:
+        desc.append(i.getText())
+        if i.find('a', {'href': '#_Section_VIII._Other'}):
+            break
+    return [dept, clean_text(''.join(''.join(desc).splitlines()))]
+
+
+def backend_nsf(extractor, html):
+    extractor.soup = extractor.backend.parse(html)
+    intr, desc = extractor.get_intro_desc()
+    return [extractor.get_title(), extractor.get_dept(), intr, desc]
+
+
+def backend_nih(extractor, html):
+    extractor.soup = extractor.backend.parse(html)
+    return [extractor.get_organisation(), extractor.get_description()]
+
+
+def timed(func, n_repeats):
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        result = func()
+    return result, (time.perf_counter() - start) / n_repeats * 1000
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="HTML parsing backends benchmark")
+    parser.add_argument('--fixtures', type=str, default=os.path.join(os.path.dirname(__file__), 'fixtures'))
+    parser.add_argument('--n_repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    agencies = {
+        'nsf': (legacy_nsf, backend_nsf, NSFExtractor),
+        'nih': (legacy_nih, backend_nih, NIHExtractor)}
+
+    for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+        agency = os.path.basename(path)[:3]
+        if agency not in agencies:
+            continue
+        legacy, extract, extractor_class = agencies[agency]
+        html = open(path, encoding='utf-8').read()
+        print("%s (%d KB)" % (os.path.basename(path), len(html) // 1024))
+
+        expected, elapsed = timed(lambda: legacy(html), args.n_repeats)
+        print("    original    : %8.1f ms / page" % elapsed)
+        for name in HTML_BACKENDS:
+            extractor = extractor_class(html_backend=name)
+            if extractor.backend.name != name:
+                continue
+            fields, elapsed = timed(lambda: extract(extractor, html), args.n_repeats)
+            print("    %-11s : %8.1f ms / page, same output : %s" % (name, elapsed, fields == expected))
+            for field, value in zip(fields, expected):
+                if field != value:
+                    print("        differs : %r ... != %r ..." % (str(field)[:60], str(value)[:60]))
@@ -0,0 +1,151 @@
+""" Benchmark of the HTTP client policy against a local stand-in of the scholars-discovery API.
+The server answers 429 (with Retry-After) above its own rate limit, fails randomly with 503 and
+is slow on some requests. The crawl is run with the plain `requests` calls and with `http_client`,
+from several threads, and the status codes received by the crawler are counted.
+Before the crawl, the circuit breaker is checked with a stub session: a half-open probe failing with
+an error which is not retried must re-open the circuit instead of blocking the host.
+
+    python benchmarks/bench_http_client.py --n_requests=300 --n_threads=16
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Scholars-discovery stand-in: `rate` requests per second, `error_rate` of 503 and `slow_rate` of slow answers """
+
+    lock = threading.Lock()
+    window = []
+    served = Counter()
+
+    def do_GET(self):
+        server = self.server
+        now = time.monotonic()
+        with self.lock:
+            StandInHandler.window = [t for t in self.window if now - t < 1.0]
+            throttled = len(self.window) >= server.rate
+            if not throttled:
+                self.window.append(now)
+        if throttled:
+            self.reply(429, b'{}', {'Retry-After': '1'})
+        elif random.random() < server.error_rate:
+            self.reply(503, b'{}')
+        else:
+            if random.random() < server.slow_rate:
+                time.sleep(0.5)
+            self.reply(200, b'{"name": "scholar"}')
+
+    def reply(self, status, body, headers=None):
+        with self.lock:
+            self.served[status] += 1
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubSession():
+    """ Session raising the given errors in turn, then answering 200 """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = 0
+
+    def request(self, *args, **kwargs):
+        self.sent += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+def check_probe_error(timeout=5.0):
+    """ Threshold 1, a ConnectionError opens the circuit, the half-open probe fails with a
+    ChunkedEncodingError: the next request must be sent once the cooldown is over """
+    http_client.configure_http({'HTTP_POLICY': {'RETRIES': 0, 'BREAKER_THRESHOLD': 1, 'BREAKER_COOLDOWN': 0.2}})
+    session = StubSession([requests.ConnectionError('refused'), requests.exceptions.ChunkedEncodingError('truncated')])
+    get_session, http_client.get_session = http_client.get_session, lambda: session
+    for _ in range(2):
+        try:
+            http_client.get('http://stub.invalid/')
+        except requests.RequestException:
+            pass
+    result = []
+    thread = threading.Thread(target=lambda: result.append(http_client.get('http://stub.invalid/').status_code),
+                              daemon=True)
+    thread.start()
+    thread.join(timeout)
+    http_client.get_session = get_session
+    assert result == [200] and session.sent == 3, \
+        "request still blocked by the circuit breaker after a failed probe (sent %d)" % session.sent
+    print("circuit breaker : failed probe re-opens the circuit, next request sent")
+
+
+def crawl(get, url, n_requests, n_threads):
+    """ Fetch `n_requests` pages from `n_threads` threads and count the status codes received """
+    def fetch(i):
+        try:
+            return get(url + str(i)).status_code
+        except requests.RequestException:
+            return 'error'
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as executor:
+        statuses = Counter(executor.map(fetch, range(n_requests)))
+    return time.perf_counter() - start, statuses
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="HTTP client policy benchmark")
+    parser.add_argument('--n_requests', type=int, default=300)
+    parser.add_argument('--n_threads', type=int, default=16)
+    parser.add_argument('--server_rate', type=int, default=50, help='Requests per second accepted by the server')
+    parser.add_argument('--error_rate', type=float, default=0.05)
+    parser.add_argument('--slow_rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    check_probe_error()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.rate, server.error_rate, server.slow_rate = args.server_rate, args.error_rate, args.slow_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%d/individual/" % server.server_address[1]
+
+    runs = [
+        ('plain requests', lambda u: requests.request("GET", u, headers={}, data={})),
+        ('http_client', http_client.get)]
+    http_client.configure_http({'HTTP_POLICY': {
+        'RATE': args.server_rate * 0.8, 'BURST': 5, 'MAX_CONCURRENCY': args.n_threads,
+        'BACKOFF': 0.2, 'MAX_BACKOFF': 2, 'READ_TIMEOUT': 5}})
+
+    for name, get in runs:
+        time.sleep(1.0)
+        StandInHandler.served.clear()
+        elapsed, statuses = crawl(get, url, args.n_requests, args.n_threads)
+        print("%s : %.1f s, %.0f pages / s" % (name, elapsed, statuses[200] / elapsed))
+        print("    received by the crawler : %s" % dict(statuses))
+        print("    sent by the server : %s" % dict(StandInHandler.served))
+
+    server.shutdown()
@@ -0,0 +1,92 @@
+""" Benchmark of the POS lexicon fast path of the Spacy keyword generator.
+The lexicon is learned on a part of the corpus and the keywords of the held-out texts are extracted
+with the full spaCy pipeline (`Spacy` generator) and with the lexicon (`SpacyLexicon` generator).
+Reports the documents / second of both, the share of words decided by the lexicon, and the agreement
+of the keywords (texts with the same keywords, precision / recall of the lexicon keywords).
+
+    python benchmarks/bench_pos_lexicon.py --config_file=config.yml --n_texts=5000
+    python benchmarks/bench_pos_lexicon.py --texts=Output/PublicationDataset.parquet --column=title
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+from collections import Counter
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import read_table
+from automatic_keyword_generator import nlp, punctuation, spacy_batch_keywords, lexicon_batch_keywords
+from pos_lexicon import PosLexicon, get_lexicon_params, read_corpus
+
+
+def coverage(texts, lexicon):
+    """ Share of the words (stopwords and punctuation excepted) decided by the lexicon """
+    decided = total = 0
+    for doc in nlp.tokenizer.pipe(text.lower() for text in texts):
+        for token in doc:
+            if token.text in nlp.Defaults.stop_words or token.text in punctuation:
+                continue
+            total += 1
+            decided += lexicon.decide(token.text) is not None
+    return decided / max(total, 1)
+
+
+def agreement(expected, found):
+    """ Share of texts with the same keywords, precision and recall of the keywords found """
+    same = sum(e == f for e, f in zip(expected, found))
+    common = n_expected = n_found = 0
+    for e, f in zip(expected, found):
+        common += sum((Counter(e) & Counter(f)).values())
+        n_expected += len(e)
+        n_found += len(f)
+    return same / max(len(expected), 1), common / max(n_found, 1), common / max(n_expected, 1)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="POS lexicon benchmark")
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--texts', type=str, default='', help='CSV / Parquet file of texts (default: corpus of pos_lexicon.py)')
+    parser.add_argument('--column', type=str, default='title')
+    parser.add_argument('--n_texts', type=int, default=5000, help='No of texts used (learning + held-out)')
+    parser.add_argument('--held_out', type=float, default=0.2, help='Share of the texts held out')
+    parser.add_argument('--batch_size', type=int, default=256)
+    args = parser.parse_args()
+
+    params = yaml.safe_load(open(args.config_file))
+    lexicon_params = get_lexicon_params(params)
+    if args.texts:
+        texts = read_table(args.texts, columns=[args.column])[args.column].dropna().astype(str).tolist()
+    else:
+        texts = read_corpus(params, os.path.join(os.path.dirname(os.path.abspath(args.config_file)),
+                                                 params['OUTPUT_PATH']))
+    random.Random(0).shuffle(texts)
+    texts = texts[:args.n_texts]
+    n_held_out = max(1, int(len(texts) * args.held_out))
+    learn, held_out = texts[n_held_out:], texts[:n_held_out]
+    print("%d texts to learn the lexicon, %d held out" % (len(learn), len(held_out)))
+
+    start = time.perf_counter()
+    lexicon = PosLexicon.learn(nlp, learn, batch_size=args.batch_size,
+                               min_count=lexicon_params['MIN_COUNT'],
+                               min_agreement=lexicon_params['MIN_AGREEMENT'])
+    print("lexicon learned in %.1f s : %d words, %d decided" % (
+        time.perf_counter() - start, len(lexicon.counts), len(lexicon.decisions)))
+    print("words of the held-out texts decided by the lexicon : %.1f%%" % (100 * coverage(held_out, lexicon)))
+
+    start = time.perf_counter()
+    expected = spacy_batch_keywords(held_out, batch_size=args.batch_size)
+    spacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = lexicon_batch_keywords(held_out, lexicon, window=lexicon_params['WINDOW'], batch_size=args.batch_size)
+    lexicon_time = time.perf_counter() - start
+
+    same, precision, recall = agreement(expected, found)
+    print("Spacy        : %8.0f documents / s" % (len(held_out) / spacy_time))
+    print("SpacyLexicon : %8.0f documents / s (x%.1f)" % (len(held_out) / lexicon_time, spacy_time / lexicon_time))
+    print("texts with the same keywords : %.1f%%, precision %.4f, recall %.4f" % (100 * same, precision, recall))
@@ -0,0 +1,80 @@
+""" Benchmark of the date parsing / sorting / per-user split done by
+`Analytical_Data_Creator.create_publication_data` on a synthetic publication table.
+
+    python benchmarks/bench_publication_grouping.py --n_publications=500000 --n_users=20000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import get_datetime, get_datetime_series
+from create_analytical_data import group_publications
+
+
+def make_publications(n_publications, n_users, seed=0):
+    """ Build a synthetic PublicationDataset with the columns used by the stage """
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 365 * 30, n_publications)
+    dates = pd.Timestamp('1990-01-01') + pd.to_timedelta(days, unit='D')
+    date_str = pd.Series(dates.strftime('%a %b %d 00:00:00 UTC %Y'))
+    date_str[rng.random(n_publications) < 0.05] = np.nan
+    return pd.DataFrame({
+        'user_id': rng.integers(0, n_users, n_publications).astype(str),
+        'publicationDate': date_str,
+        'title': ['Title of publication %d on topic %d' % (i, i % 97) for i in range(n_publications)],
+        'keywords': ["['machine learning', 'topic %d']" % (i % 97) for i in range(n_publications)]})
+
+
+def legacy_split(pub_df):
+    """ Row-by-row parsing, groupby().apply(sort_values) and per-user .loc split """
+    pub_df['publication_year'] = [get_datetime(pub_df["publicationDate"][i]) for i in range(0, pub_df.shape[0])]
+    pub_df['publication_dt'] = [get_datetime(pub_df["publicationDate"][i], False) for i in range(0, pub_df.shape[0])]
+    # Grouped by the values, not the column label: pandas >= 3 drops a grouping column from the groups
+    article_data = pub_df.groupby(pub_df["user_id"].values).apply(
+        lambda x: x.sort_values('publication_dt', ascending=False))
+    article_data = article_data[["user_id", "publication_dt", "title", "keywords"]]
+    split_data = []
+    for i in pub_df["user_id"].unique():
+        try:
+            split_data.append(article_data.loc[i])
+        except BaseException:
+            continue
+    return split_data
+
+
+def vectorized_split(pub_df):
+    """ One to_datetime pass, one sort and offset based groups """
+    dates = get_datetime_series(pub_df["publicationDate"])
+    pub_df['publication_year'] = dates.dt.year
+    pub_df['publication_dt'] = dates
+    return group_publications(pub_df)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Publication grouping benchmark")
+    parser.add_argument('--n_publications', type=int, default=500000)
+    parser.add_argument('--n_users', type=int, default=20000)
+    parser.add_argument('--skip_legacy', action='store_true', help='Only time the vectorized pipeline')
+    args = parser.parse_args()
+
+    pub_df = make_publications(args.n_publications, args.n_users)
+    print("Publications :", args.n_publications, "Users :", args.n_users)
+
+    start = time.perf_counter()
+    groups = vectorized_split(pub_df.copy())
+    vectorized_time = time.perf_counter() - start
+    print("Vectorized : %.2fs (%d users)" % (vectorized_time, len(groups)))
+
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        split_data = legacy_split(pub_df.copy())
+        legacy_time = time.perf_counter() - start
+        print("Legacy     : %.2fs (%d users)" % (legacy_time, len(split_data)))
+        print("Speedup    : %.1fx" % (legacy_time / vectorized_time))
@@ -0,0 +1,83 @@
+""" Benchmark of multi-process scoring: bytes sent to the workers per recommendation and latency,
+for the legacy tasks (text column slice + proposal keys repeated per row) and the shared memory pool
+(block ids + sparse query weights). Also checks the pool returns the in-process scores.
+
+    python benchmarks/bench_shared_scoring.py --n_scholars=100000 --n_processes=4
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import FEATURE_COLUMNS, PROPOSAL_SECTIONS, ScoringIndex, get_scorer
+from shared_scoring import SharedScoringPool
+
+
+def make_analytical(n_scholars, n_terms=50000, terms_per_field=60, seed=0):
+    """ Build a synthetic AnalyticalDatabase with space separated tokens in every field """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(['term%d' % i for i in range(n_terms)])
+    data = {'user_id': np.arange(n_scholars).astype(str)}
+    for col in FEATURE_COLUMNS:
+        # Zipf-like term frequencies, as in real keyword fields
+        terms = np.minimum(rng.zipf(1.3, (n_scholars, terms_per_field)), n_terms) - 1
+        data[col] = [" ".join(vocabulary[row]) for row in terms]
+    return pd.DataFrame(data), vocabulary
+
+
+def legacy_task_bytes(ad, section_keys, n_processes):
+    """ Bytes pickled by a Pool.starmap over (text, keys) pairs of every field / section """
+    total = 0
+    for col in FEATURE_COLUMNS:
+        for section in PROPOSAL_SECTIONS:
+            keys = section_keys[section]
+            for chunk in np.array_split(np.arange(ad.shape[0]), n_processes):
+                texts = ad[col].values[chunk].tolist()
+                total += len(pickle.dumps(list(zip(texts, [keys] * len(texts)))))
+    return total
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Shared memory scoring benchmark")
+    parser.add_argument('--n_scholars', type=int, default=100000)
+    parser.add_argument('--n_processes', type=int, default=4)
+    parser.add_argument('--n_queries', type=int, default=20)
+    args = parser.parse_args()
+
+    ad, vocabulary = make_analytical(args.n_scholars)
+    rng = np.random.default_rng(1)
+    section_keys = {section: vocabulary[rng.integers(0, 2000, 40)].tolist()
+                    for section in PROPOSAL_SECTIONS}
+
+    index = ScoringIndex.from_dataframe(ad)
+    scorer = get_scorer({})
+    pool = SharedScoringPool(index, scorer, args.n_processes)
+    try:
+        expected, _ = index.score(section_keys, scorer)
+        total, _ = pool.score(section_keys)
+        print("max abs difference with in-process scoring : %.2e" % np.abs(total - expected).max())
+
+        print("legacy task bytes per recommendation : %d" %
+              legacy_task_bytes(ad, section_keys, args.n_processes))
+        print("shared memory task bytes per recommendation : %d" %
+              len(pickle.dumps(pool.tasks(section_keys))))
+
+        start = time.perf_counter()
+        for _ in range(args.n_queries):
+            index.score(section_keys, scorer)
+        print("in-process : %.1f ms / query" % ((time.perf_counter() - start) / args.n_queries * 1000))
+
+        start = time.perf_counter()
+        for _ in range(args.n_queries):
+            pool.score(section_keys)
+        print("shared memory pool (%d processes) : %.1f ms / query" %
+              (args.n_processes, (time.perf_counter() - start) / args.n_queries * 1000))
+    finally:
+        pool.close()
@@ -0,0 +1,82 @@
+""" Benchmark of several universities served by one process.
+Synthetic scholar datasets of `--n_tenants` universities are written to their own folders with one
+shared proposal dataset, and a proposal is recommended for each university in turn through
+`model.recommend`. The memory added by the first request of each university should only be its
+scholar data (scoring index and record store): the spaCy model, the proposals and their keywords
+are loaded once.
+
+    python benchmarks/bench_tenants.py --n_tenants=3 --n_scholars=20000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import yaml
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+from metrics import CACHE_REQUESTS
+from scoring import ScoringIndex
+from bench_shared_scoring import make_analytical
+
+
+def write_tenant(path, univ_name, n_scholars, seed):
+    """ Scholar datasets of one university """
+    os.makedirs(path, exist_ok=True)
+    ad, vocabulary = make_analytical(n_scholars, seed=seed)
+    ad['user_id'] = ['%s%d' % (univ_name, i) for i in range(n_scholars)]
+    ad.to_csv(os.path.join(path, 'AnalyticalDatabase.csv'), index=False)
+    ScoringIndex.from_dataframe(ad).save(os.path.join(path, 'AnalyticalTerms.npz'))
+    pd.DataFrame({'User_id': ad['user_id'], 'Name': ad['user_id'], 'Keywords': ad['Keywords'].str[:100]}).to_csv(
+        os.path.join(path, 'ScholarsDataset.csv'), index=False)
+    return vocabulary
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Multi-university benchmark")
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--n_tenants', type=int, default=3)
+    parser.add_argument('--n_scholars', type=int, default=20000)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    params = yaml.safe_load(open(args.config_file))
+    params['OUTPUT_PATH'] = folder
+    params['AGENCIES_EXTRACTED_FILENAME_DICT'] = {'National Science Foundation': 'nsf_proposals_cleaned.csv'}
+    params['SEMANTIC'] = {'ENABLED': False}
+    params['SCORING'] = dict(params.get('SCORING', {}), N_PROCESSES=1)
+    tenants = ['UNIV%d' % i for i in range(args.n_tenants)]
+    params['UNIV_DETAILS'] = {name: {'STOPWORDS': [], 'OUTPUT_PATH': os.path.join(folder, name)}
+                              for name in tenants}
+    params['DEFAULT_UNIV'] = tenants[0]
+    config_file = os.path.join(folder, 'config.yml')
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(params, f)
+
+    for seed, name in enumerate(tenants):
+        vocabulary = write_tenant(os.path.join(folder, name), name, args.n_scholars, seed)
+    pd.DataFrame({'Opportunity Number': ['BENCH-1'], 'Title': ['Collaborative research'],
+                  'Department': ['Directorate for engineering'],
+                  'Description': [' '.join(vocabulary[:300])]}).to_csv(
+        os.path.join(folder, 'nsf_proposals_cleaned.csv'), index=False)
+
+    tracemalloc.start()
+    for round_ in ('first', 'second'):
+        for name in tenants:
+            before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            json.loads(model.recommend(config_file, 20, 'BENCH-1', 'Spacy', 1, 'NSF', '', None, name))
+            print("%s request, %s : %6.2f s, %+7.1f MB" % (
+                round_, name, time.perf_counter() - start,
+                (tracemalloc.get_traced_memory()[0] - before) / 1e6))
+    for (cache, result), count in sorted(CACHE_REQUESTS.values.items()):
+        print("%-18s %-4s %d" % (cache, result, count))
+    shutil.rmtree(folder)
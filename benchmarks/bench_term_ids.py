@@ -0,0 +1,109 @@
+""" Benchmark of the integer term-id encoding of the AnalyticalDatabase token columns.
+For each roster size, a synthetic AnalyticalDatabase is written to CSV and compared in three forms:
+
+- the token strings, scored by `counter_cosine_similarity` for every (scholar, field, section)
+  as `views_recommend_scholars.py` does (timed on `--legacy_rows` scholars and extrapolated);
+- the index built from the CSV with one vocabulary per field, as `load_scoring_index` did;
+- the index with a shared term dictionary, saved / loaded as sorted (term id, count) arrays.
+
+Memory of the token columns / indexes, load time and scoring time per proposal are reported,
+and the scores of the three are checked to be the same.
+
+    python benchmarks/bench_term_ids.py --n_scholars 10000 100000
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import counter_cosine_similarity
+from scoring import FEATURE_COLUMNS, PROPOSAL_SECTIONS, FieldIndex, ScoringIndex, get_scorer
+from bench_shared_scoring import make_analytical
+
+
+def index_memory(index):
+    """ Bytes of the term count matrices and of the term dictionaries of an index """
+    total = 0
+    vocabularies = {}
+    for field in index.fields.values():
+        total += field.tf.data.nbytes + field.tf.indices.nbytes + field.tf.indptr.nbytes
+        vocabularies[id(field.vocabulary)] = field.vocabulary
+    for vocabulary in vocabularies.values():
+        total += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) for term in vocabulary)
+    return total
+
+
+def per_field_index(ad):
+    """ Index with one vocabulary per field (before the shared term dictionary) """
+    return ScoringIndex(ad["user_id"].values,
+                        {col: FieldIndex.from_texts(ad[col].tolist()) for col in FEATURE_COLUMNS})
+
+
+def legacy_scores(ad, section_keys, n_rows):
+    """ Total counter cosine score of the first n_rows scholars, string by string """
+    total = np.zeros(n_rows)
+    for col in FEATURE_COLUMNS:
+        for section in PROPOSAL_SECTIONS:
+            keys = section_keys[section]
+            for row, (user_id, text) in enumerate(zip(ad["user_id"].values[:n_rows], ad[col].values[:n_rows])):
+                total[row] += counter_cosine_similarity(user_id, text, keys)[user_id]
+    return total
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Integer term-id encoding benchmark")
+    parser.add_argument('--n_scholars', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--legacy_rows', type=int, default=10000, help='No of scholars scored with the token strings')
+    parser.add_argument('--n_queries', type=int, default=20)
+    args = parser.parse_args()
+
+    scorer = get_scorer({})
+    folder = tempfile.mkdtemp()
+    for n_scholars in args.n_scholars:
+        ad, vocabulary = make_analytical(n_scholars)
+        rng = np.random.default_rng(1)
+        section_keys = {section: vocabulary[rng.integers(0, 2000, 40)].tolist()
+                        for section in PROPOSAL_SECTIONS}
+        csv_path = os.path.join(folder, 'AnalyticalDatabase.csv')
+        npz_path = os.path.join(folder, 'AnalyticalTerms.npz')
+        ad.to_csv(csv_path, index=False)
+
+        load_csv, ad = timed(lambda: pd.read_csv(csv_path))
+        build_per_field, old_index = timed(lambda: per_field_index(ad))
+        build_shared, index = timed(lambda: ScoringIndex.from_dataframe(ad))
+        index.save(npz_path)
+        load_npz, loaded = timed(lambda: ScoringIndex.load(npz_path))
+
+        legacy_rows = min(args.legacy_rows, n_scholars)
+        legacy_time, legacy = timed(lambda: legacy_scores(ad, section_keys, legacy_rows))
+        old_time, (old_total, _) = timed(lambda: old_index.score(section_keys, scorer), args.n_queries)
+        new_time, (new_total, _) = timed(lambda: loaded.score(section_keys, scorer), args.n_queries)
+
+        print("\n%d scholars" % n_scholars)
+        print("max abs difference : strings / shared ids %.2e, per-field / shared ids %.2e" % (
+            np.abs(legacy - new_total[:legacy_rows]).max(), np.abs(old_total - new_total).max()))
+        print("token strings      : %7.1f MB in memory, %7.1f MB on disk, loaded in %.2f s" % (
+            ad[FEATURE_COLUMNS].memory_usage(deep=True).sum() / 1e6, os.path.getsize(csv_path) / 1e6, load_csv))
+        print("per-field index    : %7.1f MB in memory, built from the strings in %.2f s" % (
+            index_memory(old_index) / 1e6, build_per_field))
+        print("shared term ids    : %7.1f MB in memory, %7.1f MB on disk, loaded in %.2f s (built in %.2f s)" % (
+            index_memory(loaded) / 1e6, os.path.getsize(npz_path) / 1e6, load_npz, build_shared))
+        print("scoring / proposal : strings %.2f s%s, per-field index %.1f ms, shared term ids %.1f ms" % (
+            legacy_time * n_scholars / legacy_rows, ' (extrapolated)' if legacy_rows < n_scholars else '',
+            old_time * 1000, new_time * 1000))
+    shutil.rmtree(folder)
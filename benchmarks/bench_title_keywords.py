@@ -0,0 +1,78 @@
+""" Benchmark of the publication-title keywords of `create_analytical_data`.
+The titles of the top N publications of every scholar are turned into keywords the original way
+(one `get_keys(..., generator="Spacy")` call per scholar, on `--n_cores` worker processes as
+`parallelize` did) and through the single `nlp.pipe` stream of `get_author_pubinfo`.
+The keywords of every scholar must be the same; the scholars / second of both are reported.
+
+    python benchmarks/bench_title_keywords.py --config_file=config.yml --n_users=5000
+    python benchmarks/bench_title_keywords.py --synthetic --n_publications=100000 --n_users=5000
+"""
+import os
+import sys
+import time
+import argparse
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import get_keys, get_datetime_series, parallelize, read_table
+from create_analytical_data import get_author_pubinfo, group_publications
+from bench_publication_grouping import make_publications
+
+
+def legacy_pubinfo(user, titles, top_n=5):
+    """ Keywords of the titles of one scholar, as `get_author_pubinfo` computed them before the batch path """
+    try:
+        title = " ".join(titles[:top_n])
+        title_keys = " ".join(list(set([i for i in get_keys(
+            text=title, generator="Spacy", ntop=top_n) if len(i) > 3])))
+        return {user: title_keys}
+    except BaseException:
+        return {user: ""}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Publication title keywords benchmark")
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--publications', type=str, default='', help='Publication dataset (default: PUBLICATION_DATASET)')
+    parser.add_argument('--synthetic', action='store_true', help='Use a synthetic publication table')
+    parser.add_argument('--n_publications', type=int, default=100000, help='No of synthetic publications')
+    parser.add_argument('--n_users', type=int, default=5000, help='No of scholars used (0 : all)')
+    parser.add_argument('--n_cores', type=int, default=4, help='No of worker processes of the per-scholar path')
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--n_process', type=int, default=1, help='No of processes used by nlp.pipe')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        pub_df = make_publications(args.n_publications, args.n_users)
+    else:
+        path = args.publications
+        if not path:
+            params = yaml.safe_load(open(args.config_file))
+            path = os.path.join(os.path.dirname(os.path.abspath(args.config_file)),
+                                params['OUTPUT_PATH'], params['PUBLICATION_DATASET'])
+        pub_df = read_table(path, columns=["user_id", "publicationDate", "title", "keywords"])
+    pub_df['publication_dt'] = get_datetime_series(pub_df["publicationDate"])
+    pub_list = group_publications(pub_df)
+    if args.n_users:
+        pub_list = pub_list[:args.n_users]
+    print("%d scholars, %d publications" % (len(pub_list), sum(len(titles) for _, titles, _ in pub_list)))
+
+    start = time.perf_counter()
+    expected = parallelize(n_cores=args.n_cores, func=legacy_pubinfo,
+                           arg1=[(user, titles) for user, titles, _ in pub_list])
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = get_author_pubinfo(pub_list, batch_size=args.batch_size, n_process=args.n_process)
+    batch_time = time.perf_counter() - start
+
+    # Both lists follow the order of pub_list
+    different = [user for (user, _, _), e, f in zip(pub_list, expected, found) if e[user] != f[user]]
+    print("same keywords : %s%s" % (not different, '' if not different else ' (%d scholars differ, eg: %s)' % (
+        len(different), different[0])))
+    print("get_keys per scholar (%d processes) : %8.0f scholars / s" % (args.n_cores, len(pub_list) / legacy_time))
+    print("nlp.pipe stream (%d process)        : %8.0f scholars / s (x%.1f)" % (
+        args.n_process, len(pub_list) / batch_time, legacy_time / batch_time))
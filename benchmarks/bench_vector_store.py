@@ -0,0 +1,76 @@
+""" Benchmark of the compact vector stores: recall@K against exact float32 search
+and memory per scholar, on synthetic clustered embeddings. Every store is also loaded back from
+its files and must return the same neighbours as the freshly built one.
+
+    python benchmarks/bench_vector_store.py --n_scholars=100000 --dim=384
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import ScalarQuantizedStore, ProductQuantizedStore
+
+
+def make_embeddings(n, dim, n_clusters=200, seed=0):
+    """ Normalized vectors drawn around random cluster centres """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    x = centres[rng.integers(0, n_clusters, n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def recall_at_k(store, embeddings, queries, k):
+    """ Mean overlap of the store's top-k with the exact top-k, and mean search time """
+    hits, elapsed = 0, 0.0
+    for query in queries:
+        exact = np.argpartition(-(embeddings @ query), k - 1)[:k]
+        start = time.perf_counter()
+        rows, _ = store.search(query, k)
+        elapsed += time.perf_counter() - start
+        hits += len(np.intersect1d(rows, exact))
+    return hits / (k * len(queries)), elapsed / len(queries)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Vector store benchmark")
+    parser.add_argument('--n_scholars', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--n_queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--shortlist', type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings = make_embeddings(args.n_scholars, args.dim)
+    queries = make_embeddings(args.n_queries, args.dim, seed=1)
+    folder = tempfile.mkdtemp()
+    f16_path = os.path.join(folder, 'embeddings.npy')
+    np.save(f16_path, embeddings.astype(np.float16))
+    f16 = np.load(f16_path, mmap_mode='r')
+
+    print("Scholars : %d, dim : %d, recall@%d over %d queries" % (args.n_scholars, args.dim, args.k, args.n_queries))
+    print("%-12s %14s %12s %12s" % ("store", "bytes/scholar", "recall", "ms/query"))
+    print("%-12s %14d %12s %12s" % ("float32", 4 * args.dim, "1.000", "-"))
+    print("%-12s %14d %12s %12s" % ("float16", 2 * args.dim, "-", "-"))
+
+    stores = [('int8', lambda: ScalarQuantizedStore.build(f16, os.path.join(folder, 'int8'), shortlist=args.shortlist))]
+    for m in (16, 32, 48):
+        stores.append(('pq%d' % m, lambda m=m: ProductQuantizedStore.build(
+            f16, os.path.join(folder, 'pq%d' % m), n_subvectors=m, shortlist=args.shortlist)))
+
+    for name, build in stores:
+        store = build()
+        loaded = type(store).load(f16, os.path.join(folder, name), shortlist=args.shortlist)
+        same = all(np.array_equal(np.sort(store.search(query, args.k)[0]), np.sort(loaded.search(query, args.k)[0]))
+                   for query in queries)
+        recall, seconds = recall_at_k(loaded, embeddings, queries, args.k)
+        print("%-12s %14d %12.3f %12.2f %s" % (name, store.bytes_per_vector, recall, seconds * 1000,
+                                              '' if same else '(reloaded store differs)'))
+        assert same, "%s: reloaded store does not return the neighbours of the built one" % name
+    print("(float16 re-ranking vectors stay on disk, memory-mapped: %d bytes/scholar paged on demand)" % (2 * args.dim))
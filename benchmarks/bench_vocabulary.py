@@ -0,0 +1,94 @@
+""" Benchmark of the interned vocabulary of `helpers.tokenize`.
+The profile texts of the scholars dataset (or of any CSV / Parquet file) are tokenized the original
+way (WordNet lemmatizer called on every token), then through the vocabulary starting empty (cold),
+and again with the vocabulary saved and loaded back (what the next run of create_analytical_data
+gets). The tokens must be the same; the texts / second, the lemmatizer calls and the size of the
+table are reported.
+
+    python benchmarks/bench_vocabulary.py --config_file=config.yml --column=Overview
+    python benchmarks/bench_vocabulary.py --texts=Output/GrantsDataset.csv --column=Description
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import helpers
+from helpers import PreProcessing, tokenize, get_vocabulary, load_vocabulary, read_table, stop_words, lemmatizer
+
+
+def original_tokenize(phrase, k=3):
+    """ `helpers.tokenize` without the vocabulary """
+    preprocess = PreProcessing(phrase)
+    preprocess.text_lowercase()
+    preprocess.remove_characters()
+    tokens = [i for i in preprocess.tokenize() if i not in stop_words]
+    return [lemmatizer.lemmatize(token) for token in tokens if len(token) > k]
+
+
+class CountedLemmatizer():
+    """ Counts the calls to the WordNet lemmatizer """
+
+    def __init__(self, lemmatize):
+        self.lemmatize = lemmatize
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        return self.lemmatize(token)
+
+
+def run(texts, func):
+    start = time.perf_counter()
+    tokens = [func(text) for text in texts]
+    return time.perf_counter() - start, tokens
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Vocabulary benchmark")
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--texts', type=str, default='', help='CSV / Parquet file of texts (default: scholars dataset)')
+    parser.add_argument('--column', type=str, default='Overview')
+    parser.add_argument('--n_texts', type=int, default=0, help='No of texts used (0 : all)')
+    args = parser.parse_args()
+
+    if args.texts:
+        path = args.texts
+    else:
+        params = yaml.safe_load(open(args.config_file))
+        path = os.path.join(os.path.dirname(os.path.abspath(args.config_file)),
+                            params['OUTPUT_PATH'], params['SCHOLARS_DATASET'])
+    texts = read_table(path, columns=[args.column])[args.column].dropna().astype(str).tolist()
+    if args.n_texts:
+        texts = texts[:args.n_texts]
+    print("%d texts" % len(texts))
+
+    original_time, expected = run(texts, original_tokenize)
+
+    helpers.vocabularies.clear()
+    vocabulary = get_vocabulary()
+    vocabulary.lemmatize = counter = CountedLemmatizer(vocabulary.lemmatize)
+    cold_time, cold = run(texts, tokenize)
+    cold_calls = counter.calls
+
+    vocabulary_path = os.path.join(tempfile.mkdtemp(), 'vocabulary.npz')
+    vocabulary.save(vocabulary_path)
+    vocabulary = load_vocabulary(vocabulary_path)
+    vocabulary.lemmatize = counter = CountedLemmatizer(vocabulary.lemmatize)
+    warm_time, warm = run(texts, tokenize)
+
+    n_tokens = sum(len(tokens) for tokens in expected)
+    print("same tokens : %s" % (expected == cold == warm))
+    print("original          : %8.0f texts / s, %d lemmatizer calls" % (len(texts) / original_time, n_tokens))
+    print("vocabulary (cold) : %8.0f texts / s, %d lemmatizer calls (x%.1f)" % (
+        len(texts) / cold_time, cold_calls, original_time / cold_time))
+    print("vocabulary (saved): %8.0f texts / s, %d lemmatizer calls (x%.1f)" % (
+        len(texts) / warm_time, counter.calls, original_time / warm_time))
+    print("%d distinct tokens, %.1f MB saved" % (len(vocabulary), os.path.getsize(vocabulary_path) / 1e6))
+    os.remove(vocabulary_path)
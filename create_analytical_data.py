@@ -14,8 +14,10 @@ import numpy as np
 from tqdm import tqdm
 from multiprocessing import Pool
 
-from helpers import merge_databases, save_pandas_to_csv, parallelize, get_datetime, tokenize, create_tokens, get_keys
+from helpers import merge_databases, save_pandas_to_csv, parallelize, get_datetime_series, tokenize, create_tokens, get_vocabulary, load_vocabulary, get_keys, get_keys_batch, read_table, parse_list
 from automatic_keyword_generator import *
+from scoring import ScoringIndex
+from tenants import get_shared_output_path, get_tenant_output_path
 
 import pdb
 
@@ -64,43 +66,97 @@ def user_o_keywords(user_overview, i):
     return user_keys
 
 
-def get_author_pubinfo(scholar_df, i, top_n=5, top_title=True):
-    """ Function to extract information of top N publications of the author 
+def get_author_pubinfo(pub_list, top_n=5, top_title=True, batch_size=256, n_process=1, generator="Spacy"):
+    """ Function to extract keywords from the titles of the top N publications of every author.
+    The titles of all authors are streamed through a single spaCy pipeline instead of one call per author.
 
-        :param scholar_df: DataFram containing user's all information
-        :type scholar_df: `Pandas.DataFrame`
-        :param i: User ID (dummy_variable)
-        :type i: `str`
+        :param pub_list: List of (User ID, titles, keywords) as returned by `group_publications`
+        :type pub_list: `List`
         :param top_n: Based on relevancy, the number of top Titles will be used
         :type top_n: `int`
         :param top_title: If True, only top N pulications will be extracted. Else all publicatio data will be used.
         :type top_title: `bool`
+        :param batch_size: No of texts buffered per spaCy batch
+        :type batch_size: `int`
+        :param n_process: No of processes used by spaCy
+        :type n_process: `int`
+        :param generator: Keyword generator, `Spacy` or `SpacyLexicon` (POS lexicon fast path)
+        :type generator: `str`
         
-        :return: Tuple of Dictionaries. Each distionary contain User_id as key and keyworks from Publication title / User keywords as values
-        :rtype: `Tuple`
+        :return: List of Dictionaries. Each distionary contain User_id as key and keywords from Publication titles as values
+        :rtype: `List`
     """
 
-    user = scholar_df["user_id"].values[0]
+    users, texts = [], []
+    for user, titles, _ in pub_list:
+        try:
+            texts.append(" ".join(titles[:top_n] if top_title else titles))
+            users.append(user)
+        except BaseException:
+            continue
 
-    try:
-        if top_title:
-            title = " ".join(scholar_df["title"][:top_n])
-        else:
-            title = " ".join(scholar_df["title"])
+    title_keys = {user: "" for user, _, _ in pub_list}
+    for user, keys in zip(users, get_keys_batch(
+            texts, generator=generator, batch_size=batch_size, n_process=n_process)):
+        title_keys[user] = " ".join(list(set([i for i in keys if len(i) > 3])))
 
-        title_keys = " ".join(list(set([i for i in get_keys(
-            text=title, generator="Spacy", ntop=top_n) if len(i) > 3])))
+    return [{user: title_keys[user]} for user, _, _ in pub_list]
 
-        keys = [ast.literal_eval(
-            i) for i in scholar_df["keywords"].values if not pd.isna(i)]
-        merge_keys = [i.split(" ") for k in keys for i in k]
-        word_keys = " ".join(
-            list(set([i for k in merge_keys for i in k if len(i) > 3])))
 
-        return {user: title_keys}, {user: word_keys}
+def get_pubkeywords(pub_df):
+    """ Function to merge the keywords of all publications of every author, without parsing rows one by one:
+    the keyword lists are exploded into words and the distinct words longer than 3 characters joined per user.
 
-    except BaseException:
-        return {user: ""}, {user: ""}
+        :param pub_df: Publication data with 'user_id' and 'keywords' (lists, or lists stored as text in older CSV files) columns
+        :type pub_df: class `Pandas.DataFrame`
+
+        :return: Dictionary with User_id as key and keywords of the publications as values
+        :rtype: `Dict`
+    """
+
+    keywords = pub_df[["user_id", "keywords"]]
+    if keywords["keywords"].map(lambda i: isinstance(i, str)).any():
+        keywords = keywords.assign(keywords=keywords["keywords"].map(parse_list))
+
+    words = keywords.explode("keywords").dropna(subset=["keywords"])
+    words = words.assign(keywords=words["keywords"].astype(str).str.split(" ")).explode("keywords")
+    words = words[words["keywords"].str.len() > 3].drop_duplicates()
+    joined = words.groupby("user_id", sort=False)["keywords"].agg(" ".join)
+    return {user: joined.get(user, "") for user in pub_df["user_id"].unique()}
+
+
+def group_publications(pub_df):
+    """ Function to split the publication table per user without materializing a DataFrame per user.
+    Publications are sorted once by (user, date) - newest first, undated last - and the group
+    boundaries are computed from the offsets where the user changes.
+
+        :param pub_df: Publication data with 'user_id', 'publication_dt', 'title' and 'keywords' columns
+        :type pub_df: `Pandas.DataFrame`
+        
+        :return: List of (User ID, titles, keywords) in order of first appearance of each user
+        :rtype: `List`
+    """
+
+    user_codes, user_ids = pd.factorize(pub_df["user_id"])
+    dates = pub_df["publication_dt"]
+
+    # Newest first within a user, publications without a date go last
+    date_key = -dates.values.astype('int64')
+    date_key[dates.isna().values] = np.iinfo(np.int64).max
+    order = np.lexsort((date_key, user_codes))
+    order = order[user_codes[order] >= 0]
+    if len(order) == 0:
+        return []
+
+    sorted_codes = user_codes[order]
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(order)]))
+
+    titles = pub_df["title"].values[order]
+    keywords = pub_df["keywords"].values[order]
+    return [(user_ids[sorted_codes[start]], titles[start:end], keywords[start:end])
+            for start, end in zip(starts, ends)]
 
 
 def user_org_keywords(user_organisation, i):
@@ -151,19 +207,30 @@ class Analytical_Data_Creator():
 
         # Initialize the parameters
         self.n_cores = params['CPU_COUNT'] if n_cores == 0 else n_cores
-        self.output_path = params['OUTPUT_PATH']
-        self.output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.output_path )
+        # Scholar datasets of the university, token vocabulary / POS lexicon shared by all of them
+        self.output_path = get_tenant_output_path(params, univ_name)
+        self.shared_output_path = get_shared_output_path(params)
         self.analytical_filename = params["ANALYTICAL_DATSET"]
+        self.analytical_terms_filename = params.get("ANALYTICAL_TERMS_FILENAME", "AnalyticalTerms.npz")
+        self.spacy_batch_size = params.get('SPACY_BATCH_SIZE', 256)
+        self.spacy_n_process = params.get('SPACY_N_PROCESS', 1)
+        self.vocabulary_path = os.path.join(
+            self.shared_output_path, params.get('VOCABULARY_FILENAME', 'vocabulary.npz'))
+        load_vocabulary(self.vocabulary_path)
+        self.title_generator = params.get('PUBLICATION_KEYWORD_GENERATOR', 'Spacy')
+        if self.title_generator == 'SpacyLexicon':
+            configure_lexicon(params, self.shared_output_path)
         self.user_df = pd.read_csv(
             os.path.join(
                 self.output_path,
                 params["SCHOLARS_DATASET"]))
-        self.pub_df = pd.read_csv(
+        self.pub_df = read_table(
             os.path.join(
                 self.output_path,
-                params["PUBLICATION_DATASET"]))
+                params["PUBLICATION_DATASET"]),
+            columns=["user_id", "publicationDate", "title", "keywords"])
         global extra_stopwords
-        extra_stopwords = params['UNIV_DETAILS'][args.univ_name]['STOPWORDS']
+        extra_stopwords = params['UNIV_DETAILS'][univ_name]['STOPWORDS']
 
     def create_user_token_data(self):
         """ Function to create tokens from Profile page  (Organization, Overview and Keyword sections) for all users 
@@ -188,6 +255,8 @@ class Analytical_Data_Creator():
             column_name="Organizations",
             df=self.user_df,
             n_cores=self.n_cores)
+        # The lemmas learned are reused by the next run
+        get_vocabulary().save(self.vocabulary_path)
 
         self.sub_df = self.user_df[["User_id", "Netid", "Email"]]
         self.sub_df["Keywords"] = user_tokens
@@ -203,41 +272,20 @@ class Analytical_Data_Creator():
         :return: None
         """
 
-        self.pub_df['publication_year'] = [
-            get_datetime(
-                self.pub_df["publicationDate"][i]) for i in range(
-                0, self.pub_df.shape[0])]
-        self.pub_df['publication_dt'] = [
-            get_datetime(
-                self.pub_df["publicationDate"][i],
-                False) for i in range(
-                0,
-                self.pub_df.shape[0])]
-
-        article_data = self.pub_df.groupby("user_id").apply(
-            lambda x: x.sort_values('publication_dt', ascending=False))
-        article_data = article_data[["user_id",
-                                     "publication_dt", "title", "keywords"]]
-
-        split_data = []
-        for i in self.pub_df["user_id"].unique():
-            try:
-                split_data.append(article_data.loc[i])
-            except BaseException:
-                continue
-
-        pub_list = [(i, j) for i, j in zip(split_data, range(len(split_data)))]
-        pub_tokens = []
-        pub_tokens = parallelize(
-            n_cores=self.n_cores,
-            func=get_author_pubinfo,
-            arg1=pub_list)
-
-        pub_title_list = [i[0] for i in pub_tokens]
-        pub_key_list = [i[1] for i in pub_tokens]
-
-        key_df = pd.DataFrame({"user_id": [list(i.keys())[0] for i in pub_key_list], "pub_keyword": [
-                              list(i.values())[0] for i in pub_key_list]})
+        dates = get_datetime_series(self.pub_df["publicationDate"])
+        self.pub_df['publication_year'] = dates.dt.year
+        self.pub_df['publication_dt'] = dates
+
+        pub_list = group_publications(self.pub_df)
+        pub_title_list = get_author_pubinfo(
+            pub_list,
+            batch_size=self.spacy_batch_size,
+            n_process=self.spacy_n_process,
+            generator=self.title_generator)
+        pub_keywords = get_pubkeywords(self.pub_df)
+
+        key_df = pd.DataFrame({"user_id": [user for user, _, _ in pub_list], "pub_keyword": [
+                              pub_keywords[user] for user, _, _ in pub_list]})
         title_df = pd.DataFrame({"user_id": [list(i.keys())[0] for i in pub_title_list], "pub_title": [
                                 list(i.values())[0] for i in pub_title_list]})
 
@@ -255,6 +303,13 @@ class Analytical_Data_Creator():
                 self.analytical_filename),
             index=True)
 
+        # Shared term dictionary and (term id, count) rows of every field, loaded by the
+        # recommendations instead of splitting the token strings again. Built from the CSV
+        # as written, so that the terms are the ones `load_scoring_index` would read.
+        ScoringIndex.from_dataframe(pd.read_csv(os.path.join(
+            self.output_path, self.analytical_filename))).save(os.path.join(
+                self.output_path, self.analytical_terms_filename))
+
 
 if __name__ == '__main__':
 
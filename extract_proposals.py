@@ -1,7 +1,7 @@
 import os
 import re
+import json
 import zipfile
-import requests
 import datetime
 import argparse
 import sys
@@ -15,7 +15,12 @@ from xml.dom import minidom
 
 import pdb
 
-from helpers import get_formatted_date
+import http_client
+from helpers import atomic_output, download_file, get_formatted_date, save_pandas_to_csv, timed
+
+
+# =HYPERLINK("<URL>","<OPPORTUNITY NUMBER>") cells of the CSV download
+HYPERLINK = r'^[^"]*"(?P<URL>[^"]*)"(?:.*"(?P<number>[^"]*)")?[^"]*$'
 
 
 class GrantsDataExtractor(object):
@@ -26,7 +31,7 @@ class GrantsDataExtractor(object):
         
     """
 
-    def __init__(self, xml_url, csv_url, agencies, params):
+    def __init__(self, xml_url, csv_url, agencies, params, full=False):
         """ Constructor
 
         :param xml_url: The URL from which XML file is to be downloaded
@@ -37,6 +42,8 @@ class GrantsDataExtractor(object):
         :type agencies: `List`
         :param params: Deafult set of parameters read from the CONFIG.yml file
         :type params: `Dict`
+        :param full: If True, every open proposal is marked as changed, even in incremental mode
+        :type full: `bool`
         
         :return: None
         """
@@ -47,17 +54,65 @@ class GrantsDataExtractor(object):
         self.agencies_filenames = params['AGENCIES_FILENAME_DICT']
         self.agencies = params['AGENCIES'] if agencies == [] else agencies
         self.tags = params['TAGS']
+        http_client.configure_http(params)
         self.open_proposal_filename = params["OPEN_PROPOSALS_DATASET"]
         self.grants_filename = params["GRANTS_DATASET"]
         self.grants_download_folder = params["GRANTS_DOWNLOAD_FOLDER"]
         self.grants_download_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.grants_download_folder )
         self.grant_downloaded_csv_filename = params["GRANTS_DOWNLOAD_CSV_FILENAME"]
+        self.csv_chunk_rows = params.get("GRANTS_CSV_CHUNK_ROWS", 20000)
+        self.agencies_extracted_filenames = params['AGENCIES_EXTRACTED_FILENAME_DICT']
+        self.incremental = params.get("GRANTS_INCREMENTAL", True) and not full
+        self.state_path = os.path.join(
+            self.output_path, params.get("GRANTS_STATE_FILENAME", "grants_extract_state.json"))
+        self.zip_url = None
         
         if not os.path.exists(self.output_path):
             os.mkdir(self.output_path)
 
+        # Last processed extract and LastUpdatedDate of each of its open proposals
+        self.state = {'extract': None, 'opportunities': {}}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+
+    def GetExtractURL(self):
+        """ Function to get the URL of the newest GrantsDBExtract zip file from the XML extract page
+
+        :param None: 
+
+        :return: URL of the zip file
+        :rtype: `str`
+        """
+
+        if self.zip_url is None:
+            response = http_client.get(self.xml_url)
+            response_str = response.text
+            soup = BeautifulSoup(response_str, "html.parser")
+
+            self.zip_url = soup.findAll('a', href=True, text=re.compile(
+                "GrantsDBExtract"))[-1]['href']
+        return self.zip_url
+
+    def IsExtractProcessed(self):
+        """ Function to check whether the newest extract was already processed (incremental mode only),
+        in which case there is nothing to download nor to save.
+
+        :param None: 
+
+        :return: True if the extract was processed and its agency files exist
+        :rtype: `bool`
+        """
+
+        filename = self.GetExtractURL().split('/')[-1]
+        agency_files = [os.path.join(self.output_path, self.agencies_filenames[agency])
+                        for agency in self.agencies]
+        return self.incremental and filename == self.state['extract'] and \
+            all(os.path.exists(path) for path in agency_files)
+
     def ExtractCSVData(self):
         """ Function to extract data from the downloaded CSV file 
+        The CSV file is streamed to disk and read by chunks; only the opportunity number and its URL are kept.
         Once the data is extracted it will be saved as a dataframe - self.metadata
         
         :param None: 
@@ -65,41 +120,37 @@ class GrantsDataExtractor(object):
         :return: None
         """
 
-        response = requests.get(self.csv_url)
-
         if not os.path.exists(
             os.path.join(
                 os.getcwd(),
                 self.grants_download_folder)):
             os.mkdir(os.path.join(os.getcwd(), self.grants_download_folder))
 
-        open(
-            os.path.join(
-                os.getcwd(),
-                self.grants_download_folder,
-                self.grant_downloaded_csv_filename),
-            'wb').write(
-            response.content)
-
-        # Read data from CSV
-        self.metadata = pd.read_csv(
+        csv_path = download_file(
+            self.csv_url,
             os.path.join(
                 os.getcwd(),
                 self.grants_download_folder,
-                self.grant_downloaded_csv_filename),
-            error_bad_lines=False,
-            warn_bad_lines=False)
-
-        column_names = self.metadata.columns
-        self.metadata.reset_index(inplace=True)
-        self.metadata = self.metadata.iloc[:, :len(column_names)]
-        self.metadata.columns = column_names
-
-        # Extract hyperlink
-        self.metadata['URL'] = self.metadata['OPPORTUNITY NUMBER'].apply(
-            lambda x: x.split('"')[1]) 
-        self.metadata['OPPORTUNITY NUMBER'] = self.metadata['OPPORTUNITY NUMBER'].apply(
-            lambda x: x.split('"')[-2])
+                self.grant_downloaded_csv_filename))
+
+        # Read only the hyperlink column, by chunks. The rows end with a delimiter :
+        # index_col=False keeps the first field in the first column
+        chunks = pd.read_csv(
+            csv_path,
+            index_col=False,
+            usecols=['OPPORTUNITY NUMBER'],
+            dtype=str,
+            on_bad_lines='skip',
+            chunksize=self.csv_chunk_rows)
+
+        metadata = []
+        for chunk in chunks:
+            # Extract hyperlink
+            links = chunk['OPPORTUNITY NUMBER'].str.extract(HYPERLINK).dropna(subset=['URL'])
+            metadata.append(pd.DataFrame({
+                'OPPORTUNITY NUMBER': links['number'].fillna(links['URL']),
+                'URL': links['URL']}))
+        self.metadata = pd.concat(metadata, ignore_index=True)
 
     def ExtractXMLData(self):
         """ Function to extract data from the XML file.
@@ -110,22 +161,16 @@ class GrantsDataExtractor(object):
         :return: None
         """
 
-        response = requests.request("GET", self.xml_url, headers={}, data={})
-        response_str = response.text
-        soup = BeautifulSoup(response_str, "html.parser")
-
-        zip_url = soup.findAll('a', href=True, text=re.compile(
-            "GrantsDBExtract"))[-1]['href']
+        zip_url = self.GetExtractURL()
         filename = zip_url.split('/')[-1]
+        self.extract_filename = filename
         print("DOWNLOADING ZIP FILE FROM - ", zip_url)
-        response = requests.get(zip_url)
-        open(
+        download_file(
+            zip_url,
             os.path.join(
                 os.getcwd(),
                 self.grants_download_folder,
-                filename),
-            'wb').write(
-            response.content)
+                filename))
 
         with zipfile.ZipFile(os.path.join(os.getcwd(), self.grants_download_folder, filename), 'r') as zip_ref:
             zip_ref.extractall(
@@ -157,8 +202,9 @@ class GrantsDataExtractor(object):
 
     def ProcessXMLData(self):
         """ Function to process extracted the XML data.
-        Reformat columns - CloseDate, PostDate. LastUpdateDate.
-        Identify Open Proposals.
+        Reformat columns - CloseDate, PostDate. LastUpdateDate (blank dates are left empty).
+        Identify Open Proposals of the agencies, and add their URL from the CSV data.
+        Mark the proposals which are new or were updated since the last processed extract (column Changed).
 
         :param None : 
         
@@ -166,27 +212,86 @@ class GrantsDataExtractor(object):
         """
 
         # Reformate Columns
-        self.opps_df['CloseDate'] = get_formatted_date(
-            data=self.opps_df['CloseDate'], format_='%m%d%Y')
-        self.opps_df['PostDate'] = get_formatted_date(
-            data=self.opps_df['PostDate'], format_='%m%d%Y')
-        self.opps_df['LastUpdatedDate'] = get_formatted_date(
-            data=self.opps_df['LastUpdatedDate'], format_='%m%d%Y')
-
-        self.data = pd.merge(self.opps_df,
-                             self.metadata[['OPPORTUNITY NUMBER',
-                                            'URL']],
-                             how='left',
-                             left_on='OpportunityNumber',
-                             right_on='OPPORTUNITY NUMBER')
-
-        # Identify Open proposals
-        self.open_df = self.data[(
-            self.data['CloseDate'] > datetime.date.today())]
+        with timed("Parsing dates"):
+            for column in ['CloseDate', 'PostDate', 'LastUpdatedDate']:
+                self.opps_df[column] = get_formatted_date(
+                    data=self.opps_df[column], format_='%m%d%Y')
+        self.data = self.opps_df
+
+        # Identify Open proposals. Proposals without a close date (eg: accepted anytime)
+        # are open until they are archived, proposals with neither date are not open
+        with timed("Selecting open proposals"):
+            close_date = self.opps_df['CloseDate'].fillna(get_formatted_date(
+                data=self.opps_df['ArchiveDate'], format_='%m%d%Y'))
+            is_open = (close_date > pd.Timestamp(datetime.date.today())) & \
+                self.opps_df['AgencyName'].isin(self.agencies)
+            open_df = self.opps_df[is_open]
+            print("Open proposals : %d (%d without a close date)" %
+                  (len(open_df), self.opps_df.loc[is_open, 'CloseDate'].isna().sum()))
+
+        with timed("Merging with CSV data"):
+            self.open_df = pd.merge(open_df,
+                                    self.metadata[['OPPORTUNITY NUMBER',
+                                                   'URL']],
+                                    how='left',
+                                    left_on='OpportunityNumber',
+                                    right_on='OPPORTUNITY NUMBER')
         self.open_df.reset_index(drop=True, inplace=True)
+        self.open_df['Changed'] = self.GetChanged(self.open_df)
+        print("Changed or new open proposals : %d" % self.open_df['Changed'].sum())
+
+    def GetChanged(self, open_df):
+        """ Function to find the open proposals which are new or whose LastUpdatedDate differs from the one
+        of the last processed extract. Proposals marked as changed in an agency file which was not crawled yet
+        (main_extractor.py output older than the agency file) stay changed.
+
+        :param open_df: Open proposals
+        :type open_df: class `Pandas.DataFrame`
+
+        :return: True for the new or changed proposals
+        :rtype: class `Pandas.Series`
+        """
+
+        if not self.incremental:
+            return pd.Series(True, index=open_df.index)
+
+        ids = open_df['OpportunityID'].astype(str)
+        updated = open_df['LastUpdatedDate'].dt.strftime('%Y-%m-%d').fillna('')
+        previous = ids.map(self.state['opportunities'])
+        changed = previous.isna() | (previous != updated)
+
+        for agency in self.agencies:
+            agency_path = os.path.join(self.output_path, self.agencies_filenames[agency])
+            extracted_path = os.path.join(self.output_path, self.agencies_extracted_filenames[agency])
+            if not os.path.exists(agency_path):
+                continue
+            if os.path.exists(extracted_path) and \
+                    os.path.getmtime(extracted_path) >= os.path.getmtime(agency_path):
+                continue
+            pending = pd.read_csv(agency_path, usecols=lambda c: c in ('OpportunityID', 'Changed'), dtype=str)
+            if 'Changed' in pending:
+                pending = set(pending.loc[pending['Changed'] == 'True', 'OpportunityID'])
+                changed |= ids.isin(pending)
+        return changed
+
+    def SaveState(self):
+        """ Function to save the name of the processed extract and the LastUpdatedDate of its open proposals
+
+        :param None : 
+
+        :return: None
+        """
+
+        ids = self.open_df['OpportunityID'].astype(str)
+        updated = self.open_df['LastUpdatedDate'].dt.strftime('%Y-%m-%d').fillna('')
+        state = {'extract': self.extract_filename, 'opportunities': dict(zip(ids, updated))}
+        with atomic_output(self.state_path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
 
     def SaveXMLData(self):
         """ Function to save all the XML Data to CSV files. Specifically, Open Proposals agency wise will be saved in seprate files.
+        The grants dataset holds every opportunity of the extract, the open proposals those of the agencies.
 
         :param None : 
         
@@ -195,21 +300,26 @@ class GrantsDataExtractor(object):
 
         for agency in self.agencies:
             agency_dataset = self.open_df[self.open_df['AgencyName'] == agency]
-            agency_dataset.to_csv(
-                os.path.join(
+            save_pandas_to_csv(
+                df=agency_dataset,
+                output_path=os.path.join(
                     self.output_path,
-                    self.agencies_filenames[agency]))
+                    self.agencies_filenames[agency]),
+                index=True)
 
-        self.data.to_csv(
-            os.path.join(
+        save_pandas_to_csv(
+            df=self.data,
+            output_path=os.path.join(
                 self.output_path,
                 self.grants_filename),
             index=False)
-        self.open_df.to_csv(
-            os.path.join(
+        save_pandas_to_csv(
+            df=self.open_df,
+            output_path=os.path.join(
                 self.output_path,
                 self.open_proposal_filename),
             index=False)
+        self.SaveState()
 
 if __name__ == "__main__":
 
@@ -242,6 +352,10 @@ if __name__ == "__main__":
             'National Science Foundation',
             'National Institutes of Health'],
         help='List of agencies for which proposals are to be extracted')
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Process the newest extract even if it was already processed and mark every open proposal as changed')
     args = parser.parse_args()
     
     print("\n\nExtracting Proposals from Grants.gov")
@@ -256,10 +370,18 @@ if __name__ == "__main__":
         xml_url=args.xml_url,
         csv_url=args.csv_url,
         agencies=args.agencies,
-        params=params)
-    data_extractor.ExtractCSVData()
-    data_extractor.ExtractXMLData()
-    data_extractor.ProcessXMLData()
-    data_extractor.SaveXMLData()
+        params=params,
+        full=args.full)
+    if data_extractor.IsExtractProcessed():
+        print("Extract already processed :", data_extractor.GetExtractURL())
+    else:
+        with timed("Extracting CSV data"):
+            data_extractor.ExtractCSVData()
+        with timed("Extracting XML data"):
+            data_extractor.ExtractXMLData()
+        with timed("Processing XML data"):
+            data_extractor.ProcessXMLData()
+        with timed("Saving data"):
+            data_extractor.SaveXMLData()
     
     print("TASK COMPLETED : Successfully Extracted Proposals ..")
\ No newline at end of file
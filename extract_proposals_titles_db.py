@@ -3,6 +3,8 @@ import pandas as pd
 import os
 import json
 
+from helpers import atomic_output
+
 db = {}
 
 
@@ -30,8 +32,9 @@ for i in range(n):
 
 json_object = json.dumps(db, indent=4)
 
-with open("Output/proposals_titles_db.json", "w") as outfile:
-    outfile.write(json_object)
+with atomic_output("Output/proposals_titles_db.json") as tmp_path:
+    with open(tmp_path, "w") as outfile:
+        outfile.write(json_object)
 
 # with open('Output/proposals_titles_db.json', 'r') as f:
 #      db = json.load(f)
@@ -2,6 +2,7 @@ import os
 import re
 import ast
 import json
+import math
 import yaml
 import sys
 
@@ -15,7 +16,120 @@ from tqdm import tqdm
 import pdb
 
 from helpers import parallelize
+from helpers import parallelize_iter
 from helpers import get_request
+from helpers import atomic_output
+from helpers import parse_list
+from helpers import read_table
+from http_client import configure_http
+from tenants import get_tenant_output_path
+
+# Columns of the PublicationDataset, projected as soon as a publication is fetched
+PUBLICATION_COLUMNS = ['user_id',
+                       'id',
+                       'class',
+                       'title',
+                       'abstract',
+                       'publicationVenue',
+                       'authors',
+                       'publicationDate',
+                       'publisher',
+                       'identifier',
+                       'doi',
+                       'pageStart',
+                       'pageEnd',
+                       'volume',
+                       'issue',
+                       'altmetricScore',
+                       'citationCount',
+                       'authorList',
+                       'type',
+                       'modTime',
+                       '_links',
+                       'bookTitle',
+                       'keywords']
+# Columns kept as lists of strings in the Parquet dataset
+LIST_COLUMNS = ['keywords']
+
+
+def encode_value(value):
+    """ Function to encode a publication field as a Parquet string: nested fields as JSON, scalars as text
+
+    :param value: Value of the field
+    :type value: `object`
+
+    :return: Encoded value, None if missing
+    :rtype: `str`
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def encode_list(value):
+    """ Function to encode a publication field as a Parquet list of strings
+
+    :param value: Value of the field
+    :type value: `object`
+
+    :return: List of strings, None if the value is not a list
+    :rtype: `List`
+    """
+    if isinstance(value, list):
+        return [str(i) for i in value]
+    return None
+
+
+class CSVChunkWriter():
+    """ Appends chunks of publications to a CSV file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        # Header line, the chunks are appended below it
+        pd.DataFrame(columns=PUBLICATION_COLUMNS).to_csv(self.file, index=False)
+
+    def write(self, df):
+        df.to_csv(self.file, header=False, index=False, escapechar='\\')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetChunkWriter():
+    """ Appends chunks of publications to a Parquet file (one row group per chunk) with a fixed schema:
+    the user id keeps its type, keywords are lists of strings and the other fields strings (nested fields in JSON)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def to_table(self, df):
+        import pyarrow as pa
+        arrays = [pa.array(df["user_id"].tolist())]
+        for col in PUBLICATION_COLUMNS[1:]:
+            if col in LIST_COLUMNS:
+                arrays.append(pa.array([encode_list(i) for i in df[col].tolist()], type=pa.list_(pa.string())))
+            else:
+                arrays.append(pa.array([encode_value(i) for i in df[col].tolist()], type=pa.string()))
+        if self.writer is not None:
+            return pa.Table.from_arrays(arrays, schema=self.writer.schema)
+        return pa.Table.from_arrays(arrays, names=PUBLICATION_COLUMNS)
+
+    def write(self, df):
+        import pyarrow.parquet as pq
+        table = self.to_table(df)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None:
+            self.write(pd.DataFrame({"user_id": pd.Series([], dtype=str)}, columns=PUBLICATION_COLUMNS))
+        self.writer.close()
 
 
 class Extract_Publications():
@@ -37,18 +151,24 @@ class Extract_Publications():
 
         # Set the parameters
         self.n_cores = params['CPU_COUNT'] if n_cores == 0 else n_cores
-        self.output_path = params['OUTPUT_PATH']
-        self.output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.output_path )
+        # Scholar datasets of the university (see tenants.py)
+        self.output_path = get_tenant_output_path(params, univ_name)
         self.publication_file_name = params['PUBLICATION_DATASET']
+        self.publication_ids_path = os.path.join(
+            self.output_path, params['SCHOLAR_PUBLICATION_IDS'])
         self.user_df = pd.read_csv(
             os.path.join(
-                params['OUTPUT_PATH'],
+                self.output_path,
                 params["SCHOLARS_DATASET"]))
         self.univ_details = params['UNIV_DETAILS'][univ_name]
+        self.chunk_rows = params.get('PUBLICATION_CHUNK_ROWS', 5000)
         self.pub_data = []
+        # The request budget of the API is shared by the worker processes
+        configure_http(params, self.n_cores)
 
     def get_publication_ids(self, user_id, str_):
-        """ Returns a dictionary where each user_id is a key and a list of his/her publications as values
+        """ Returns a dictionary where each user_id is a key and a list of his/her publications as values.
+        Only used for scholars datasets created without the publication IDs table.
 
         :param user_id: User_id for each user whose publications are to be extracted
         :type user_id: `str`
@@ -63,7 +183,7 @@ class Extract_Publications():
         user_dict = {}
 
         try:
-            dict_list = ast.literal_eval(str_)
+            dict_list = parse_list(str_)
 
             for d_ in dict_list:
                 publications_ids.append(d_["id"])
@@ -91,8 +211,8 @@ class Extract_Publications():
         pubs_ = []
         payload = {}
         headers = {'accept': 'application/json, text/plain, */*'}
-        pub_df = pd.DataFrame({"user_id": [user_id] * len(pub_ids)})
         url_ = self.univ_details['PROFILE_URL']
+        columns = PUBLICATION_COLUMNS[1:]
 
         if len(pub_ids) > 0:
             for idx in pub_ids:
@@ -101,13 +221,16 @@ class Extract_Publications():
                     url=pub_url, headers=headers, data=payload)
                 try:
                     dict_ = json.loads(response_str)
-                    pubs_.append(dict_)
+                    # Keep only the columns of the dataset
+                    pubs_.append({k: dict_[k] for k in columns if k in dict_})
                 except BaseException:
                     pubs_.append({"id": idx})
-            return pd.concat([pub_df, pd.DataFrame(pubs_)], axis=1)
+            pub_df = pd.DataFrame(pubs_, columns=columns)
+            pub_df.insert(0, "user_id", user_id)
+            return pub_df
 
         else:
-            return pd.DataFrame({"user_id": [user_id]})
+            return pd.DataFrame({"user_id": [user_id]}, columns=PUBLICATION_COLUMNS)
 
     def create_univ_publication_data(self):
         """ Main function which will create the publication data for all the users of a university
@@ -117,69 +240,59 @@ class Extract_Publications():
         :return: None
         """
 
-        # ADD DESCRIPTION
-        user_pub_list = [
-            (i, j) for i, j in zip(
-                self.user_df["User_id"].tolist(), self.user_df["Publications"].tolist())]
-        
-        #TEST_CODE 
-        # user_pub_list = user_pub_list[:100]
-        pub_tokens = parallelize(
-            self.n_cores,
-            func=self.get_publication_ids,
-            arg1=user_pub_list)
-        user_pub_dict = {k: v for d in pub_tokens for k, v in d.items()}
+        if os.path.exists(self.publication_ids_path):
+            # (User_id, publication_id) table written by user_profile_creation.py
+            ids = read_table(self.publication_ids_path)
+            grouped = ids.groupby("User_id", sort=False)["publication_id"].agg(list)
+            user_pub_dict = {i: grouped.get(str(i), [])
+                             for i in self.user_df["User_id"].tolist()}
+        else:
+            # Older scholars dataset: parse the stringified Publications column
+            user_pub_list = [
+                (i, j) for i, j in zip(
+                    self.user_df["User_id"].tolist(), self.user_df["Publications"].tolist())]
+            pub_tokens = parallelize(
+                self.n_cores,
+                func=self.get_publication_ids,
+                arg1=user_pub_list)
+            user_pub_dict = {k: v for d in pub_tokens for k, v in d.items()}
 
-        # ADD DESCRIPTION
-        pub_df = pd.Series(user_pub_dict, name='publication_id').rename_axis(
-            'user_id').explode().reset_index()
         pub_list = [(i, j) for i, j in user_pub_dict.items()]
 
-        # ADD DESCRIPTION
-        self.pub_data = parallelize(
+        # Publications of each user, fetched lazily: the workers start when the data is saved
+        self.pub_data = parallelize_iter(
             self.n_cores,
             func=self.create_user_publication_data,
             arg1=pub_list)
 
     def save_user_publications(self, univ_name='TAMU'):
-        """Function to save the publication details of each user 
+        """Function to save the publication details of each user.
+        The publications are written in chunks of rows as the workers return them, so that
+        only one chunk is held in memory. The file is replaced only once complete.
         
         :param univ_name: University name of the user - which determines the file names for saving.
         :type univ_name: `str1
                 
         """
 
-        pub_final = pd.concat(self.pub_data)
-        pub_final = pub_final[['user_id',
-                               'id',
-                               'class',
-                               'title',
-                               'abstract',
-                               'publicationVenue',
-                               'authors',
-                               'publicationDate',
-                               'publisher',
-                               'identifier',
-                               'doi',
-                               'pageStart',
-                               'pageEnd',
-                               'volume',
-                               'issue',
-                               'altmetricScore',
-                               'citationCount',
-                               'authorList',
-                               'type',
-                               'modTime',
-                               '_links',
-                               'bookTitle',
-                               'keywords']].reset_index(drop=True)
-
-        pub_final.to_csv(
-            os.path.join(
-                self.output_path,
-                self.publication_file_name),
-            index=False,
-            escapechar='\\')
+        output_path = os.path.join(self.output_path, self.publication_file_name)
+        with atomic_output(output_path) as tmp_path:
+            if output_path.endswith('.parquet'):
+                writer = ParquetChunkWriter(tmp_path)
+            else:
+                writer = CSVChunkWriter(tmp_path)
+            try:
+                chunk, n_rows = [], 0
+                for user_pubs in self.pub_data:
+                    chunk.append(user_pubs)
+                    n_rows += user_pubs.shape[0]
+                    if n_rows >= self.chunk_rows:
+                        writer.write(pd.concat(chunk))
+                        chunk, n_rows = [], 0
+                if chunk:
+                    writer.write(pd.concat(chunk))
+            finally:
+                writer.close()
 
 
 if __name__ == "__main__":
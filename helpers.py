@@ -3,7 +3,10 @@ import os
 import re
 import ast
 import json
+import time
 import requests
+import http_client
+from vocabulary import Vocabulary
 
 import pdb
 
@@ -14,6 +17,7 @@ import numpy as np
 import math
 
 from multiprocessing import Pool
+from contextlib import contextmanager
 from tqdm import tqdm
 
 import nltk
@@ -32,6 +36,36 @@ stop_words = set(stopwords.words('english'))
 lemmatizer = WordNetLemmatizer()
 porter = PorterStemmer()
 
+vocabularies = {}
+
+
+def get_vocabulary():
+    """ Function to get the token vocabulary of the process (lemmas and stopword flags
+    memoized per token), created empty on first use unless `load_vocabulary` was called
+
+    :return: Vocabulary
+    :rtype: class `Vocabulary`
+    """
+    if 'vocabulary' not in vocabularies:
+        vocabularies['vocabulary'] = Vocabulary(
+            lemmatizer.lemmatize, stop_words, "nltk-%s-wordnet" % nltk.__version__)
+    return vocabularies['vocabulary']
+
+
+def load_vocabulary(path):
+    """ Function to load the token vocabulary of the process from a file saved by `Vocabulary.save`
+    (the workers started afterwards inherit it)
+
+    :param path: Path of the `.npz` file
+    :type path: `str`
+
+    :return: Vocabulary
+    :rtype: class `Vocabulary`
+    """
+    vocabularies['vocabulary'] = Vocabulary.load(
+        path, lemmatizer.lemmatize, stop_words, "nltk-%s-wordnet" % nltk.__version__)
+    return vocabularies['vocabulary']
+
 
 def get_keys(text, ngram=1, ntop=10, generator="Spacy"):
     """ Function to extract keywords from a text using a chosen generator
@@ -48,27 +82,33 @@ def get_keys(text, ngram=1, ntop=10, generator="Spacy"):
         :return: List of Keywords
         :rtype: `List`
         """
-    # Intialize keyword generator with the text.
-    kw = Keyword_generator(text)
+    if generator == "gensim":
+        return Keyword_generator(text).gensim()
 
-    # Extract keywords depending on the type of generator selected - default
-    # is Spacy
-    if generator == "Spacy":
-        return kw.Spacy()
+    # Extractors are cached per thread and per parameters by the registry - default is Spacy
+    kw = get_generator(generator, ngram, ntop)
+    return kw.extract(text) if kw is not None else None
 
-    elif generator == "BERT":
-        return kw.BERT(ngram, ntop)
 
-    elif generator == "gensim":
-        return kw.Gensim()
+def get_keys_batch(texts, ngram=1, ntop=10, generator="Spacy", **options):
+    """ Function to extract keywords from many texts at once using a chosen generator
 
-    elif generator == "Yake":
-        return kw.Yake(ngram, ntop)
+        :param texts: The texts from which keywords are to be extracted
+        :type texts: `List`
+        :param ngram: No of words used for Ngram
+        :type ngram: `int`
+        :param ntop: The no of top keywords to be extracted
+        :type ntop: `int`
+        :param generator: The algorithm to be used for keyword extraction
+        :type generator: `str`
+        :param options: Options of the generator, eg: batch_size and n_process for Spacy
+        :type options: `Dict`
 
-    elif generator == "Rake":
-        return kw.Rake()
-    else:
-        return None
+        :return: List of keyword lists, in the same order as texts (None if the generator is unknown)
+        :rtype: `List`
+        """
+    kw = get_generator(generator, ngram, ntop, **options)
+    return kw.batch_extract(texts) if kw is not None else None
 
 
 class PreProcessing():
@@ -164,7 +204,9 @@ class PreProcessing():
         :rtype: `str`
         """
 
-        self.new_text = [i for i in self.new_text if i not in stop_words]
+        vocabulary = get_vocabulary()
+        is_stopword = vocabulary.is_stopword
+        self.new_text = [i for i in self.new_text if not is_stopword[vocabulary.add(i)]]
         return self.new_text
 
     def lemmatize(self):
@@ -177,8 +219,9 @@ class PreProcessing():
         :rtype: `str`
         """
 
-        self.new_text = [lemmatizer.lemmatize(
-            token) for token in self.new_text]
+        vocabulary = get_vocabulary()
+        self.new_text = vocabulary.decode(
+            [vocabulary.lemma_id(vocabulary.add(token)) for token in self.new_text])
         return self.new_text
 
     def stemming(text):
@@ -235,10 +278,10 @@ def tokenize(phrase, k=3):
 
     preprocess.text_lowercase()
     preprocess.remove_characters()
-    preprocess.tokenize()
-    preprocess.remove_stopwords()
-    preprocess.remove_letters(k)
-    processed_tokens = preprocess.lemmatize()
+    tokens = preprocess.tokenize()
+    # remove_stopwords, remove_letters(k) and lemmatize in one pass over the vocabulary
+    vocabulary = get_vocabulary()
+    processed_tokens = vocabulary.decode(vocabulary.process(tokens, k))
 
     return processed_tokens
 
@@ -265,6 +308,26 @@ def get_datetime(date_str, year=True):
         return np.nan
 
 
+def get_datetime_series(date_series):
+    """ Vectorized counterpart of `get_datetime` which converts a whole column of dates
+    in the scholars API format (eg: 'Mon Jan 01 00:00:00 CST 2018') in one pass.
+    The time and the timezone name are dropped, only the date is kept.
+
+        :param date_series: Datetime in String
+        :type date_series: `Pandas.Series`
+        
+        :return: Dates (NaT for missing / malformed values)
+        :rtype: `Pandas.Series`
+    """
+
+    parts = date_series.astype("string").str.extract(
+        r'^\w{3} (\w{3} \d{1,2}) \S+ \S+ (\d{4})$')
+    return pd.to_datetime(
+        parts[0] + ' ' + parts[1],
+        format='%b %d %Y',
+        errors='coerce')
+
+
 def parallelize(n_cores, func, arg1):
     """ Function to Parallelize the task on multiple CPU thread
 
@@ -292,6 +355,41 @@ def parallelize(n_cores, func, arg1):
     return data_list
 
 
+_worker_func = {}
+
+
+def _set_worker_func(func):
+    """ Pool initializer of `parallelize_iter`: the function is sent once per worker instead of once per task
+    """
+    _worker_func['func'] = func
+
+
+def _call_worker_func(args):
+    return _worker_func['func'](*args)
+
+
+def parallelize_iter(n_cores, func, arg1, chunksize=1):
+    """ Function to Parallelize the task on multiple CPU thread, yielding the results as soon as
+    the workers finish them (not in the order of arg1) so that they can be consumed in a streaming fashion
+
+        :param n_cores: No of cores of CPU to be used
+        :type n_cores: `int`
+        :param func: The function which needs to be parallelized
+        :type func: Function()
+        :param arg1: List of tuples of arguments of the function
+        :type arg1: `List`
+        :param chunksize: No of tasks sent to a worker at a time
+        :type chunksize: `int`
+
+        :return: Generator of the results of the function applied on each element in arg1
+        :rtype: `Generator`
+    """
+
+    with Pool(processes=n_cores, initializer=_set_worker_func, initargs=(func,)) as spool:
+        for d in tqdm(spool.imap_unordered(_call_worker_func, arg1, chunksize), total=len(arg1)):
+            yield d
+
+
 def get_request(url, headers, data=''):
     """ Retrieves a webpage with the desired header and payload data and returns the text data
     
@@ -306,7 +404,7 @@ def get_request(url, headers, data=''):
         :rtype: `Str`
     """
 
-    response = requests.request("GET", url, headers=headers, data=data)
+    response = http_client.get(url, headers=headers, data=data)
     return response.text
 
 
@@ -339,37 +437,156 @@ def counter_cosine_similarity(user_id, counterA, counterB):
         return {user_id: 0}
 
 
-def save_pandas_to_csv(df, output_path, index):
-    """ Saves the dataset to CSV file  
+@contextmanager
+def timed(step):
+    """ Context manager which prints the time taken by a step of a script
+
+        :param step: Name of the step
+        :type step: `str`
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        print("%s : %.2fs" % (step, time.perf_counter() - start))
+
+
+@contextmanager
+def atomic_output(output_path):
+    """ Context manager which yields a temporary path next to `output_path`.
+    The temporary file replaces `output_path` only when the block completes without error,
+    so readers (eg: the Flask app) never see a half-written file.
+
+        :param output_path: Final path of the file
+        :type output_path: `str`
+
+        :return: Temporary path to write to
+        :rtype: `str`
+    """
+
+    tmp_path = "%s.%d.tmp" % (output_path, os.getpid())
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def download_file(url, output_path, chunk_size=1 << 20):
+    """ Streams a file to disk chunk by chunk, the body is never held in memory. The file is written atomically.
+
+        :param url: URL of the file
+        :type url: `str`
+        :param output_path: Path where the file needs to be saved
+        :type output_path: `str`
+        :param chunk_size: No of bytes read at a time
+        :type chunk_size: `int`
+
+        :return: Path of the file
+        :rtype: `str`
+    """
+
+    response = http_client.get(url, stream=True)
+    try:
+        response.raise_for_status()
+        with atomic_output(output_path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+    finally:
+        response.close()
+    return output_path
+
+
+def save_pandas_to_csv(df, output_path, index, **kwargs):
+    """ Saves the dataset to CSV file. The file is written atomically.
     
         :param output_path: Path where the file needs to be saved
         :type output_path: `str`
         :param index: Whether index should be included while saving
         :type index: `bool`
+        :param kwargs: Additional arguments passed to `DataFrame.to_csv`
         
         :return: None
         
     """
 
-    df.to_csv(output_path, index=index)
+    with atomic_output(output_path) as tmp_path:
+        df.to_csv(tmp_path, index=index, **kwargs)
+
+
+def save_pandas_to_parquet(df, output_path, index=False):
+    """ Saves the dataset to a Parquet file, keeping list columns as native lists. The file is written atomically.
+
+        :param df: Dataset to be saved
+        :type df: class `Pandas.DataFrame`
+        :param output_path: Path where the file needs to be saved
+        :type output_path: `str`
+        :param index: Whether index should be included while saving
+        :type index: `bool`
+
+        :return: None
+    """
+
+    with atomic_output(output_path) as tmp_path:
+        df.to_parquet(tmp_path, index=index)
+
+
+def read_table(path, columns=None):
+    """ Reads a dataset saved as Parquet or CSV (depending on the extension of the file)
+
+        :param path: Path of the file
+        :type path: `str`
+        :param columns: Columns to be read (default: all the columns)
+        :type columns: `List`
+
+        :return: Dataset
+        :rtype: class `Pandas.DataFrame`
+    """
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def parse_list(value):
+    """ Parses a list stored as text in a CSV file (JSON, or python literal in older files).
+    Lists read from Parquet files are returned unchanged.
+
+        :param value: Stored value
+        :type value: `str`
+
+        :return: The list, None if the value is missing or cannot be parsed
+        :rtype: `List`
+    """
+
+    if not isinstance(value, str):
+        return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+    try:
+        return json.loads(value)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
 
 
 def get_formatted_date(data, format_='%m%d%Y'):
-    """ Function to format date in a required format
+    """ Function to parse dates given in a format. Blank or invalid dates are NaT.
     
-        :param data: List of dates as string
-        :type data: `List`
-        :param format_: Format in which date should be returned
+        :param data: Dates as string
+        :type data: class `Pandas.Series`
+        :param format_: Format of the dates
         :type format_: `str`
         
-        :return: Formatted date
-        :rtype: `Datetime`
+        :return: Dates
+        :rtype: class `Pandas.Series`
         
     """
-    return data.apply(
-        lambda x: dt.datetime.strptime(
-            x, format_).date() if bool(
-            x.strip()) else dt.date.today())
+    return pd.to_datetime(data, format=format_, errors='coerce')
 
 
 def merge_databases(dset1, dset2, on, how="inner"):
@@ -414,7 +631,7 @@ def extract_json(base_url, end_url, page):
         'accept': 'application/json, text/plain, */*'
     }
 
-    response = requests.request("GET", url, headers=headers, data=payload)
+    response = http_client.get(url, headers=headers, data=payload)
 
     response_str = response.text
     response_dict = json.loads(response_str)
@@ -422,8 +639,17 @@ def extract_json(base_url, end_url, page):
     return response_dict
 
 
-def create_tokens(df, func, column_name, n_cores):
-    """ Function to create tokens for a given column name 
+def _tokenize_chunk(func, items):
+    """ Task of `create_tokens`: applies the function on a chunk of rows and returns the lemmas
+    the worker computed, to be merged in the vocabulary of the main process
+    """
+    results = [func(*item) for item in items]
+    return results, get_vocabulary().export()
+
+
+def create_tokens(df, func, column_name, n_cores, chunk_size=None):
+    """ Function to create tokens for a given column name. The rows are sent to the workers by chunks
+    and the lemmas they learn are merged in the vocabulary of the process (see `get_vocabulary`)
 
         :param df: DataFrame 
         :type df: `Pandas.DataFrame`
@@ -432,6 +658,8 @@ def create_tokens(df, func, column_name, n_cores):
         :type column_name: `str`
         :param n_cores: No of CPU cores to be used
         :type n_cores: `int`
+        :param chunk_size: No of rows per task (default: 4 tasks per core)
+        :type chunk_size: `int`
         
         :return: List containing the results of the function applied on each element of the column
         :rtype: `List`
@@ -439,6 +667,15 @@ def create_tokens(df, func, column_name, n_cores):
 
     list_ = [(i, j)
              for i, j in zip(df[column_name].tolist(), df[column_name].index)]
-    # func(list_[0][0], list_[0][1])
-    data_list = parallelize(n_cores=n_cores, func=func, arg1=list_)
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(list_) // (4 * n_cores)))
+    chunks = [(func, list_[i:i + chunk_size]) for i in range(0, len(list_), chunk_size)]
+
+    vocabulary = get_vocabulary()
+    # The workers start from the table of this process, only their new lemmas are sent back
+    vocabulary.export()
+    data_list = []
+    for results, entries in parallelize(n_cores=n_cores, func=_tokenize_chunk, arg1=chunks):
+        data_list += results
+        vocabulary.merge(entries)
     return data_list
@@ -0,0 +1,319 @@
+import time
+import random
+import threading
+
+from urllib.parse import urlparse
+
+import requests
+
+
+DEFAULT_POLICY = {
+    'RATE': 10.0,
+    'BURST': 10,
+    'MAX_CONCURRENCY': 8,
+    'MIN_CONCURRENCY': 1,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 30,
+    'RETRIES': 4,
+    'BACKOFF': 1.0,
+    'MAX_BACKOFF': 60,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_COOLDOWN': 60}
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_settings = {'policy': dict(DEFAULT_POLICY), 'hosts': {}, 'n_workers': 1}
+_hosts = {}
+_hosts_lock = threading.Lock()
+_local = threading.local()
+
+
+class TokenBucket():
+    """ Thread-safe token bucket: `rate` requests per second with bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Function to take one token, sleeping until one is available
+
+        :return: None
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter():
+    """ Concurrency limit adapted with AIMD: it grows by one after `limit` successful requests
+    and is halved when the host throttles (429) or fails (5xx, timeouts)
+    """
+
+    def __init__(self, min_limit, max_limit):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(self.min_limit, self.limit / 2)
+
+
+class CircuitBreaker():
+    """ Opens after `threshold` consecutive failures. While open, requests wait for the cooldown;
+    then a single probe request is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """ Function to get how long a request has to wait before being sent (0 if it can be sent now)
+
+        :return: Seconds to wait
+        :rtype: `float`
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return min(1.0, self.cooldown)
+            self.probing = True
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                if self.opened_at is None or self.probing:
+                    print("Circuit opened after %d consecutive failures" % self.failures)
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class HostState():
+    """ Rate limit, concurrency limit and circuit breaker of one host
+    """
+
+    def __init__(self, policy, n_workers):
+        """ Constructor
+
+        :param policy: Policy of the host (see `DEFAULT_POLICY`)
+        :type policy: `Dict`
+        :param n_workers: No of processes sharing the host budget
+        :type n_workers: `int`
+
+        :return: None
+        """
+        self.policy = policy
+        self.max_rate = float(policy['RATE']) / n_workers
+        self.bucket = TokenBucket(self.max_rate, max(1, policy['BURST'] // n_workers))
+        self.limiter = AdaptiveLimiter(
+            policy['MIN_CONCURRENCY'],
+            max(policy['MIN_CONCURRENCY'], policy['MAX_CONCURRENCY'] // n_workers))
+        self.breaker = CircuitBreaker(policy['BREAKER_THRESHOLD'], policy['BREAKER_COOLDOWN'])
+
+    def on_success(self):
+        self.limiter.on_success()
+        self.breaker.record_success()
+        with self.bucket.lock:
+            # Recover the rate slowly after a throttle
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 20)
+
+    def on_failure(self, throttled):
+        self.limiter.on_throttle()
+        self.breaker.record_failure()
+        if throttled:
+            with self.bucket.lock:
+                self.bucket.rate = max(self.max_rate / 20, self.bucket.rate / 2)
+
+
+def configure_http(params, n_workers=1):
+    """ Function to set the HTTP policy of the process from the HTTP_POLICY section of the configuration file.
+    Must be called before the worker processes are forked: the rate and concurrency budgets of each
+    host are divided by `n_workers` so that all the processes together stay within the configured budget.
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param n_workers: No of processes which will send requests
+    :type n_workers: `int`
+
+    :return: None
+    """
+    http = params.get('HTTP_POLICY', {})
+    policy = dict(DEFAULT_POLICY)
+    policy.update({k: v for k, v in http.items() if k != 'HOSTS'})
+    with _hosts_lock:
+        _settings['policy'] = policy
+        _settings['hosts'] = http.get('HOSTS', {})
+        _settings['n_workers'] = max(1, n_workers)
+        _hosts.clear()
+
+
+def get_host(host):
+    """ Function to get the state of a host, created on first use with the policy of the process
+
+    :param host: Host name
+    :type host: `str`
+
+    :return: State of the host
+    :rtype: class `HostState`
+    """
+    with _hosts_lock:
+        if host not in _hosts:
+            policy = dict(_settings['policy'])
+            policy.update(_settings['hosts'].get(host, {}))
+            _hosts[host] = HostState(policy, _settings['n_workers'])
+        return _hosts[host]
+
+
+def get_session():
+    """ Function to get the `requests.Session` of the current thread (connections are kept alive)
+
+    :return: Session
+    :rtype: class `requests.Session`
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def retry_after(response):
+    """ Function to read the Retry-After header (in seconds) of a response
+
+    :param response: Response
+    :type response: class `requests.Response`
+
+    :return: Seconds to wait, None if the header is missing or is a date
+    :rtype: `float`
+    """
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def request(method, url, headers=None, data=None, stream=False):
+    """ Function to send a request with the HTTP policy of its host: token bucket rate limit, adaptive
+    concurrency, connect / read timeouts, retries with exponential backoff (honouring Retry-After)
+    on 429 / 5xx / connection errors, and a circuit breaker.
+
+    :param method: HTTP method
+    :type method: `str`
+    :param url: URL
+    :type url: `str`
+    :param headers: Headers of the request
+    :type headers: `Dict`
+    :param data: Payload of the request
+    :type data: `Dict`
+    :param stream: If True, the body is not downloaded before returning
+    :type stream: `bool`
+
+    :return: Response (the last one if every attempt was throttled or failed with a 5xx)
+    :rtype: class `requests.Response`
+    """
+    state = get_host(urlparse(url).netloc)
+    policy = state.policy
+    timeout = (policy['CONNECT_TIMEOUT'], policy['READ_TIMEOUT'])
+
+    for attempt in range(policy['RETRIES'] + 1):
+        wait = state.breaker.wait_time()
+        while wait > 0:
+            time.sleep(wait)
+            wait = state.breaker.wait_time()
+
+        state.limiter.acquire()
+        try:
+            state.bucket.acquire()
+            response = get_session().request(
+                method, url, headers=headers, data=data, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            state.on_failure(throttled=False)
+            if attempt == policy['RETRIES']:
+                raise
+            delay = None
+            print("Retrying %s after error: %s" % (url, error))
+        except Exception:
+            # Not retried (eg: ChunkedEncodingError, TooManyRedirects), but the outcome is recorded
+            # so that a half-open probe always closes or re-opens the circuit
+            state.on_failure(throttled=False)
+            raise
+        else:
+            if response.status_code not in RETRY_STATUS:
+                state.on_success()
+                return response
+            state.on_failure(throttled=response.status_code == 429)
+            if attempt == policy['RETRIES']:
+                return response
+            delay = retry_after(response)
+            response.close()
+        finally:
+            state.limiter.release()
+
+        if delay is None:
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(policy['MAX_BACKOFF'], policy['BACKOFF'] * 2 ** attempt))
+        time.sleep(min(delay, policy['MAX_BACKOFF']))
+
+
+def get(url, headers=None, data=None, stream=False):
+    """ Function to send a GET request with the HTTP policy of its host, see `request`
+
+    :param url: URL
+    :type url: `str`
+    :param headers: Headers of the request
+    :type headers: `Dict`
+    :param data: Payload of the request
+    :type data: `Dict`
+    :param stream: If True, the body is not downloaded before returning
+    :type stream: `bool`
+
+    :return: Response
+    :rtype: class `requests.Response`
+    """
+    return request("GET", url, headers=headers, data=data, stream=stream)
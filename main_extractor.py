@@ -1,8 +1,11 @@
-from Agency_proposal_extractor.NIH_Extractor import NIHExtractor
-from Agency_proposal_extractor.NSF_Extractor import NSFExtractor
+from Agency_proposal_extractor.agency_extractor import ExtractionEngine, load_agency_extractors
+from http_client import configure_http
+from helpers import atomic_output
 
 
 import argparse
+import json
+import time
 import yaml
 import sys
 import os
@@ -13,7 +16,7 @@ import pandas as pd
 
 class AgencyDataExtractor():
     """ Class which can extract data from required agencey webpages.
-        Currently added agencie - NIH, NSF
+        The agencies are the plugins of Agency_proposal_extractor (currently NIH, NSF)
 
     """
 
@@ -34,39 +37,59 @@ class AgencyDataExtractor():
         self.agencies = params['AGENCIES'] if agencies == [] else agencies
         self.output_path = params['OUTPUT_PATH']
         self.output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.output_path )
-        self.agency_extractors = {
-            'National Institutes of Health': NIHExtractor,
-            'National Science Foundation': NSFExtractor}
+        self.agency_extractors = load_agency_extractors()
         self.extracted_agencies_filenames = params['AGENCIES_EXTRACTED_FILENAME_DICT']
+        self.html_backend = params.get('HTML_BACKEND', 'lxml')
+        extraction = params.get('AGENCY_EXTRACTION', {})
+        cache_folder = extraction.get('PAGE_CACHE')
+        if cache_folder:
+            cache_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_folder)
+        self.engine = ExtractionEngine(
+            n_cores=self.n_cores,
+            output_path=self.output_path,
+            cache_folder=cache_folder,
+            retries=extraction.get('RETRIES', 1),
+            fetch_threads=extraction.get('FETCH_THREADS', 16),
+            html_backend=self.html_backend)
+        self.report_filename = extraction.get('REPORT_FILENAME', 'extraction_report.json')
+        # The pages are fetched by the threads of this process only: the request budget of each host is not divided
+        configure_http(params)
 
 
     def extract_agency_proposals(self):
-        """ Parent function which calls child functions to retrieve data for each agency.
-        Each child function will save the data to specific files separately. 
+        """ Parent function which extracts the proposals of all the agencies concurrently.
+        The data of each agency is saved to a specific file, and the outcome of each agency
+        (counts, failed pages, errors) to the report file.
         :param None: 
         
-        :return: None
+        :return: Dictionary of {agency name : report}
+        :rtype: `Dict`
         """
 
+        start = time.perf_counter()
+        jobs, report = [], {}
         for agency in self.agencies:
-
             try:
-                
-                data = pd.read_csv(
-                    os.path.join(
-                        self.output_path,
-                        self.agencies_filenames[agency]))
-                urls = data[data['AgencyName'] ==
-                            agency]['AdditionalInformationURL'].values
-                extractor = self.agency_extractors[agency](
-                    data=data, urls=urls, save_filename=self.extracted_agencies_filenames[agency])
-                extractor.extract_all(
-                    n_cores=self.n_cores,
-                    output_path=self.output_path)
-                print("Completed extraction for agency - :", agency)
-                
-            except BaseException:
+                jobs.append((self.agency_extractors[agency],
+                             self.agencies_filenames[agency],
+                             self.extracted_agencies_filenames[agency]))
+            except KeyError as error:
+                report[agency] = {'status': 'failed',
+                                  'error': 'No extractor or filename configured : %s' % error}
+        report.update(self.engine.run(jobs))
+
+        for agency, agency_report in report.items():
+            if agency_report['status'] == 'completed':
+                print("Completed extraction for agency - : %s (%d crawled, %d failed, %d unchanged)" % (
+                    agency, agency_report['crawled'], agency_report['failed'], agency_report['unchanged']))
+            else:
                 print("Error for Agency : ", agency)
+                print(agency_report['error'])
+
+        with atomic_output(os.path.join(self.output_path, self.report_filename)) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump({'elapsed': round(time.perf_counter() - start, 2), 'agencies': report}, f, indent=2)
+        return report
 
 
 if __name__ == "__main__":
@@ -108,6 +131,8 @@ if __name__ == "__main__":
         n_cores=args.n_cores,
         agencies=args.agencies,
         params=params)
-    extractor.extract_agency_proposals()
+    report = extractor.extract_agency_proposals()
+    if any(agency_report['status'] != 'completed' for agency_report in report.values()):
+        sys.exit(1)
     
     print("TASK COMPLETED : Completed Extracting Proposals") 
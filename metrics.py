@@ -0,0 +1,275 @@
+import os
+import time
+import cProfile
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_local = threading.local()
+
+
+def _escape(value):
+    """ Escape a label value as required by the Prometheus text format
+
+        :param value: Label value
+        :type value: `str`
+
+        :return: Escaped label value
+        :rtype: `str`
+    """
+    return str(value).replace('\\', '\\\\').replace(
+        '"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """ Build the `{name="value",...}` part of a sample line
+
+        :param label_names: Names of the labels
+        :type label_names: `Tuple`
+        :param label_values: Values of the labels (same order as label_names)
+        :type label_values: `Tuple`
+        :param extra: Additional (name, value) pair appended at the end, eg: the `le` bucket label
+        :type extra: `Tuple`
+
+        :return: Formatted labels
+        :rtype: `str`
+    """
+    pairs = list(zip(label_names, label_values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(['%s="%s"' % (k, _escape(v)) for k, v in pairs]) + '}'
+
+
+class Counter():
+    """ Monotonic counter with labels, rendered in Prometheus text format
+    """
+
+    def __init__(self, name, description, label_names=()):
+        """ Constructor
+
+        :param name: Metric name
+        :type name: `str`
+        :param description: Help text of the metric
+        :type description: `str`
+        :param label_names: Names of the labels of the metric
+        :type label_names: `Tuple`
+
+        :return: None
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """ Increment the counter for the given label values
+
+        :param label_values: Values of the labels
+        :type label_values: `str`
+        :param amount: Amount by which the counter is incremented
+        :type amount: `float`
+
+        :return: None
+        """
+        with self.lock:
+            self.values[tuple(label_values)] += amount
+
+    def render(self):
+        """ Render the counter in Prometheus text format
+
+        :return: Lines of the exposition
+        :rtype: `List`
+        """
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s counter' % self.name]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append('%s%s %s' % (self.name, _format_labels(
+                    self.label_names, label_values), repr(float(value))))
+        return lines
+
+
+class Histogram():
+    """ Cumulative latency histogram with labels, rendered in Prometheus text format
+    """
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        """ Constructor
+
+        :param name: Metric name
+        :type name: `str`
+        :param description: Help text of the metric
+        :type description: `str`
+        :param label_names: Names of the labels of the metric
+        :type label_names: `Tuple`
+        :param buckets: Upper bounds (in seconds) of the histogram buckets
+        :type buckets: `Tuple`
+
+        :return: None
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}
+        self.sums = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """ Record one observation
+
+        :param value: Observed value (seconds)
+        :type value: `float`
+        :param label_values: Values of the labels
+        :type label_values: `str`
+
+        :return: None
+        """
+        key = tuple(label_values)
+        with self.lock:
+            if key not in self.counts:
+                self.counts[key] = [0] * (len(self.buckets) + 1)
+            counts = self.counts[key]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+            counts[-1] += 1
+            self.sums[key] += value
+
+    def render(self):
+        """ Render the histogram in Prometheus text format
+
+        :return: Lines of the exposition
+        :rtype: `List`
+        """
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s histogram' % self.name]
+        with self.lock:
+            for key in sorted(self.counts):
+                counts = self.counts[key]
+                for bound, count in zip(self.buckets, counts):
+                    lines.append('%s_bucket%s %d' % (self.name, _format_labels(
+                        self.label_names, key, ('le', repr(float(bound)))), count))
+                lines.append('%s_bucket%s %d' % (self.name, _format_labels(
+                    self.label_names, key, ('le', '+Inf')), counts[-1]))
+                lines.append('%s_sum%s %s' % (self.name, _format_labels(
+                    self.label_names, key), repr(self.sums[key])))
+                lines.append('%s_count%s %d' % (self.name, _format_labels(
+                    self.label_names, key), counts[-1]))
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'rdash_request_duration_seconds',
+    'Latency of API requests per endpoint',
+    label_names=('endpoint',))
+PHASE_LATENCY = Histogram(
+    'rdash_phase_duration_seconds',
+    'Latency of the traced phases of a request',
+    label_names=('phase',))
+REQUESTS = Counter(
+    'rdash_requests_total',
+    'Number of API requests per endpoint and status code',
+    label_names=('endpoint', 'status'))
+CACHE_REQUESTS = Counter(
+    'rdash_cache_requests_total',
+    'Cache lookups per cache and result (hit / miss)',
+    label_names=('cache', 'result'))
+
+METRICS = [REQUEST_LATENCY, PHASE_LATENCY, REQUESTS, CACHE_REQUESTS]
+
+
+def render_metrics():
+    """ Render all the registered metrics in Prometheus text format
+
+    :return: The exposition text
+    :rtype: `str`
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def start_trace():
+    """ Start collecting spans for the request handled by the current thread
+
+    :return: None
+    """
+    _local.spans = []
+
+
+def end_trace():
+    """ Stop collecting spans for the current thread and return them
+
+    :return: List of (phase, seconds) in the order they finished
+    :rtype: `List`
+    """
+    spans = getattr(_local, 'spans', None) or []
+    _local.spans = None
+    return spans
+
+
+@contextmanager
+def span(name):
+    """ Time a phase of the request. The duration is recorded in the phase histogram
+    and, when a trace is active on the current thread, appended to the request's spans.
+
+    :param name: Name of the phase
+    :type name: `str`
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_LATENCY.observe(elapsed, name)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def server_timing(spans):
+    """ Format spans as a `Server-Timing` header value (durations in milliseconds)
+
+    :param spans: List of (phase, seconds)
+    :type spans: `List`
+
+    :return: Header value
+    :rtype: `str`
+    """
+    return ', '.join(['%s;dur=%.1f' % (name, seconds * 1000)
+                      for name, seconds in spans])
+
+
+def profile_call(profile_dir, label, func, *args, **kwargs):
+    """ Run a function under cProfile and dump the stats to `profile_dir`
+
+    :param profile_dir: Directory where the `.prof` file is written
+    :type profile_dir: `str`
+    :param label: Prefix of the dumped file
+    :type label: `str`
+    :param func: Function to be profiled
+
+    :return: Tuple of (result of the function, path of the dumped stats)
+    :rtype: `Tuple`
+    """
+    if not os.path.exists(profile_dir):
+        os.makedirs(profile_dir)
+
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        path = os.path.join(profile_dir, '%s_%d.prof' %
+                            (label, int(time.time() * 1000)))
+        profiler.dump_stats(path)
+    return result, path
@@ -15,31 +15,118 @@ import numpy as np
 from helpers import *
 from automatic_keyword_generator import *
 
-from collections import Counter
+from collections import Counter, OrderedDict
 import math
+import threading
+
+from metrics import span, CACHE_REQUESTS
+from tenants import get_default_tenant, get_shared_output_path, get_tenant_output_path
+from scoring import get_column_names, get_scorer, load_scoring_index, top_k_rows
+from scholar_store import load_scholar_store
+from shared_scoring import get_scoring_pool
+from semantic_index import SEMANTIC_FIELDS, SemanticIndex, get_semantic_params, load_semantic_indexes, \
+    semantic_scores, hybrid_score
 
 import pdb
 
+_PROPOSALS_CACHE = {}
+_KEYWORDS_CACHE = OrderedDict()
+_KEYWORDS_LOCK = threading.Lock()
+KEYWORDS_CACHE_SIZE = 4096
+AGENCY_NAMES = {
+    'NSF': 'National Science Foundation',
+    'nsf': 'National Science Foundation',
+    'nih': 'National Institutes of Health',
+    'NIH': 'National Institutes of Health'}
+
 
-def get_column_names():
+def load_proposals(proposal_data_file):
+    """ Function to get the proposal dataset of an agency, cached until the file changes on disk.
+    The proposals do not depend on the university: the dataset is shared by all of them.
 
-    feat_cols = [
-        'Keywords',
-        'Overview',
-        'Organization',
-        'pub_keyword',
-        'pub_title']
-    cfp = ["desc", "title", "dept"]
-    return [i + "_" + j + "_sim" for i in feat_cols for j in cfp]
+    :param proposal_data_file: Path of the proposal dataset CSV file
+    :type proposal_data_file: `str`
+
+    :return: Proposal dataset
+    :rtype: class `Pandas.DataFrame`
+    """
+    mtime = os.path.getmtime(proposal_data_file)
+    cached = _PROPOSALS_CACHE.get(proposal_data_file)
+    if cached is not None and cached[0] == mtime:
+        CACHE_REQUESTS.inc('proposals', 'hit')
+        return cached[1]
+
+    CACHE_REQUESTS.inc('proposals', 'miss')
+    cfp_df = pd.read_csv(proposal_data_file)
+    cfp_df.fillna(" ", inplace=True)
+    _PROPOSALS_CACHE[proposal_data_file] = (mtime, cfp_df)
+    return cfp_df
+
+
+def get_data_version(params, agency, univ_name=None):
+    """ Function to get the modification times of the files a recommendation is computed from
+    (proposals of the agency, scholar datasets and indexes of the university, embeddings).
+    The version changes when the pipeline rebuilds any of them, so that responses cached by the
+    server are not served from old data.
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param agency: The agency which is awarding the grant
+    :type agency: `str`
+    :param univ_name: University of the scholars (default: `DEFAULT_UNIV`)
+    :type univ_name: `str`
+
+    :return: Modification time of each file (None if it is missing)
+    :rtype: `Tuple`
+    """
+    output_path = get_tenant_output_path(params, univ_name)
+    paths = [
+        os.path.join(get_shared_output_path(params), params['AGENCIES_EXTRACTED_FILENAME_DICT'][AGENCY_NAMES[agency]]),
+        os.path.join(output_path, params["ANALYTICAL_DATSET"]),
+        os.path.join(output_path, params.get("ANALYTICAL_TERMS_FILENAME", "AnalyticalTerms.npz")),
+        os.path.join(output_path, params["SCHOLARS_DATASET"])]
+    semantic = get_semantic_params(params)
+    if semantic['ENABLED']:
+        for field in SEMANTIC_FIELDS:
+            paths.extend(SemanticIndex.paths(output_path, semantic['FILENAME_PREFIX'], field, semantic['INDEX']))
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+
+def get_proposal_keys(key, extract):
+    """ Function to get the keywords of the sections of a proposal, extracted once for all the
+    universities (LRU of the last `KEYWORDS_CACHE_SIZE` proposals)
+
+    :param key: Key of the proposal (dataset, its version, proposal id, generator, no of keywords)
+    :type key: `Tuple`
+    :param extract: Function extracting the keywords when they are not cached
+    :type extract: Function()
+
+    :return: Keywords of the Description, Title and Department
+    :rtype: `List`
+    """
+    with _KEYWORDS_LOCK:
+        if key in _KEYWORDS_CACHE:
+            _KEYWORDS_CACHE.move_to_end(key)
+            CACHE_REQUESTS.inc('proposal_keywords', 'hit')
+            return _KEYWORDS_CACHE[key]
+
+    CACHE_REQUESTS.inc('proposal_keywords', 'miss')
+    keys = extract()
+    with _KEYWORDS_LOCK:
+        _KEYWORDS_CACHE[key] = keys
+        while len(_KEYWORDS_CACHE) > KEYWORDS_CACHE_SIZE:
+            _KEYWORDS_CACHE.popitem(last=False)
+    return keys
 
 
 class Top_Scholar_Identifier():
     """This is a class to identify the top N scholars for a given proposal. 
     The proposal dataset created using 'main_extractor.py' will be utilized to get details of the proposal / grant. 
     The analytical dataset of user-publications created using 'create_analytical_data.py' will be utilized to get scholar profiles.
+    The scholar data is the one of the given university, the proposal data is shared by all the universities.
     """
 
-    def __init__(self, n_cores, id_no, top_k, generator_, agency, params):
+    def __init__(self, n_cores, id_no, top_k, generator_, agency, params, univ_name=None):
         """ Constructor
 
         :param n_cores: No: of CPU cores to be used for the process
@@ -54,25 +141,35 @@ class Top_Scholar_Identifier():
         :type agency: `str`      
         :param params: Parameters read from the configuration file
         :type params: `dict`     
+        :param univ_name: University of the scholars (default: `DEFAULT_UNIV`)
+        :type univ_name: `str`
         
         """
 
         # Set the parameters
         self.n_cores = params['CPU_COUNT'] if n_cores == 0 else n_cores
-        # self.output_path = params['OUTPUT_PATH']
-        self.output_path = os.path.dirname(os.path.abspath(__file__)) + '/' + params['OUTPUT_PATH']
+        # Scholar datasets / indexes of the university, proposal data shared by all of them
+        self.univ_name = univ_name or get_default_tenant(params)
+        self.output_path = get_tenant_output_path(params, self.univ_name)
+        self.shared_output_path = get_shared_output_path(params)
         self.id_no = params['PROPOSAL_ID'] if id_no == '' else id_no
         self.top_k = params['top_k_scholars'] if top_k == 0 else top_k
         self.generator_ = generator_
-        agency_map = {
-            'NSF': 'National Science Foundation',
-            'nsf': 'National Science Foundation',
-            'nih': 'National Institutes of Health',
-            'NIH': 'National Institutes of Health'}
         self.proposal_data_file = os.path.join(
-            self.output_path, params['AGENCIES_EXTRACTED_FILENAME_DICT'][agency_map[agency]])
+            self.shared_output_path, params['AGENCIES_EXTRACTED_FILENAME_DICT'][AGENCY_NAMES[agency]])
         self.analytical_filename = params["ANALYTICAL_DATSET"]
+        self.analytical_terms_filename = params.get("ANALYTICAL_TERMS_FILENAME", "AnalyticalTerms.npz")
         self.scholars_filename = params["SCHOLARS_DATASET"]
+        self.scorer = get_scorer(params)
+        self.field_weights = params.get('SCORING', {}).get('FIELD_WEIGHTS', {})
+        self.section_weights = params.get('SCORING', {}).get('SECTION_WEIGHTS', {})
+        self.scoring_processes = params.get('SCORING', {}).get('N_PROCESSES', 1)
+        self.params = params
+        self.semantic = get_semantic_params(params)
+        if self.generator_ == "BERT":
+            configure_bert(params, self.shared_output_path)
+        if self.generator_ == "SpacyLexicon":
+            configure_lexicon(params, self.shared_output_path)
 
     def read_data(self):
         """ Function which will read data from the initialized CSV files
@@ -84,21 +181,32 @@ class Top_Scholar_Identifier():
 		:rtype: 
         """
 
-        # Read scholars' basic data
-        self.user_df = pd.read_csv(
+        # Index of scholars' publication data (cached until the file changes)
+        self.index = load_scoring_index(
             os.path.join(
                 self.output_path,
-                self.scholars_filename))
+                self.analytical_filename),
+            os.path.join(
+                self.output_path,
+                self.analytical_terms_filename))
 
-        # Read scholars' publication data
-        self.ad = pd.read_csv(
+        # Read scholars' basic data and display records (cached until the file changes),
+        # with the row of each scholar of the scoring index
+        self.store = load_scholar_store(
             os.path.join(
                 self.output_path,
-                self.analytical_filename))
+                self.scholars_filename))
+        self.user_df = self.store.frame
+        self.scholar_rows = self.store.rows_of(self.index.user_ids)
+
+        # Embeddings of the scholars for semantic matching (optional)
+        if self.semantic['ENABLED']:
+            self.semantic_indexes = load_semantic_indexes(
+                self.params, self.output_path)
 
-        # Read proposal data
-        self.cfp_df = pd.read_csv(self.proposal_data_file)
-        self.cfp_df.fillna(" ", inplace=True)
+        # Read proposal data (cached until the file changes, shared by the universities)
+        self.proposals_mtime = os.path.getmtime(self.proposal_data_file)
+        self.cfp_df = load_proposals(self.proposal_data_file)
 
         self.proposal = self.cfp_df[self.cfp_df["Opportunity Number"]
                                     == self.id_no].reset_index(drop=True).iloc[0]
@@ -112,24 +220,26 @@ class Top_Scholar_Identifier():
 		:rtype:   
         """
 
-        # Get keys from the description of proposal
-        self.desc_keys = [
-            i for i in get_keys(
-                self.proposal["Description"],
-                generator=self.generator_,
-                ntop=self.top_k) if len(i) > 3]
-        # Get keys from the Title of proposal
-        self.title_keys = [
-            i for i in get_keys(
-                self.proposal["Title"],
-                generator=self.generator_,
-                ntop=self.top_k) if len(i) > 3]
-        # Get keys from the Department of proposal
-        self.dept_keys = [
-            i for i in get_keys(
-                self.proposal["Department"],
+        # Get keys from the Description, Title and Department of proposal in one batch,
+        # once for all the universities
+        sections = [
+            self.proposal["Description"],
+            self.proposal["Title"],
+            self.proposal["Department"]]
+
+        def extract():
+            keys = [[i for i in keys if len(i) > 3] for keys in get_keys_batch(
+                sections,
                 generator=self.generator_,
-                ntop=self.top_k) if len(i) > 3]
+                ntop=self.top_k)]
+            # Keep the embeddings of the new candidate terms for the next proposals
+            # (written in the background at most every TERM_CACHE_SAVE_INTERVAL seconds, and at exit)
+            if self.generator_ == "BERT":
+                get_term_cache().save_if_due(bert_settings['TERM_CACHE_SAVE_INTERVAL'])
+            return keys
+
+        key = (self.proposal_data_file, self.proposals_mtime, self.id_no, self.generator_, self.top_k)
+        self.desc_keys, self.title_keys, self.dept_keys = get_proposal_keys(key, extract)
 
     def get_top_scholars(self, ntop_=20):
         """ Main function to calculate the scholars suitable for the given proposal
@@ -142,55 +252,60 @@ class Top_Scholar_Identifier():
 
         """
 
-        # Create a list of lists. Each sublist contain a user's id, his/her section keys (from analytical database), proposal's sections keys
-        # That is if there are 'n' users with 'm' sentions from his profile and 'k' section in proposal, the main list will consist of 'n'*'m'*'k' sublists
-        self.similarity_lists = []
-        feat_cols = [
-            'Keywords',
-            'Overview',
-            'Organization',
-            'pub_keyword',
-            'pub_title']
-
-        for i in feat_cols:
-            for j in [self.desc_keys, self.title_keys, self.dept_keys]:
-                self.similarity_lists.append([(i, j, k) for i, j, k in zip(
-                    self.ad["user_id"], self.ad[i], [j] * self.ad.shape[0])])
-
-        # Run counter cosine similarity as parallel tasks
-        self.score_lists = []
-        for k in self.similarity_lists:
-            sims = parallelize(
-                self.n_cores,
-                func=counter_cosine_similarity,
-                arg1=k)
-            self.score_lists.append(sims)
-
-        self.sim_df = pd.DataFrame(
-            {"user_id": [list(i.keys())[0] for i in sims]})
-
-        col_names = get_column_names()
-        for col, k in zip(col_names, range(len(col_names))):
-            self.sim_df[col] = [list(i.values())[0]
-                                for i in self.score_lists[k]]
-
-        # Append the similarity values to the original dataframe
-        self.sim_df["total_sim"] = self.sim_df.sum(axis=1)
-        print("Max of self.sim[total_sim] :", self.sim_df["total_sim"].max())
-        self.sim_df.sort_values("total_sim", ascending=False, inplace=True)
-        self.sub_df = self.sim_df[:self.top_k]
-        self.ids = self.sub_df["user_id"].values.tolist()
+        # Score every scholar field against every proposal section. The scorer and
+        # the weights of the fields / sections are set in the SCORING section of the config file
+        section_keys = {"desc": self.desc_keys, "title": self.title_keys, "dept": self.dept_keys}
+        with span("score"):
+            if self.scoring_processes > 1:
+                # Workers read the document weights from shared memory
+                with get_scoring_pool(self.index, self.scorer, self.scoring_processes,
+                                      name=self.univ_name) as pool:
+                    total_sim, breakdown = pool.score(
+                        section_keys,
+                        field_weights=self.field_weights,
+                        section_weights=self.section_weights)
+            else:
+                total_sim, breakdown = self.index.score(
+                    section_keys,
+                    scorer=self.scorer,
+                    field_weights=self.field_weights,
+                    section_weights=self.section_weights)
+
+        # Blend with the semantic similarity of the proposal to the scholars' embeddings
+        if self.semantic['ENABLED']:
+            with span("semantic"):
+                semantic = semantic_scores(
+                    self.semantic_indexes,
+                    self.proposal["Title"] + ". " + self.proposal["Description"],
+                    self.index.user_ids,
+                    self.params)
+            total_sim = hybrid_score(total_sim, semantic, self.semantic['ALPHA'])
+
+        print("Max of self.sim[total_sim] :", total_sim.max())
+
+        # Partial selection of the top scholars among the ones with a profile row
+        ranked = np.where(self.scholar_rows >= 0, total_sim, -np.inf)
+        top = top_k_rows(ranked, self.top_k)
+        top = top[np.isfinite(ranked[top])]
+        self.ids = self.index.user_ids[top].tolist()
+
+        # Similarity breakdown of the top scholars only
+        self.sim_df = pd.DataFrame({"user_id": self.index.user_ids[top]})
+        for col in get_column_names():
+            self.sim_df[col] = breakdown[col][top]
+        if self.semantic['ENABLED']:
+            self.sim_df["semantic_sim"] = semantic[top] * 100
+        self.sim_df["total_sim"] = total_sim[top]
+        self.sub_df = self.sim_df
 
         # Create dataframe with only top scholars
-        self.recommend_df = self.user_df[self.user_df["User_id"].isin(
-            self.ids)]
-        self.recommend_df.set_index("User_id", inplace=True)
-        self.recommend_df = self.recommend_df.loc[self.ids]
+        self.top_rows = self.scholar_rows[top]
+        self.recommend_df = self.user_df.iloc[self.top_rows].set_index("User_id")
 
         return self.recommend_df
 
 
-def recommend(config_file,top_k,proposal_id,generator,cpu_count,agency,db_path,output_file):
+def recommend(config_file,top_k,proposal_id,generator,cpu_count,agency,db_path,output_file,univ_name=None):
 
     """ Read arguments from command line (cmd). If no input via cmd, use config
         file 
@@ -210,38 +325,30 @@ def recommend(config_file,top_k,proposal_id,generator,cpu_count,agency,db_path,o
         id_no=proposal_id,
         top_k=top_k,
         generator_=generator,
-        params=params)
+        params=params,
+        univ_name=univ_name)
 
     # Reads (CSV file) with data regarding Proposal, Scholar details and
-    obj.read_data()
+    with span("read_data"):
+        obj.read_data()
 
     # Extract keyword for proposal
-    obj.get_section_keys_for_proposal()
+    with span("section_keys"):
+        obj.get_section_keys_for_proposal()
 
     # Get recommendations
-    recommendations = obj.get_top_scholars(ntop_=top_k)
-    recommendations = recommendations.fillna('')
-    
-    d = []
-    for index, row in recommendations.iterrows():
-        scholar = {}
-        scholar["Netid"], scholar["Name"], scholar["Email"] = row["Netid"], row["Name"], row["Email"]
-        scholar["Type"], scholar["Keywords"] = row["Type"], row["Keywords"].replace("'", "").replace('"',"")
-        scholar["n_publications"] = row["n_publications"]
-        scholar["n_research"], scholar["Awards"], scholar["n_awards"] = row["n_research"], row["Awards"], row["n_awards"]
-        scholar["Organizations"], scholar["Course"], scholar["Department"] = row["Organizations"], row["Course"], row["Department"]
-        # print(json.loads(row["Publications"]))
-        d.append(scholar)
-    
-    json_object = json.dumps(d, indent=4)
-    json_path = os.path.dirname(os.path.abspath(__file__)) + output_file + ".json"
-    # Writing to output.json
-    with open(json_path, "w") as outfile:
-        outfile.write(json_object)
-    
+    with span("get_top_scholars"):
+        recommendations = obj.get_top_scholars(ntop_=top_k)
+
+    # Pre-encoded records of the top scholars
+    with span("serialize"):
+        json_object = obj.store.to_json(obj.top_rows)
 
     # Save the recommendation
-    # save_pandas_to_csv(df=recommendations,output_path=os.path.join(obj.output_path,output_file + ".csv"),index=False)
-    # recommendations_list = recommendations.values.tolist()
-    
+    if output_file:
+        json_path = os.path.dirname(os.path.abspath(__file__)) + output_file + ".json"
+        with atomic_output(json_path) as tmp_path:
+            with open(tmp_path, "wb") as outfile:
+                outfile.write(json_object)
+
     return json_object
\ No newline at end of file
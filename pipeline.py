@@ -0,0 +1,361 @@
+import os
+import sys
+import json
+import time
+import yaml
+import hashlib
+import argparse
+import subprocess
+
+from tenants import get_default_tenant, get_shared_output_path, get_tenant_output_path
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ Function to compute the SHA-256 digest of a file, reading it in chunks
+
+        :param path: Path of the file
+        :type path: `str`
+        :param chunk_size: No of bytes read at a time
+        :type chunk_size: `int`
+
+        :return: Hex digest of the file content
+        :rtype: `str`
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Stage():
+    """ A single step of the data pipeline: a python script with the files it reads and writes
+    """
+
+    def __init__(self, name, script, inputs, outputs, args=()):
+        """ Constructor
+
+        :param name: Name of the stage
+        :type name: `str`
+        :param script: Script (relative to the repository) executed by the stage
+        :type script: `str`
+        :param inputs: Files read by the stage
+        :type inputs: `List`
+        :param outputs: Files written by the stage
+        :type outputs: `List`
+        :param args: Command line arguments passed to the script
+        :type args: `List`
+
+        :return: None
+        """
+        self.name = name
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.args = list(args)
+        self.deps = set()
+
+    def fingerprint(self, config_file):
+        """ Fingerprint of everything which determines the outputs of the stage:
+        the script, the configuration file, the arguments and the content of the inputs
+
+        :param config_file: Path of the configuration file
+        :type config_file: `str`
+
+        :return: Hex digest
+        :rtype: `str`
+        """
+        digest = hashlib.sha256()
+        digest.update(file_digest(os.path.join(BASE_DIR, self.script)).encode())
+        digest.update(file_digest(config_file).encode())
+        digest.update(json.dumps(self.args).encode())
+        for path in self.inputs:
+            digest.update(path.encode())
+            digest.update(file_digest(path).encode()
+                          if os.path.exists(path) else b'missing')
+        return digest.hexdigest()
+
+
+def get_stages(params, config_file, univ_names):
+    """ Function to declare the stages of the pipeline with their input / output files.
+    The scholar branch (profiles -> publications -> analytical data) and the grants branch
+    (Grants.gov -> agency pages -> title database) share no files and can run concurrently.
+    There is one scholar branch per university, writing to the folder of the university; the
+    stages of the universities other than the default one are suffixed with their name.
+
+        :param params: Dictionary of default values for each parameter as read from the CONFIG.yml file
+        :type params: `Dict`
+        :param config_file: Path of the configuration file passed to every stage
+        :type config_file: `str`
+        :param univ_names: Names of the Universities whose scholars are extracted
+        :type univ_names: `List`
+
+        :return: List of stages
+        :rtype: `List`
+    """
+    output_path = get_shared_output_path(params)
+
+    def out(filename):
+        return os.path.join(output_path, filename)
+
+    if isinstance(univ_names, str):
+        univ_names = [univ_names]
+    agency_files = [out(i) for i in params['AGENCIES_FILENAME_DICT'].values()]
+    extracted_files = [out(i)
+                       for i in params['AGENCIES_EXTRACTED_FILENAME_DICT'].values()]
+    config_arg = '--config_file=' + config_file
+
+    scholar_stages, semantic_stages = [], []
+    for univ_name in univ_names:
+        tenant_path = get_tenant_output_path(params, univ_name)
+
+        def tenant_out(filename):
+            return os.path.join(tenant_path, filename)
+
+        suffix = '' if univ_name == get_default_tenant(params) else '_' + univ_name
+        scholars = tenant_out(params['SCHOLARS_DATASET'])
+        publications = tenant_out(params['PUBLICATION_DATASET'])
+        publication_ids = tenant_out(params['SCHOLAR_PUBLICATION_IDS'])
+        analytical = tenant_out(params['ANALYTICAL_DATSET'])
+        analytical_terms = tenant_out(params.get('ANALYTICAL_TERMS_FILENAME', 'AnalyticalTerms.npz'))
+        univ_arg = '--univ_name=' + univ_name
+
+        scholar_stages += [
+            Stage('user_profile_creation' + suffix, 'user_profile_creation.py',
+                  inputs=[], outputs=[scholars, publication_ids], args=[config_arg, univ_arg]),
+            Stage('extract_publications' + suffix, 'extract_publications.py',
+                  inputs=[scholars, publication_ids], outputs=[publications], args=[config_arg, univ_arg]),
+            Stage('create_analytical_data' + suffix, 'create_analytical_data.py',
+                  inputs=[scholars, publications], outputs=[analytical, analytical_terms],
+                  args=[config_arg, univ_arg]),
+        ]
+
+        semantic = params.get('SEMANTIC', {})
+        if semantic.get('ENABLED', False):
+            prefix = semantic.get('FILENAME_PREFIX', 'scholar_embeddings')
+            semantic_stages.append(
+                Stage('semantic_index' + suffix, 'semantic_index.py',
+                      inputs=[scholars, publications, analytical],
+                      outputs=[tenant_out(prefix + '_' + field + '.npy') for field in ('profile', 'publications')],
+                      args=[config_arg, univ_arg]))
+
+    stages = scholar_stages + [
+        Stage('extract_proposals', 'extract_proposals.py',
+              inputs=[], outputs=agency_files + [out(params['GRANTS_DATASET']), out(params['OPEN_PROPOSALS_DATASET'])],
+              args=[config_arg]),
+        Stage('main_extractor', 'main_extractor.py',
+              inputs=agency_files, outputs=extracted_files, args=[config_arg]),
+        Stage('extract_proposals_titles_db', 'extract_proposals_titles_db.py',
+              inputs=extracted_files, outputs=[out('proposals_titles_db.json')]),
+    ] + semantic_stages
+    return stages
+
+
+class PipelineRunner():
+    """ Class which runs the stages of the pipeline as a DAG.
+    A stage depends on every stage producing one of its inputs. Independent stages run concurrently,
+    stages whose fingerprint has not changed since their last successful run are skipped and failed stages are retried.
+    """
+
+    def __init__(self, stages, config_file, params, force=False):
+        """ Constructor
+
+        :param stages: Stages of the pipeline
+        :type stages: `List`
+        :param config_file: Path of the configuration file
+        :type config_file: `str`
+        :param params: Dictionary of default values for each parameter as read from the CONFIG.yml file
+        :type params: `Dict`
+        :param force: If True, every stage is run even if its inputs have not changed
+        :type force: `bool`
+
+        :return: None
+        """
+        pipeline_params = params.get('PIPELINE', {})
+        self.stages = {stage.name: stage for stage in stages}
+        self.config_file = config_file
+        self.force = force
+        self.max_parallel = pipeline_params.get('MAX_PARALLEL', 2)
+        self.retries = pipeline_params.get('RETRIES', 2)
+        self.retry_delay = pipeline_params.get('RETRY_DELAY', 30)
+        self.log_path = os.path.join(
+            BASE_DIR, pipeline_params.get('LOG_PATH', 'stdout/'))
+        self.state_file = os.path.join(
+            BASE_DIR, params['OUTPUT_PATH'], pipeline_params.get('STATE_FILENAME', 'pipeline_state.json'))
+        self.state = self.load_state()
+
+        producers = {path: stage.name for stage in stages for path in stage.outputs}
+        for stage in stages:
+            stage.deps = {producers[path]
+                          for path in stage.inputs if path in producers}
+
+    def load_state(self):
+        """ Function to read the fingerprints of the last successful run of each stage
+
+        :return: Dictionary of {stage name : fingerprint}
+        :rtype: `Dict`
+        """
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        """ Function to atomically save the fingerprints of the stages
+
+        :return: None
+        """
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.state_file)
+
+    def is_up_to_date(self, stage, fingerprint):
+        """ A stage is up to date if it reads files (stages without inputs fetch remote data and always run),
+        all its outputs exist and its fingerprint matches the last successful run
+
+        :param stage: Stage to check
+        :type stage: class `Stage`
+        :param fingerprint: Current fingerprint of the stage
+        :type fingerprint: `str`
+
+        :return: True if the stage can be skipped
+        :rtype: `bool`
+        """
+        if self.force or not stage.inputs:
+            return False
+        if not all(os.path.exists(path) for path in stage.outputs):
+            return False
+        return self.state.get(stage.name) == fingerprint
+
+    def run_stage(self, stage):
+        """ Function to run a stage, retrying it on failure
+
+        :param stage: Stage to run
+        :type stage: class `Stage`
+
+        :return: Tuple of (status, fingerprint) where status is 'skipped', 'done' or 'failed'
+        :rtype: `Tuple`
+        """
+        fingerprint = stage.fingerprint(self.config_file)
+        if self.is_up_to_date(stage, fingerprint):
+            print("SKIPPED (inputs unchanged) :", stage.name)
+            return 'skipped', fingerprint
+
+        os.makedirs(self.log_path, exist_ok=True)
+        command = [sys.executable, os.path.join(BASE_DIR, stage.script)] + stage.args
+        for attempt in range(1, self.retries + 2):
+            print("STARTED :", stage.name, "(attempt %d)" % attempt)
+            start = time.time()
+            with open(os.path.join(self.log_path, stage.name + '.txt'), 'a') as log:
+                returncode = subprocess.call(
+                    command, cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT)
+            if returncode == 0:
+                print("COMPLETED : %s in %.1fs" % (stage.name, time.time() - start))
+                return 'done', fingerprint
+            print("FAILED : %s with exit code %d" % (stage.name, returncode))
+            if attempt <= self.retries:
+                time.sleep(self.retry_delay * attempt)
+        return 'failed', fingerprint
+
+    def run(self):
+        """ Main function which schedules the stages as soon as all their dependencies completed
+
+        :return: Dictionary of {stage name : status}
+        :rtype: `Dict`
+        """
+        status = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if any(status.get(dep) in ('failed', 'blocked') for dep in stage.deps):
+                        print("BLOCKED (upstream failed) :", name)
+                        status[name] = 'blocked'
+                        del pending[name]
+                    elif all(status.get(dep) in ('done', 'skipped') for dep in stage.deps):
+                        running[executor.submit(self.run_stage, stage)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    status[name], fingerprint = future.result()
+                    if status[name] == 'done':
+                        self.state[name] = fingerprint
+                        self.save_state()
+
+        return status
+
+
+if __name__ == "__main__":
+
+    # Read arguments from command line (cmd). If no input via cmd, use config
+    # file
+    parser = argparse.ArgumentParser(description="Parameter file")
+    parser.add_argument(
+        '--config_file',
+        metavar='FILENAME',
+        type=str,
+        default='config.yml',
+        help='Parameter file name in yaml format')
+    parser.add_argument(
+        '--univ_name',
+        metavar='UNIV_NAME',
+        type=str,
+        nargs='+',
+        default=['TAMU'],
+        choices=[
+            'TAMU',
+            'UFL'],
+        help='NAME of the Universities')
+    parser.add_argument(
+        '--stages',
+        metavar='STAGES',
+        nargs="*",
+        default=[],
+        help='Run only these stages (and nothing else)')
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Run every stage even if its inputs have not changed')
+    args = parser.parse_args()
+
+    print("\n\nRunning RDash pipeline")
+
+    config_file = os.path.abspath(args.config_file)
+    try:
+        params = yaml.safe_load(open(config_file))
+    except BaseException:
+        print(f'Error loading parameter file: {args.config_file}.')
+        sys.exit(1)
+
+    stages = get_stages(params, config_file, args.univ_name)
+    if args.stages:
+        stages = [stage for stage in stages if stage.name in args.stages]
+
+    runner = PipelineRunner(
+        stages=stages,
+        config_file=config_file,
+        params=params,
+        force=args.force)
+    status = runner.run()
+
+    for name, stage_status in status.items():
+        print(name, ":", stage_status)
+
+    if any(i in ('failed', 'blocked') for i in status.values()):
+        sys.exit(1)
+
+    print("TASK COMPLETED : Pipeline finished")
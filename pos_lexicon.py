@@ -0,0 +1,226 @@
+""" POS lookup lexicon of the Spacy keyword generator.
+
+The Spacy generator keeps the tokens tagged PROPN / ADJ / NOUN. Most words of our corpus always get
+the same answer, so the tagger is only needed for the few which do not. The lexicon is learned offline
+by tagging a sample of the corpus (publication titles, scholar overviews, proposal descriptions) with
+spaCy: for each word it counts how often it was tagged as a keyword. At extraction time
+(`SpacyLexicon` generator) a word seen often enough with a clear majority is decided by the lexicon,
+the others are tagged by spaCy on a window of words around them.
+
+    python pos_lexicon.py --config_file=config.yml --sample_size=20000
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+import yaml
+
+
+KEYWORD_POS = ('PROPN', 'ADJ', 'NOUN')
+
+
+class PosLexicon():
+    """ Dictionary of {word : [times tagged as a keyword, times seen]} learned from spaCy tags
+    """
+
+    def __init__(self, counts=None, model=None, min_count=5, min_agreement=0.99):
+        """ Constructor
+
+        :param counts: Dictionary of {word : [times tagged as a keyword, times seen]}
+        :type counts: `Dict`
+        :param model: Name and version of the spaCy model the tags come from
+        :type model: `str`
+        :param min_count: No of times a word must have been seen to be decided by the lexicon
+        :type min_count: `int`
+        :param min_agreement: Share of the majority tag for a word to be decided by the lexicon
+        :type min_agreement: `float`
+
+        :return: None
+        """
+        self.counts = counts or {}
+        self.model = model
+        self.min_count = min_count
+        self.min_agreement = min_agreement
+        self.decisions = {}
+        self.compile()
+
+    def compile(self):
+        """ Function to compute the decision of every word from the counts:
+        True (keyword), False (not a keyword), words left out are ambiguous
+
+        :return: None
+        """
+        self.decisions = {}
+        for word, (n_keyword, n_seen) in self.counts.items():
+            if n_seen < self.min_count:
+                continue
+            if n_keyword >= self.min_agreement * n_seen:
+                self.decisions[word] = True
+            elif n_seen - n_keyword >= self.min_agreement * n_seen:
+                self.decisions[word] = False
+
+    def add(self, doc):
+        """ Function to count the tags of a document tagged by spaCy
+
+        :param doc: Document processed by the spaCy pipeline
+        :type doc: class `spacy.tokens.Doc`
+
+        :return: None
+        """
+        for token in doc:
+            counts = self.counts.setdefault(token.text, [0, 0])
+            counts[0] += token.pos_ in KEYWORD_POS
+            counts[1] += 1
+
+    @classmethod
+    def learn(cls, nlp, texts, batch_size=256, n_process=1, **options):
+        """ Function to learn the lexicon from texts tagged by spaCy (lowercased, as for the keywords)
+
+        :param nlp: spaCy pipeline
+        :type nlp: class `spacy.language.Language`
+        :param texts: Sample of the corpus
+        :type texts: `List`
+        :param batch_size: No of texts buffered per batch
+        :type batch_size: `int`
+        :param n_process: No of processes used by spaCy
+        :type n_process: `int`
+        :param options: `min_count` and `min_agreement`
+        :type options: `Dict`
+
+        :return: Lexicon
+        :rtype: class `PosLexicon`
+        """
+        lexicon = cls(model="%s-%s" % (nlp.meta.get('name'), nlp.meta.get('version')), **options)
+        for doc in nlp.pipe((text.lower() for text in texts), batch_size=batch_size,
+                            n_process=n_process, disable=["parser", "ner"]):
+            lexicon.add(doc)
+        lexicon.compile()
+        return lexicon
+
+    def decide(self, word):
+        """ Function to get the decision of the lexicon for a word
+
+        :param word: Word
+        :type word: `str`
+
+        :return: True if it is a keyword, False if it is not, None if it must be tagged by spaCy
+        :rtype: `bool`
+        """
+        return self.decisions.get(word)
+
+    def save(self, path):
+        """ Function to save the lexicon to a JSON file, written atomically
+
+        :param path: Path of the file
+        :type path: `str`
+
+        :return: None
+        """
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'model': self.model, 'counts': self.counts}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **options):
+        """ Function to load a lexicon saved by `save`
+
+        :param path: Path of the file
+        :type path: `str`
+        :param options: `min_count` and `min_agreement`
+        :type options: `Dict`
+
+        :return: Lexicon
+        :rtype: class `PosLexicon`
+        """
+        with open(path) as f:
+            data = json.load(f)
+        return cls(counts=data['counts'], model=data.get('model'), **options)
+
+
+def get_lexicon_params(params):
+    """ Function to read the SPACY_LEXICON section of the configuration file
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Dictionary of {FILENAME, MIN_COUNT, MIN_AGREEMENT, WINDOW, SAMPLE_SIZE}
+    :rtype: `Dict`
+    """
+    lexicon = {'FILENAME': 'pos_lexicon.json', 'MIN_COUNT': 5, 'MIN_AGREEMENT': 0.99,
+               'WINDOW': 4, 'SAMPLE_SIZE': 20000}
+    lexicon.update(params.get('SPACY_LEXICON', {}))
+    return lexicon
+
+
+def read_corpus(params, output_path):
+    """ Function to read the texts the keywords are extracted from: publication titles,
+    scholar overviews and proposal descriptions (the files which exist)
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param output_path: Folder of the datasets
+    :type output_path: `str`
+
+    :return: List of texts
+    :rtype: `List`
+    """
+    from helpers import read_table
+
+    texts = []
+    sources = [(params['PUBLICATION_DATASET'], 'title'), (params['SCHOLARS_DATASET'], 'Overview')]
+    sources += [(filename, 'Description')
+                for filename in params['AGENCIES_EXTRACTED_FILENAME_DICT'].values()]
+    for filename, column in sources:
+        path = os.path.join(output_path, filename)
+        if os.path.exists(path):
+            texts += read_table(path, columns=[column])[column].dropna().astype(str).tolist()
+    return texts
+
+
+if __name__ == "__main__":
+
+    # Read arguments from command line (cmd). If no input via cmd, use config
+    # file
+    parser = argparse.ArgumentParser(description="Parameter file")
+    parser.add_argument(
+        '--config_file',
+        metavar='FILENAME',
+        type=str,
+        default='config.yml',
+        help='Parameter file name in yaml format')
+    parser.add_argument(
+        '--sample_size',
+        metavar='SAMPLE_SIZE',
+        type=int,
+        default=0,
+        help='No of texts tagged to learn the lexicon (0 : SAMPLE_SIZE of the configuration file)')
+    args = parser.parse_args()
+
+    try:
+        params = yaml.safe_load(open(args.config_file))
+    except BaseException:
+        print(f'Error loading parameter file: {args.config_file}.')
+        sys.exit(1)
+
+    from automatic_keyword_generator import nlp
+
+    lexicon_params = get_lexicon_params(params)
+    output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), params['OUTPUT_PATH'])
+    texts = read_corpus(params, output_path)
+    sample_size = args.sample_size or lexicon_params['SAMPLE_SIZE']
+    if len(texts) > sample_size:
+        texts = random.Random(0).sample(texts, sample_size)
+    print("Learning the POS lexicon from %d texts" % len(texts))
+
+    lexicon = PosLexicon.learn(
+        nlp, texts,
+        batch_size=params.get('SPACY_BATCH_SIZE', 256),
+        n_process=params.get('SPACY_N_PROCESS', 1),
+        min_count=lexicon_params['MIN_COUNT'],
+        min_agreement=lexicon_params['MIN_AGREEMENT'])
+    lexicon.save(os.path.join(output_path, lexicon_params['FILENAME']))
+    print("%d words, %d decided by the lexicon" % (len(lexicon.counts), len(lexicon.decisions)))
+    print("TASK COMPLETED : POS lexicon saved")
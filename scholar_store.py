@@ -0,0 +1,154 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from metrics import CACHE_REQUESTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DISPLAY_FIELDS = [
+    'Netid',
+    'Name',
+    'Email',
+    'Type',
+    'Keywords',
+    'n_publications',
+    'n_research',
+    'Awards',
+    'n_awards',
+    'Organizations',
+    'Course',
+    'Department']
+
+_STORE_CACHE = {}
+
+
+def dumps(obj):
+    """ Function to serialize an object to JSON bytes, with orjson when it is installed
+
+    :param obj: Object made of python types only
+    :type obj: `object`
+
+    :return: JSON document
+    :rtype: `bytes`
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class ScholarRecordStore():
+    """ Display records of the scholars returned by the API. The fields are cleaned once
+    when the scholars dataset is loaded and every record is pre-encoded to JSON, so that a
+    response is only the concatenation of the records of the top scholars.
+    Rows of the store are the rows of the scholars dataset.
+    """
+
+    def __init__(self, frame, columns, records):
+        """ Constructor
+
+        :param frame: Scholars dataset
+        :type frame: class `Pandas.DataFrame`
+        :param columns: Dictionary of {display field : array of cleaned values}
+        :type columns: `Dict`
+        :param records: JSON encoded record of each scholar
+        :type records: `numpy.ndarray`
+
+        :return: None
+        """
+        self.frame = frame
+        self.columns = columns
+        self.records = records
+        # id -> row index, the first row of a duplicated id wins
+        first = ~frame["User_id"].duplicated().values
+        self.id_index = pd.Index(frame["User_id"].values[first])
+        self.id_rows = np.flatnonzero(first)
+        self._rows_cache = (None, None)
+
+    @classmethod
+    def from_dataframe(cls, user_df):
+        """ Function to build the store from the scholars dataset
+
+        :param user_df: Scholars dataset
+        :type user_df: class `Pandas.DataFrame`
+
+        :return: Store
+        :rtype: class `ScholarRecordStore`
+        """
+        display = user_df.reindex(columns=DISPLAY_FIELDS).fillna('')
+        display['Keywords'] = display['Keywords'].astype(str).str.replace(
+            "'", "", regex=False).str.replace('"', "", regex=False)
+
+        # Object arrays hold python scalars, which every JSON encoder accepts
+        columns = {field: display[field].astype(object).to_numpy() for field in DISPLAY_FIELDS}
+        records = np.empty(len(display), dtype=object)
+        for row, values in enumerate(zip(*[columns[field].tolist() for field in DISPLAY_FIELDS])):
+            records[row] = dumps(dict(zip(DISPLAY_FIELDS, values)))
+        return cls(user_df, columns, records)
+
+    def rows_of(self, user_ids):
+        """ Function to get the row of each user id (-1 for unknown ids). The result for
+        the last array of ids is kept, as the scoring index passes the same array on every request.
+
+        :param user_ids: User IDs
+        :type user_ids: `numpy.ndarray`
+
+        :return: Rows of the scholars
+        :rtype: `numpy.ndarray`
+        """
+        cached_ids, cached_rows = self._rows_cache
+        if cached_ids is user_ids:
+            return cached_rows
+        positions = self.id_index.get_indexer(user_ids)
+        rows = np.where(positions >= 0, self.id_rows[positions], -1)
+        self._rows_cache = (user_ids, rows)
+        return rows
+
+    def record(self, row):
+        """ Display record of one scholar
+
+        :param row: Row of the scholar
+        :type row: `int`
+
+        :return: Dictionary of {display field : value}
+        :rtype: `Dict`
+        """
+        return {field: self.columns[field][row] for field in DISPLAY_FIELDS}
+
+    def to_json(self, rows):
+        """ Function to serialize the records of the given scholars as a JSON list
+
+        :param rows: Rows of the scholars, in the order of the list
+        :type rows: `List`
+
+        :return: JSON document
+        :rtype: `bytes`
+        """
+        return b'[' + b','.join(self.records[np.asarray(rows, dtype=np.int64)].tolist()) + b']'
+
+
+def load_scholar_store(scholars_path):
+    """ Function to get the record store of the scholars dataset, cached until the file changes on disk
+
+    :param scholars_path: Path of the scholars dataset CSV file
+    :type scholars_path: `str`
+
+    :return: Store
+    :rtype: class `ScholarRecordStore`
+    """
+    mtime = os.path.getmtime(scholars_path)
+    cached = _STORE_CACHE.get(scholars_path)
+    if cached is not None and cached[0] == mtime:
+        CACHE_REQUESTS.inc('scholars', 'hit')
+        return cached[1]
+
+    CACHE_REQUESTS.inc('scholars', 'miss')
+    store = ScholarRecordStore.from_dataframe(pd.read_csv(scholars_path))
+    _STORE_CACHE[scholars_path] = (mtime, store)
+    return store
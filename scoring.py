@@ -0,0 +1,500 @@
+import os
+import math
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from metrics import CACHE_REQUESTS
+
+
+FEATURE_COLUMNS = [
+    'Keywords',
+    'Overview',
+    'Organization',
+    'pub_keyword',
+    'pub_title']
+PROPOSAL_SECTIONS = ["desc", "title", "dept"]
+
+_INDEX_CACHE = {}
+
+
+def get_column_names():
+    """ Names of the similarity columns, one per (scholar field, proposal section) pair
+
+    :return: List of column names
+    :rtype: `List`
+    """
+    return [i + "_" + j + "_sim" for i in FEATURE_COLUMNS for j in PROPOSAL_SECTIONS]
+
+
+def encode_texts(texts, vocabulary):
+    """ Function to encode the space separated token strings of a field as rows of sorted
+    (term id, count) arrays. Terms are split exactly as `counter_cosine_similarity` splits them.
+
+    :param texts: Token strings of the field (NaN for scholars without the field)
+    :type texts: `List`
+    :param vocabulary: Dictionary of {term : term id}, new terms are added to it
+    :type vocabulary: `Dict`
+
+    :return: Tuple of (row pointers, term ids, counts) of a CSR matrix
+    :rtype: `Tuple`
+    """
+    indptr, term_ids, counts = [0], [], []
+    for text in texts:
+        if isinstance(text, str):
+            row = sorted((vocabulary.setdefault(term, len(vocabulary)), count)
+                         for term, count in Counter(text.split(" ")).items())
+            term_ids += [term_id for term_id, _ in row]
+            counts += [count for _, count in row]
+        indptr.append(len(term_ids))
+    return (np.asarray(indptr, dtype=np.int64),
+            np.asarray(term_ids, dtype=np.int32),
+            np.asarray(counts, dtype=np.int32))
+
+
+def count_query_terms(vocabulary, terms):
+    """ Function to count the query terms and map them on the term ids of a vocabulary
+
+    :param vocabulary: Dictionary of {term : term id}
+    :type vocabulary: `Dict`
+    :param terms: Keywords of the proposal section
+    :type terms: `List`
+
+    :return: Tuple of (ids of in-vocabulary terms, their counts, counts of all the terms)
+    :rtype: `Tuple`
+    """
+    counts = Counter(terms)
+    cols, vals = [], []
+    for term, count in counts.items():
+        col = vocabulary.get(term)
+        if col is not None:
+            cols.append(col)
+            vals.append(count)
+    return (np.asarray(cols, dtype=np.int64),
+            np.asarray(vals, dtype=np.float64),
+            np.asarray(list(counts.values()), dtype=np.float64))
+
+
+class FieldIndex():
+    """ Term-frequency matrix of one scholar field (one row per scholar) together with
+    its document-frequency statistics. The columns are the term ids of a vocabulary which
+    can be shared by all the fields of a `ScoringIndex`.
+    """
+
+    def __init__(self, vocabulary, tf):
+        """ Constructor
+
+        :param vocabulary: Dictionary of {term : term id}
+        :type vocabulary: `Dict`
+        :param tf: Sparse matrix of term counts (n_scholars x n_terms)
+        :type tf: class `scipy.sparse.csr_matrix`
+
+        :return: None
+        """
+        self.vocabulary = vocabulary
+        self.tf = tf.tocsr()
+        self.n_docs = self.tf.shape[0]
+        self.df = np.bincount(self.tf.indices, minlength=self.tf.shape[1])
+        self.doc_len = np.asarray(self.tf.sum(axis=1)).ravel()
+        self.avg_doc_len = self.doc_len.mean() if self.n_docs else 0.0
+        self.weights = {}
+
+    @classmethod
+    def from_arrays(cls, vocabulary, indptr, term_ids, counts):
+        """ Function to build the index of a field from its rows of sorted (term id, count) arrays
+
+        :param vocabulary: Dictionary of {term : term id}
+        :type vocabulary: `Dict`
+        :param indptr: Row pointers (n_scholars + 1)
+        :type indptr: `numpy.ndarray`
+        :param term_ids: Term ids of the rows, sorted within each row
+        :type term_ids: `numpy.ndarray`
+        :param counts: Counts of the terms
+        :type counts: `numpy.ndarray`
+
+        :return: Index of the field
+        :rtype: class `FieldIndex`
+        """
+        # Integer counts: the scorers compute their weights in float64 from them
+        tf = sp.csr_matrix(
+            (np.asarray(counts, dtype=np.int32),
+             np.asarray(term_ids, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, len(vocabulary)))
+        return cls(vocabulary, tf)
+
+    @classmethod
+    def from_texts(cls, texts, vocabulary=None):
+        """ Function to build the index of a field from its space separated token strings
+
+        :param texts: Token strings of the field (NaN for scholars without the field)
+        :type texts: `List`
+        :param vocabulary: Dictionary of {term : term id} to extend (default: a new one)
+        :type vocabulary: `Dict`
+
+        :return: Index of the field
+        :rtype: class `FieldIndex`
+        """
+        vocabulary = {} if vocabulary is None else vocabulary
+        return cls.from_arrays(vocabulary, *encode_texts(texts, vocabulary))
+
+    def query_terms(self, terms):
+        """ Function to count the query terms and map them on the columns of the field
+
+        :param terms: Keywords of the proposal section
+        :type terms: `List`
+
+        :return: Tuple of (columns of in-vocabulary terms, their counts, counts of all the terms)
+        :rtype: `Tuple`
+        """
+        return count_query_terms(self.vocabulary, terms)
+
+
+def _normalize_rows(matrix):
+    """ L2-normalize the rows of a sparse matrix (empty rows are left at zero)
+
+    :param matrix: Sparse matrix
+    :type matrix: class `scipy.sparse.csr_matrix`
+
+    :return: Normalized matrix
+    :rtype: class `scipy.sparse.csr_matrix`
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms) @ matrix)
+
+
+class Scorer():
+    """ Base class of the scorers. A scorer turns the term counts of a field into a weight
+    matrix once (cached on the field) so that a query only costs one sparse product over
+    the columns of its terms.
+    """
+
+    name = None
+
+    def __init__(self, **params):
+        """ Constructor
+
+        :param params: Parameters of the scorer
+        :type params: `Dict`
+
+        :return: None
+        """
+        self.params = params
+
+    @property
+    def key(self):
+        return (self.name, tuple(sorted(self.params.items())))
+
+    def document_weights(self, field):
+        """ Weight matrix of the documents of the field (n_scholars x n_terms)
+
+        :param field: Index of the field
+        :type field: class `FieldIndex`
+
+        :return: Weight matrix
+        :rtype: class `scipy.sparse.csr_matrix`
+        """
+        raise NotImplementedError
+
+    def query_weights(self, field, cols, vals, all_counts):
+        """ Weights of the query terms found in the field
+
+        :param field: Index of the field
+        :type field: class `FieldIndex`
+        :param cols: Columns of the in-vocabulary query terms
+        :type cols: `numpy.ndarray`
+        :param vals: Counts of the in-vocabulary query terms
+        :type vals: `numpy.ndarray`
+        :param all_counts: Counts of all the query terms
+        :type all_counts: `numpy.ndarray`
+
+        :return: Weights of the in-vocabulary query terms
+        :rtype: `numpy.ndarray`
+        """
+        raise NotImplementedError
+
+    def score(self, field, terms, query=None):
+        """ Function to score every scholar of the field against the query terms
+
+        :param field: Index of the field
+        :type field: class `FieldIndex`
+        :param terms: Keywords of the proposal section
+        :type terms: `List`
+        :param query: Terms already mapped by `field.query_terms` (eg: once for all the fields sharing a vocabulary)
+        :type query: `Tuple`
+
+        :return: Score of each scholar
+        :rtype: `numpy.ndarray`
+        """
+        if self.key not in field.weights:
+            # Column slices are cheap on CSC
+            field.weights[self.key] = sp.csc_matrix(self.document_weights(field))
+        weights = field.weights[self.key]
+
+        cols, vals, all_counts = field.query_terms(terms) if query is None else query
+        if len(cols) == 0:
+            return np.zeros(field.n_docs)
+        query = self.query_weights(field, cols, vals, all_counts)
+        return np.asarray(weights[:, cols] @ query).ravel()
+
+
+class CounterCosineScorer(Scorer):
+    """ Cosine similarity of raw term counts (x100), identical to `helpers.counter_cosine_similarity`
+    """
+
+    name = 'counter_cosine'
+
+    def document_weights(self, field):
+        return _normalize_rows(field.tf)
+
+    def query_weights(self, field, cols, vals, all_counts):
+        return vals / math.sqrt((all_counts ** 2).sum()) * 100
+
+
+class TfidfScorer(Scorer):
+    """ Cosine similarity of TF-IDF vectors (x100), with smoothed IDF: log((1 + N) / (1 + df)) + 1
+    """
+
+    name = 'tfidf'
+
+    def idf(self, field, df):
+        return np.log((1.0 + field.n_docs) / (1.0 + df)) + 1.0
+
+    def document_weights(self, field):
+        return _normalize_rows(field.tf @ sp.diags(self.idf(field, field.df)))
+
+    def query_weights(self, field, cols, vals, all_counts):
+        # Terms unknown to the field have df = 0 and only count in the query norm
+        oov_norm = (all_counts ** 2).sum() - (vals ** 2).sum()
+        weights = vals * self.idf(field, field.df[cols])
+        norm = math.sqrt((weights ** 2).sum() + oov_norm * self.idf(field, 0) ** 2)
+        return weights / norm * 100
+
+
+class BM25Scorer(Scorer):
+    """ Okapi BM25 with parameters k1 and b
+    """
+
+    name = 'bm25'
+
+    def __init__(self, k1=1.2, b=0.75):
+        super().__init__(k1=k1, b=b)
+
+    def document_weights(self, field):
+        k1, b = self.params['k1'], self.params['b']
+        idf = np.log(1.0 + (field.n_docs - field.df + 0.5) / (field.df + 0.5))
+        avg_doc_len = field.avg_doc_len if field.avg_doc_len > 0 else 1.0
+
+        tf = field.tf.tocoo()
+        norm = k1 * (1 - b + b * field.doc_len[tf.row] / avg_doc_len)
+        data = idf[tf.col] * tf.data * (k1 + 1) / (tf.data + norm)
+        return sp.csr_matrix((data, (tf.row, tf.col)), shape=tf.shape)
+
+    def query_weights(self, field, cols, vals, all_counts):
+        return vals
+
+
+SCORERS = {
+    'counter_cosine': CounterCosineScorer,
+    'tfidf': TfidfScorer,
+    'bm25': BM25Scorer}
+
+
+def get_scorer(params):
+    """ Function to create the scorer selected in the SCORING section of the configuration file
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Scorer
+    :rtype: class `Scorer`
+    """
+    scoring = params.get('SCORING', {})
+    method = scoring.get('METHOD', 'counter_cosine')
+    if method == 'bm25':
+        return BM25Scorer(k1=scoring.get('BM25_K1', 1.2), b=scoring.get('BM25_B', 0.75))
+    return SCORERS[method]()
+
+
+def top_k_rows(scores, k):
+    """ Function to get the rows of the k highest scores, by partial selection instead of a full sort
+
+    :param scores: Score of each row
+    :type scores: `numpy.ndarray`
+    :param k: No of rows to select
+    :type k: `int`
+
+    :return: Rows of the k highest scores, highest first (ties broken by row)
+    :rtype: `numpy.ndarray`
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.lexsort((top, -scores[top]))]
+
+
+class ScoringIndex():
+    """ Per-field indexes of the AnalyticalDatabase, used to score all the scholars against a proposal.
+    The fields share one term dictionary, so the keywords of a proposal section are mapped to term ids
+    once for all the fields.
+    """
+
+    def __init__(self, user_ids, fields):
+        """ Constructor
+
+        :param user_ids: User IDs, in the order of the rows of the field indexes
+        :type user_ids: `numpy.ndarray`
+        :param fields: Dictionary of {field name : FieldIndex}
+        :type fields: `Dict`
+
+        :return: None
+        """
+        self.user_ids = user_ids
+        self.fields = fields
+        vocabularies = {id(field.vocabulary): field.vocabulary for field in fields.values()}
+        # None if the fields were built with their own vocabularies
+        self.vocabulary = next(iter(vocabularies.values())) if len(vocabularies) == 1 else None
+
+    @classmethod
+    def from_dataframe(cls, ad, columns=FEATURE_COLUMNS):
+        """ Function to build the index from the AnalyticalDatabase
+
+        :param ad: AnalyticalDatabase
+        :type ad: class `Pandas.DataFrame`
+        :param columns: Fields to be indexed
+        :type columns: `List`
+
+        :return: Index
+        :rtype: class `ScoringIndex`
+        """
+        vocabulary = {}
+        arrays = {col: encode_texts(ad[col].tolist(), vocabulary) for col in columns}
+        fields = {col: FieldIndex.from_arrays(vocabulary, *arrays[col]) for col in columns}
+        return cls(ad["user_id"].values, fields)
+
+    def save(self, path):
+        """ Function to atomically save the index to a `.npz` file: the user ids, the term dictionary
+        and, for every field, its rows of sorted (term id, count) arrays
+
+        :param path: Path of the `.npz` file
+        :type path: `str`
+
+        :return: None
+        """
+        if self.vocabulary is None:
+            raise ValueError("Only an index whose fields share their vocabulary can be saved")
+        user_ids = np.asarray(self.user_ids)
+        if user_ids.dtype == object:
+            user_ids = user_ids.astype(str)
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        terms[list(self.vocabulary.values())] = list(self.vocabulary)
+        arrays = {'user_ids': user_ids, 'terms': terms.astype(str), 'fields': np.array(list(self.fields))}
+        for name, field in self.fields.items():
+            arrays[name + '.indptr'] = field.tf.indptr.astype(np.int64)
+            arrays[name + '.term_ids'] = field.tf.indices.astype(np.int32)
+            arrays[name + '.counts'] = field.tf.data.astype(np.int32)
+
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Function to load an index saved by `save`
+
+        :param path: Path of the `.npz` file
+        :type path: `str`
+
+        :return: Index
+        :rtype: class `ScoringIndex`
+        """
+        with np.load(path, allow_pickle=False) as data:
+            vocabulary = {term: term_id for term_id, term in enumerate(data['terms'].tolist())}
+            fields = {name: FieldIndex.from_arrays(
+                vocabulary, data[name + '.indptr'], data[name + '.term_ids'], data[name + '.counts'])
+                for name in data['fields'].tolist()}
+            return cls(data['user_ids'], fields)
+
+    def queries(self, section_keys):
+        """ Function to map the keywords of every proposal section on the term ids of every field
+
+        :param section_keys: Dictionary of {proposal section : keywords}
+        :type section_keys: `Dict`
+
+        :return: Dictionary of {(field name, proposal section) : (term ids, their counts, counts of all the terms)}
+        :rtype: `Dict`
+        """
+        queries = {}
+        for section in PROPOSAL_SECTIONS:
+            terms = section_keys.get(section, [])
+            shared = count_query_terms(self.vocabulary, terms) if self.vocabulary is not None else None
+            for field_name, field in self.fields.items():
+                queries[(field_name, section)] = shared if shared is not None else field.query_terms(terms)
+        return queries
+
+    def score(self, section_keys, scorer, field_weights=None, section_weights=None):
+        """ Function to score all the scholars against the keywords of each proposal section
+
+        :param section_keys: Dictionary of {proposal section : keywords}
+        :type section_keys: `Dict`
+        :param scorer: Scorer used for every (field, section) pair
+        :type scorer: class `Scorer`
+        :param field_weights: Dictionary of {field name : weight}, missing fields weigh 1
+        :type field_weights: `Dict`
+        :param section_weights: Dictionary of {proposal section : weight}, missing sections weigh 1
+        :type section_weights: `Dict`
+
+        :return: Tuple of (weighted total score of each scholar, Dictionary of {similarity column : unweighted scores})
+        :rtype: `Tuple`
+        """
+        field_weights = field_weights or {}
+        section_weights = section_weights or {}
+
+        total = np.zeros(len(self.user_ids))
+        breakdown = {}
+        queries = self.queries(section_keys)
+        for field_name, field in self.fields.items():
+            for section in PROPOSAL_SECTIONS:
+                scores = scorer.score(field, section_keys.get(section, []), queries[(field_name, section)])
+                breakdown[field_name + "_" + section + "_sim"] = scores
+                weight = field_weights.get(field_name, 1.0) * \
+                    section_weights.get(section, 1.0)
+                if weight:
+                    total += weight * scores
+        return total, breakdown
+
+
+def load_scoring_index(analytical_path, terms_path=None):
+    """ Function to get the scoring index of the AnalyticalDatabase. The index (and the
+    document weights computed by the scorers) is cached until the file changes on disk.
+    The term id arrays saved by create_analytical_data (`terms_path`) are loaded instead of
+    the CSV when they are at least as recent as it.
+
+    :param analytical_path: Path of the AnalyticalDatabase CSV file
+    :type analytical_path: `str`
+    :param terms_path: Path of the `.npz` file saved by `ScoringIndex.save`
+    :type terms_path: `str`
+
+    :return: Index
+    :rtype: class `ScoringIndex`
+    """
+    mtime = os.path.getmtime(analytical_path)
+    terms_mtime = os.path.getmtime(terms_path) if terms_path and os.path.exists(terms_path) else None
+    cached = _INDEX_CACHE.get(analytical_path)
+    if cached is not None and cached[0] == (mtime, terms_mtime):
+        CACHE_REQUESTS.inc('scoring_index', 'hit')
+        return cached[1]
+
+    CACHE_REQUESTS.inc('scoring_index', 'miss')
+    if terms_mtime is not None and terms_mtime >= mtime:
+        index = ScoringIndex.load(terms_path)
+    else:
+        index = ScoringIndex.from_dataframe(pd.read_csv(analytical_path))
+    _INDEX_CACHE[analytical_path] = ((mtime, terms_mtime), index)
+    return index
@@ -0,0 +1,459 @@
+import os
+import sys
+import yaml
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from helpers import atomic_output, get_datetime_series, read_table
+from automatic_keyword_generator import get_sentence_model
+from metrics import CACHE_REQUESTS
+from tenants import get_tenant_output_path
+from vector_store import VECTOR_STORES
+
+
+SEMANTIC_FIELDS = ['profile', 'publications']
+
+_SEMANTIC_CACHE = {}
+
+
+def get_semantic_params(params):
+    """ Function to read the SEMANTIC section of the configuration file with its defaults
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Semantic parameters
+    :rtype: `Dict`
+    """
+    semantic = {
+        'ENABLED': False,
+        'MODEL': 'distilbert-base-nli-mean-tokens',
+        'DEVICE': 'cpu',
+        'BATCH_SIZE': 64,
+        'DTYPE': 'float16',
+        'INDEX': 'hnsw',
+        'CANDIDATES': 200,
+        'ALPHA': 0.5,
+        'FILENAME_PREFIX': 'scholar_embeddings'}
+    semantic.update(params.get('SEMANTIC', {}))
+    return semantic
+
+
+def embed_texts(model, texts, output_file, batch_size=64, dtype='float16'):
+    """ Function to embed texts in batches on CPU, straight into a memory-mapped `.npy` matrix.
+    The embeddings are L2-normalized so that a dot product is a cosine similarity.
+
+    :param model: SentenceTransformer model
+    :type model: class `SentenceTransformer`
+    :param texts: Texts to be embedded
+    :type texts: `List`
+    :param output_file: Path of the `.npy` file
+    :type output_file: `str`
+    :param batch_size: No of texts encoded at a time
+    :type batch_size: `int`
+    :param dtype: Storage type of the matrix (float16 or float32)
+    :type dtype: `str`
+
+    :return: None
+    """
+    dim = model.get_sentence_embedding_dimension()
+    with atomic_output(output_file) as tmp_path:
+        matrix = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=dtype, shape=(len(texts), dim))
+        for start in range(0, len(texts), batch_size):
+            batch = model.encode(
+                texts[start:start + batch_size],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True)
+            matrix[start:start + len(batch)] = batch.astype(dtype)
+        matrix.flush()
+        del matrix
+
+
+def iter_float32(embeddings, chunk_size=65536):
+    """ Function to iterate over a (memory-mapped) matrix as float32 chunks
+
+    :param embeddings: Matrix
+    :type embeddings: `numpy.ndarray`
+    :param chunk_size: No of rows per chunk
+    :type chunk_size: `int`
+
+    :return: Generator of (first row, float32 chunk)
+    """
+    for start in range(0, embeddings.shape[0], chunk_size):
+        yield start, np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+
+
+class ExactIndex():
+    """ Brute force inner product search over the memory-mapped embeddings
+    """
+
+    name = 'exact'
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    @classmethod
+    def build(cls, embeddings, path):
+        return cls(embeddings)
+
+    @classmethod
+    def load(cls, embeddings, path):
+        return cls(embeddings)
+
+    def search(self, query, k):
+        sims = np.concatenate([chunk @ query for _, chunk in iter_float32(self.embeddings)])
+        k = min(k, len(sims))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows = np.argpartition(-sims, k - 1)[:k]
+        return rows, sims[rows]
+
+
+class HNSWIndex():
+    """ Approximate nearest neighbour search with a HNSW graph (hnswlib)
+    """
+
+    name = 'hnsw'
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def build(cls, embeddings, path, m=16, ef_construction=200):
+        import hnswlib
+        index = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+        index.init_index(max_elements=max(embeddings.shape[0], 1),
+                         ef_construction=ef_construction, M=m)
+        for start, chunk in iter_float32(embeddings):
+            index.add_items(chunk, np.arange(start, start + len(chunk)))
+        with atomic_output(path) as tmp_path:
+            index.save_index(tmp_path)
+        return cls(index)
+
+    @classmethod
+    def load(cls, embeddings, path):
+        import hnswlib
+        index = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+        index.load_index(path, max_elements=embeddings.shape[0])
+        return cls(index)
+
+    def search(self, query, k):
+        k = min(k, self.index.get_current_count())
+        self.index.set_ef(max(64, k))
+        labels, distances = self.index.knn_query(query[np.newaxis, :], k=k)
+        # hnswlib returns 1 - inner product for the 'ip' space
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+
+class IVFIndex():
+    """ Approximate nearest neighbour search with an inverted file index (faiss)
+    """
+
+    name = 'ivf'
+
+    def __init__(self, index, nprobe=8):
+        self.index = index
+        self.index.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, path):
+        import faiss
+        dim = embeddings.shape[1]
+        nlist = max(1, int(4 * np.sqrt(embeddings.shape[0])))
+        index = faiss.IndexIVFFlat(
+            faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        # A sample is enough to learn the coarse centroids
+        index.train(np.asarray(embeddings[:100000], dtype=np.float32))
+        for _, chunk in iter_float32(embeddings):
+            index.add(chunk)
+        with atomic_output(path) as tmp_path:
+            faiss.write_index(index, tmp_path)
+        return cls(index)
+
+    @classmethod
+    def load(cls, embeddings, path):
+        import faiss
+        return cls(faiss.read_index(path))
+
+    def search(self, query, k):
+        sims, rows = self.index.search(query[np.newaxis, :].astype(np.float32), k)
+        keep = rows[0] >= 0
+        return rows[0][keep], sims[0][keep]
+
+
+ANN_INDEXES = {
+    'exact': ExactIndex,
+    'hnsw': HNSWIndex,
+    'ivf': IVFIndex}
+# Compact stores (int8 / product quantization) searched with float16 re-ranking
+ANN_INDEXES.update(VECTOR_STORES)
+
+
+class SemanticIndex():
+    """ Embeddings of one scholar field (memory-mapped) with the nearest neighbour index built on them
+    """
+
+    def __init__(self, user_ids, embeddings, ann):
+        """ Constructor
+
+        :param user_ids: User IDs, in the order of the rows of the embeddings
+        :type user_ids: `numpy.ndarray`
+        :param embeddings: Memory-mapped embedding matrix
+        :type embeddings: `numpy.memmap`
+        :param ann: Nearest neighbour index
+        :type ann: class `ExactIndex`, `HNSWIndex`, `IVFIndex` or `QuantizedStore`
+
+        :return: None
+        """
+        self.user_ids = user_ids
+        self.embeddings = embeddings
+        self.ann = ann
+
+    @staticmethod
+    def paths(output_path, prefix, field, index_type):
+        base = os.path.join(output_path, prefix + '_' + field)
+        return base + '_ids.npy', base + '.npy', base + '.' + index_type
+
+    @classmethod
+    def load(cls, output_path, prefix, field, index_type):
+        """ Function to load the index of a field. Falls back to exact search
+        when the ANN library or the ANN file is not available.
+
+        :param output_path: Directory of the embedding files
+        :type output_path: `str`
+        :param prefix: Prefix of the embedding files
+        :type prefix: `str`
+        :param field: Scholar field ('profile' or 'publications')
+        :type field: `str`
+        :param index_type: Type of nearest neighbour index ('hnsw', 'ivf', 'int8', 'pq' or 'exact')
+        :type index_type: `str`
+
+        :return: Index of the field
+        :rtype: class `SemanticIndex`
+        """
+        ids_path, emb_path, ann_path = cls.paths(output_path, prefix, field, index_type)
+        try:
+            user_ids = np.load(ids_path, allow_pickle=False)
+        except ValueError:
+            raise ValueError("%s holds pickled user ids (older version): rebuild the embeddings "
+                             "with semantic_index.py" % ids_path)
+        embeddings = np.load(emb_path, mmap_mode='r')
+        try:
+            ann = ANN_INDEXES[index_type].load(embeddings, ann_path)
+        except (ImportError, OSError, RuntimeError):
+            print("Falling back to exact search for", field)
+            ann = ExactIndex(embeddings)
+        return cls(user_ids, embeddings, ann)
+
+    def search(self, query, k):
+        """ Function to get the k nearest scholars of the query
+
+        :param query: Normalized query embedding
+        :type query: `numpy.ndarray`
+        :param k: No of neighbours
+        :type k: `int`
+
+        :return: Tuple of (User IDs, cosine similarities)
+        :rtype: `Tuple`
+        """
+        rows, sims = self.ann.search(np.asarray(query, dtype=np.float32), k)
+        return self.user_ids[rows], sims
+
+
+def get_profile_texts(user_df):
+    """ Function to compose the profile text (Keywords and Overview) of each scholar
+
+    :param user_df: Scholars dataset
+    :type user_df: class `Pandas.DataFrame`
+
+    :return: Profile texts
+    :rtype: `List`
+    """
+    keywords = user_df["Keywords"].fillna("").str.replace("||", ", ", regex=False)
+    overview = user_df["Overview"].fillna("")
+    return (keywords + ". " + overview).str.strip(". ").tolist()
+
+
+def get_publication_texts(pub_df, user_ids, top_n=5):
+    """ Function to compose the text of the top N most recent publication titles of each scholar
+
+    :param pub_df: Publication dataset
+    :type pub_df: class `Pandas.DataFrame`
+    :param user_ids: User IDs of the scholars
+    :type user_ids: `List`
+    :param top_n: No of titles used per scholar
+    :type top_n: `int`
+
+    :return: Publication texts, in the order of user_ids
+    :rtype: `List`
+    """
+    pubs = pub_df[["user_id", "title", "publicationDate"]].dropna(subset=["title"]).copy()
+    pubs["publication_dt"] = get_datetime_series(pubs["publicationDate"])
+    pubs = pubs.sort_values(["user_id", "publication_dt"], ascending=[True, False], kind="mergesort")
+    titles = pubs.groupby("user_id")["title"].apply(
+        lambda x: ". ".join(x.astype(str).values[:top_n]))
+    return titles.reindex(user_ids).fillna("").tolist()
+
+
+def build_semantic_indexes(params, output_path):
+    """ Function to embed the profiles and the publication titles of all scholars and
+    build a nearest neighbour index for each of them. The rows of the embeddings follow
+    the user ids of the AnalyticalDatabase, like the keyword scoring index.
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param output_path: Directory of the datasets, where the embedding files are written
+    :type output_path: `str`
+
+    :return: None
+    """
+    semantic = get_semantic_params(params)
+    user_ids = pd.read_csv(
+        os.path.join(output_path, params["ANALYTICAL_DATSET"]),
+        usecols=["user_id"])["user_id"].values
+    user_df = pd.read_csv(os.path.join(output_path, params["SCHOLARS_DATASET"]))
+    user_df = user_df.drop_duplicates("User_id").set_index(
+        "User_id").reindex(user_ids).rename_axis("User_id").reset_index()
+    pub_df = read_table(os.path.join(output_path, params["PUBLICATION_DATASET"]),
+                        columns=["user_id", "title", "publicationDate"])
+
+    texts = {
+        'profile': get_profile_texts(user_df),
+        'publications': get_publication_texts(pub_df, user_ids)}
+    model = get_sentence_model(semantic['MODEL'], semantic['DEVICE'])
+
+    for field in SEMANTIC_FIELDS:
+        ids_path, emb_path, ann_path = SemanticIndex.paths(
+            output_path, semantic['FILENAME_PREFIX'], field, semantic['INDEX'])
+        print("Embedding", len(texts[field]), "texts for", field)
+        embed_texts(model, texts[field], emb_path,
+                    batch_size=semantic['BATCH_SIZE'], dtype=semantic['DTYPE'])
+        # Saved as a str array (as ScoringIndex.save does): loaded without pickle
+        ids = np.asarray(user_ids)
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        with atomic_output(ids_path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, ids, allow_pickle=False)
+        try:
+            ANN_INDEXES[semantic['INDEX']].build(np.load(emb_path, mmap_mode='r'), ann_path)
+        except ImportError:
+            print("Library for the", semantic['INDEX'], "index is not installed, exact search will be used")
+
+
+def load_semantic_indexes(params, output_path):
+    """ Function to get the semantic indexes of all fields, cached until the embedding files change
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param output_path: Directory of the embedding files
+    :type output_path: `str`
+
+    :return: Dictionary of {field : SemanticIndex}
+    :rtype: `Dict`
+    """
+    semantic = get_semantic_params(params)
+    key = (output_path, semantic['FILENAME_PREFIX'], semantic['INDEX'])
+    mtimes = tuple(os.path.getmtime(SemanticIndex.paths(
+        output_path, semantic['FILENAME_PREFIX'], field, semantic['INDEX'])[1])
+        for field in SEMANTIC_FIELDS)
+    cached = _SEMANTIC_CACHE.get(key)
+    if cached is not None and cached[0] == mtimes:
+        CACHE_REQUESTS.inc('semantic_index', 'hit')
+        return cached[1]
+
+    CACHE_REQUESTS.inc('semantic_index', 'miss')
+    indexes = {field: SemanticIndex.load(output_path, semantic['FILENAME_PREFIX'], field, semantic['INDEX'])
+               for field in SEMANTIC_FIELDS}
+    _SEMANTIC_CACHE[key] = (mtimes, indexes)
+    return indexes
+
+
+def semantic_scores(indexes, query_text, user_ids, params):
+    """ Function to compute the semantic similarity of every scholar to the proposal.
+    Only the nearest CANDIDATES scholars of each field are retrieved, others score 0.
+    The score of a scholar is the mean of its (non-negative) cosine similarities over the fields.
+
+    :param indexes: Dictionary of {field : SemanticIndex}
+    :type indexes: `Dict`
+    :param query_text: Text of the proposal
+    :type query_text: `str`
+    :param user_ids: User IDs in the order of the returned scores
+    :type user_ids: `numpy.ndarray`
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Semantic score of each scholar, between 0 and 1
+    :rtype: `numpy.ndarray`
+    """
+    semantic = get_semantic_params(params)
+    model = get_sentence_model(semantic['MODEL'], semantic['DEVICE'])
+    query = model.encode([query_text], convert_to_numpy=True,
+                         normalize_embeddings=True)[0]
+
+    positions = pd.Index(user_ids)
+    scores = np.zeros(len(user_ids))
+    for field, index in indexes.items():
+        ids, sims = index.search(query, semantic['CANDIDATES'])
+        rows = positions.get_indexer(ids)
+        keep = rows >= 0
+        scores[rows[keep]] += np.clip(sims[keep], 0, None)
+    return scores / max(len(indexes), 1)
+
+
+def hybrid_score(keyword_scores, semantic, alpha):
+    """ Function to blend the keyword scores with the semantic scores.
+    Keyword scores are scaled by their maximum so that both are between 0 and 1.
+
+    :param keyword_scores: Keyword scores of each scholar
+    :type keyword_scores: `numpy.ndarray`
+    :param semantic: Semantic scores of each scholar
+    :type semantic: `numpy.ndarray`
+    :param alpha: Weight of the semantic score (0 = keywords only, 1 = semantic only)
+    :type alpha: `float`
+
+    :return: Blended scores (x100)
+    :rtype: `numpy.ndarray`
+    """
+    top = keyword_scores.max() if len(keyword_scores) else 0
+    keyword_norm = keyword_scores / top if top > 0 else keyword_scores
+    return ((1 - alpha) * keyword_norm + alpha * semantic) * 100
+
+
+if __name__ == "__main__":
+
+    # Read arguments from command line (cmd). If no input via cmd, use config
+    # file
+    parser = argparse.ArgumentParser(description="Parameter file")
+    parser.add_argument(
+        '--config_file',
+        metavar='FILENAME',
+        type=str,
+        default='config.yml',
+        help='Parameter file name in yaml format')
+    parser.add_argument(
+        '--univ_name',
+        metavar='UNIV_NAME',
+        type=str,
+        default='TAMU',
+        choices=[
+            'TAMU',
+            'UFL'],
+        help='NAME of University')
+    args = parser.parse_args()
+
+    print("\n\nBuilding semantic indexes")
+
+    try:
+        params = yaml.safe_load(open(args.config_file))
+    except BaseException:
+        print(f'Error loading parameter file: {args.config_file}.')
+        sys.exit(1)
+
+    build_semantic_indexes(params, get_tenant_output_path(params, args.univ_name))
+
+    print("TASK COMPLETED : Successfully built semantic indexes")
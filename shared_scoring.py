@@ -0,0 +1,335 @@
+import atexit
+import threading
+from contextlib import contextmanager
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse as sp
+
+from scoring import PROPOSAL_SECTIONS
+
+
+_POOLS = {}
+# Pools of a previous version of an index, closed when their last request releases them
+_RETIRED = set()
+_POOLS_LOCK = threading.Lock()
+# One lock per pool key: a pool is built outside _POOLS_LOCK, the requests of other pools are not blocked
+_BUILD_LOCKS = {}
+# The workers are not forked from the (threaded) server process
+_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+_worker_matrices = {}
+_worker_output = {}
+
+
+class SharedMatrix():
+    """ CSC matrix whose indptr / indices / data arrays live in shared memory blocks.
+    Workers attach to the blocks by name: the matrix is never pickled or copied between processes.
+    """
+
+    def __init__(self, matrix):
+        """ Constructor: copy the arrays of the matrix into new shared memory blocks
+
+        :param matrix: Sparse matrix
+        :type matrix: class `scipy.sparse.csc_matrix`
+
+        :return: None
+        """
+        matrix = sp.csc_matrix(matrix)
+        self.shape = matrix.shape
+        self.blocks = []
+        self.arrays = {}
+        for name in ('indptr', 'indices', 'data'):
+            array = getattr(matrix, name)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[:] = array
+            self.blocks.append(block)
+            self.arrays[name] = (block.name, array.dtype.str, array.shape)
+
+    def spec(self):
+        """ Description of the blocks, the only thing sent to the workers
+
+        :return: Dictionary of {shape, arrays : {array name : (block name, dtype, shape)}}
+        :rtype: `Dict`
+        """
+        return {'shape': self.shape, 'arrays': self.arrays}
+
+    def close(self):
+        """ Function to release and remove the shared memory blocks
+
+        :return: None
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach(spec):
+    """ Function to map a matrix published by `SharedMatrix` without copying it
+
+    :param spec: Description of the blocks as returned by `SharedMatrix.spec`
+    :type spec: `Dict`
+
+    :return: Tuple of (matrix, shared memory blocks to be kept alive)
+    :rtype: `Tuple`
+    """
+    blocks, arrays = [], {}
+    for name, (block_name, dtype, shape) in spec['arrays'].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    matrix = sp.csc_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']), shape=spec['shape'], copy=False)
+    return matrix, blocks
+
+
+def _init_worker(specs, output_spec):
+    """ Pool initializer: attach every block and the output array once per worker process
+
+    :param specs: Dictionary of {(field name, first row) : spec}
+    :type specs: `Dict`
+    :param output_spec: (block name, shape) of the output array
+    :type output_spec: `Tuple`
+
+    :return: None
+    """
+    for key, spec in specs.items():
+        _worker_matrices[key] = attach(spec)
+    block = shared_memory.SharedMemory(name=output_spec[0])
+    _worker_output['array'] = np.ndarray(output_spec[1], dtype=np.float64, buffer=block.buf)
+    _worker_output['block'] = block
+
+
+def _score_rows(field_name, start, queries):
+    """ Worker task: score the rows of one block of a field against the query of every section.
+    The scores are written to the shared output array, nothing is sent back.
+
+    :param field_name: Name of the field
+    :type field_name: `str`
+    :param start: First row of the block
+    :type start: `int`
+    :param queries: List of (row of the output array, query columns, query weights)
+    :type queries: `List`
+
+    :return: None
+    """
+    weights = _worker_matrices[(field_name, start)][0]
+    output = _worker_output['array']
+    for out_row, cols, query in queries:
+        output[out_row, start:start + weights.shape[0]] = weights[:, cols] @ query
+
+
+class SharedScoringPool():
+    """ Scores a `ScoringIndex` with several processes. The document weights of every field are
+    computed once, split in blocks of rows (CSC, so that the columns of the query terms are cheap to
+    gather), published in shared memory and attached by the workers when the pool starts.
+    A recommendation only sends block ids and the (sparse) query weights to the workers.
+    """
+
+    def __init__(self, index, scorer, n_processes, chunk_rows=None):
+        """ Constructor
+
+        :param index: Index of the AnalyticalDatabase
+        :type index: class `scoring.ScoringIndex`
+        :param scorer: Scorer used for every (field, section) pair
+        :type scorer: class `scoring.Scorer`
+        :param n_processes: No of worker processes
+        :type n_processes: `int`
+        :param chunk_rows: No of rows per block (default: one block per process)
+        :type chunk_rows: `int`
+
+        :return: None
+        """
+        self.index = index
+        self.scorer = scorer
+        self.n_processes = n_processes
+        n_docs = len(index.user_ids)
+        self.chunk_rows = chunk_rows or max(1, -(-n_docs // n_processes))
+        self.starts = list(range(0, n_docs, self.chunk_rows))
+        self.matrices = {}
+        self.output_block = None
+        self.pool = None
+        self.lock = threading.Lock()
+        # No of requests using the pool, guarded by _POOLS_LOCK
+        self.users = 0
+
+        try:
+            for field_name, field in index.fields.items():
+                weights = sp.csr_matrix(scorer.document_weights(field))
+                for start in self.starts:
+                    self.matrices[(field_name, start)] = SharedMatrix(
+                        weights[start:start + self.chunk_rows])
+
+            # One row of scores per similarity column
+            self.columns = [field_name + "_" + section + "_sim"
+                            for field_name in index.fields for section in PROPOSAL_SECTIONS]
+            shape = (len(self.columns), n_docs)
+            self.output_block = shared_memory.SharedMemory(
+                create=True, size=max(8 * shape[0] * shape[1], 1))
+            self.output = np.ndarray(shape, dtype=np.float64, buffer=self.output_block.buf)
+
+            self.pool = _CONTEXT.Pool(
+                n_processes,
+                initializer=_init_worker,
+                initargs=({key: matrix.spec() for key, matrix in self.matrices.items()},
+                          (self.output_block.name, shape)))
+        except BaseException:
+            # Do not leave the blocks created so far in /dev/shm
+            self.close()
+            raise
+
+    def tasks(self, section_keys):
+        """ Function to build the worker tasks of a query
+
+        :param section_keys: Dictionary of {proposal section : keywords}
+        :type section_keys: `Dict`
+
+        :return: List of (field name, first row of the block, queries)
+        :rtype: `List`
+        """
+        tasks = []
+        section_queries = self.index.queries(section_keys)
+        for field_name, field in self.index.fields.items():
+            queries = []
+            for section in PROPOSAL_SECTIONS:
+                cols, vals, all_counts = section_queries[(field_name, section)]
+                if len(cols):
+                    queries.append((self.columns.index(field_name + "_" + section + "_sim"), cols,
+                                    self.scorer.query_weights(field, cols, vals, all_counts)))
+            if not queries:
+                continue
+            for start in self.starts:
+                tasks.append((field_name, start, queries))
+        return tasks
+
+    def score(self, section_keys, field_weights=None, section_weights=None):
+        """ Same as `ScoringIndex.score`, computed by the workers
+
+        :param section_keys: Dictionary of {proposal section : keywords}
+        :type section_keys: `Dict`
+        :param field_weights: Dictionary of {field name : weight}, missing fields weigh 1
+        :type field_weights: `Dict`
+        :param section_weights: Dictionary of {proposal section : weight}, missing sections weigh 1
+        :type section_weights: `Dict`
+
+        :return: Tuple of (weighted total score of each scholar, Dictionary of {similarity column : unweighted scores})
+        :rtype: `Tuple`
+        """
+        field_weights = field_weights or {}
+        section_weights = section_weights or {}
+
+        n_docs = len(self.index.user_ids)
+        # The output array is shared by the requests: one query at a time
+        with self.lock:
+            self.output[:] = 0
+            self.pool.starmap(_score_rows, self.tasks(section_keys))
+            breakdown = {col: self.output[row].copy() for row, col in enumerate(self.columns)}
+
+        total = np.zeros(n_docs)
+        for field_name in self.index.fields:
+            for section in PROPOSAL_SECTIONS:
+                weight = field_weights.get(field_name, 1.0) * \
+                    section_weights.get(section, 1.0)
+                if weight:
+                    total += weight * breakdown[field_name + "_" + section + "_sim"]
+        return total, breakdown
+
+    def close(self):
+        """ Function to stop the workers and remove the shared memory blocks
+        (also called on a pool whose construction failed half way)
+
+        :return: None
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        for matrix in self.matrices.values():
+            matrix.close()
+        self.matrices = {}
+        if self.output_block is not None:
+            self.output = None
+            self.output_block.close()
+            self.output_block.unlink()
+            self.output_block = None
+
+
+@contextmanager
+def get_scoring_pool(index, scorer, n_processes, name=None):
+    """ Context manager which yields the pool scoring an index, started once per (index, scorer).
+    When the index is reloaded, the pool of its previous version is retired: requests still
+    scoring on it finish first, and it is closed when the last one leaves the block.
+    Indexes of different universities (`name`) get their own pools.
+
+    :param index: Index of the AnalyticalDatabase
+    :type index: class `scoring.ScoringIndex`
+    :param scorer: Scorer used for every (field, section) pair
+    :type scorer: class `scoring.Scorer`
+    :param n_processes: No of worker processes
+    :type n_processes: `int`
+    :param name: Name of the index (eg: the university)
+    :type name: `str`
+
+    :return: Pool
+    :rtype: class `SharedScoringPool`
+    """
+    key = (name, scorer.key, n_processes)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is not None and pool.index is index:
+            pool.users += 1
+        else:
+            pool = None
+            build_lock = _BUILD_LOCKS.setdefault(key, threading.Lock())
+
+    if pool is None:
+        # Only the requests of this pool wait for the new one to start
+        with build_lock:
+            with _POOLS_LOCK:
+                pool = _POOLS.get(key)
+                if pool is not None and pool.index is index:
+                    # Started by another request while this one was waiting
+                    pool.users += 1
+                else:
+                    pool = None
+            if pool is None:
+                pool = SharedScoringPool(index, scorer, n_processes)
+                retired = None
+                with _POOLS_LOCK:
+                    previous = _POOLS.get(key)
+                    _POOLS[key] = pool
+                    pool.users += 1
+                    if previous is not None:
+                        if previous.users:
+                            _RETIRED.add(previous)
+                        else:
+                            retired = previous
+                if retired is not None:
+                    retired.close()
+
+    try:
+        yield pool
+    finally:
+        with _POOLS_LOCK:
+            pool.users -= 1
+            closing = pool in _RETIRED and not pool.users
+            if closing:
+                _RETIRED.discard(pool)
+        if closing:
+            pool.close()
+
+
+@atexit.register
+def close_scoring_pools():
+    """ Function to close all the pools (the shared memory outlives the process otherwise)
+
+    :return: None
+    """
+    for pool in list(_POOLS.values()) + list(_RETIRED):
+        pool.close()
+    _POOLS.clear()
+    _RETIRED.clear()
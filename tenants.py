@@ -0,0 +1,90 @@
+""" Universities (tenants) built and served by one deployment.
+
+The proposal data (Grants.gov extract, agency pages and their keywords) does not depend on the
+university: it stays in `OUTPUT_PATH` and is shared by all of them. The scholar datasets and indexes
+of a university go to the `OUTPUT_PATH` of its `UNIV_DETAILS` entry, so that several universities
+can be built side by side and served by the same process. A university without one keeps its
+scholar data in `OUTPUT_PATH` (single university deployments); two universities sharing a folder
+would overwrite each other's files, so such a configuration is rejected.
+"""
+import os
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_tenants(params):
+    """ Function to get the universities of the configuration file
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Names of the universities
+    :rtype: `List`
+    """
+    get_tenant_output_paths(params)
+    return list(params.get('UNIV_DETAILS', {}))
+
+
+def get_tenant_output_paths(params):
+    """ Function to get the folder of the scholar data of every university, checking that no two
+    universities share one
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Dictionary of {university : absolute path of the folder}
+    :rtype: `Dict`
+    """
+    paths = {}
+    owners = {}
+    for univ_name, details in params.get('UNIV_DETAILS', {}).items():
+        path = os.path.normpath(os.path.join(BASE_DIR, details.get('OUTPUT_PATH', params['OUTPUT_PATH'])))
+        if path in owners:
+            raise ValueError("Universities %s and %s have the same OUTPUT_PATH (%s): give each one its own folder "
+                             "in UNIV_DETAILS" % (owners[path], univ_name, path))
+        owners[path] = univ_name
+        paths[univ_name] = path
+    return paths
+
+
+def get_default_tenant(params):
+    """ Function to get the university used when none is given (`DEFAULT_UNIV`, else the first one)
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Name of the university
+    :rtype: `str`
+    """
+    return params.get('DEFAULT_UNIV') or get_tenants(params)[0]
+
+
+def get_shared_output_path(params):
+    """ Function to get the folder of the data shared by all the universities
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+
+    :return: Absolute path of the folder
+    :rtype: `str`
+    """
+    return os.path.join(BASE_DIR, params['OUTPUT_PATH'])
+
+
+def get_tenant_output_path(params, univ_name=None):
+    """ Function to get the folder of the scholar datasets and indexes of a university
+
+    :param params: Parameters read from the configuration file
+    :type params: `Dict`
+    :param univ_name: Name of the university (default: `get_default_tenant`)
+    :type univ_name: `str`
+
+    :return: Absolute path of the folder
+    :rtype: `str`
+    """
+    univ_name = univ_name or get_default_tenant(params)
+    paths = get_tenant_output_paths(params)
+    if univ_name not in paths:
+        raise KeyError("Unknown university: %s" % univ_name)
+    return paths[univ_name]
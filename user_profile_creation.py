@@ -4,14 +4,15 @@ import sys
 import json
 import yaml
 import argparse
-import requests
+import http_client
 
 import pandas as pd
 import numpy as np
 
 from tqdm import tqdm
 
-from helpers import extract_json, save_pandas_to_csv
+from helpers import extract_json, save_pandas_to_csv, save_pandas_to_parquet
+from tenants import get_tenant_output_path
 
 import pdb
 
@@ -41,23 +42,29 @@ class extract_user_profiles():
 
         :param univ_name: Name of the univeristy
         :type univ_name: `str`
+        :param output_path: Folder of the datasets (default: the folder of the university, see `tenants.py`)
+        :type output_path: `str`
         
         :return: None
         """
 
-        self.output_path = params['OUTPUT_PATH'] if output_path == '' else output_path
-        self.output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.output_path )
-        self.profile_url = params['UNIV_DETAILS'][args.univ_name]['PROFILE_URL']
-        self.base_url = params['UNIV_DETAILS'][args.univ_name]['BASE_URL']
-        self.end_url = params['UNIV_DETAILS'][args.univ_name]['END_URL']
+        if output_path == '':
+            self.output_path = get_tenant_output_path(params, univ_name)
+        else:
+            self.output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_path)
+        self.profile_url = params['UNIV_DETAILS'][univ_name]['PROFILE_URL']
+        self.base_url = params['UNIV_DETAILS'][univ_name]['BASE_URL']
+        self.end_url = params['UNIV_DETAILS'][univ_name]['END_URL']
+        http_client.configure_http(params)
         self.sub_json = extract_json(self.base_url, self.end_url, 1)
         self.n_scholars = self.sub_json['page']['totalElements']
         self.scholars_dataset = params['SCHOLARS_DATASET']
+        self.publication_ids_dataset = params['SCHOLAR_PUBLICATION_IDS']
         print("Total Scholars: ", self.n_scholars)
 
         # path = os.path.join(os.getcwd(), "Test_Folder")
         if not os.path.exists(self.output_path):
-            os.mkdir(self.output_path)
+            os.makedirs(self.output_path)
 
     def extract_info(self, url, user_id):
         """ Function to extract a particular user's information from general university URL  
@@ -76,8 +83,7 @@ class extract_user_profiles():
             'accept': 'application/json, text/plain, */*'
         }
 
-        response = requests.request(
-            "GET", self.user_url, headers=headers, data=payload)
+        response = http_client.get(self.user_url, headers=headers, data=payload)
         response_str = response.text
         self.user_dict = json.loads(response_str)
 
@@ -196,6 +202,19 @@ class extract_user_profiles():
         except BaseException:
             return None
 
+    def get_publication_ids(self):
+        """ Function to get the IDs of the publications of the Scholar from University Page
+
+        :param None:
+
+        :return: Publication IDs of the Scholar
+        :rtype: `List`
+        """
+        try:
+            return [str(d["id"]) for d in self.user_dict["publications"] if "id" in d]
+        except BaseException:
+            return []
+
     def get_research(self):
         """ Function to Research areas of the Scholar from University Page 
 
@@ -356,17 +375,22 @@ class extract_user_profiles():
             'accept': 'application/json, text/plain, */*'
         }
 
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = http_client.get(url, headers=headers, data=payload)
         response_str = response.text
         user_dict = json.loads(response_str)
 
         # For each scholar, go to his/her summary page and extract relevant data
         user_list = []
+        pub_users, pub_ids = [], []
 
         # #TODELETE
         # user_ids = user_ids[:10]
         for idx in tqdm(user_ids):
             user_list.append(self.get_profile(self.profile_url, idx))
+            # Publication IDs of the scholar, kept as a (User_id, publication_id) table
+            ids = self.get_publication_ids()
+            pub_users.extend([str(idx)] * len(ids))
+            pub_ids.extend(ids)
 
         # Save User profiles
         df = pd.concat(user_list).reset_index(drop=True)
@@ -377,6 +401,11 @@ class extract_user_profiles():
                 self.output_path,
                 self.scholars_dataset),
             index=False)
+        save_pandas_to_parquet(
+            df=pd.DataFrame({"User_id": pub_users, "publication_id": pub_ids}),
+            output_path=os.path.join(
+                self.output_path,
+                self.publication_ids_dataset))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import numpy as np
+
+from helpers import atomic_output
+
+
+def save_array(path, array):
+    """ Function to atomically save an array in `.npy` format under exactly `path`
+
+    :param path: Path of the file
+    :type path: `str`
+    :param array: Array to be saved
+    :type array: `numpy.ndarray`
+
+    :return: None
+    """
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+
+
+def iter_chunks(matrix, chunk_size=65536, dtype=np.float32):
+    """ Function to iterate over a (memory-mapped) matrix by chunks of rows
+
+    :param matrix: Matrix
+    :type matrix: `numpy.ndarray`
+    :param chunk_size: No of rows per chunk
+    :type chunk_size: `int`
+    :param dtype: Type the chunks are converted to
+    :type dtype: `numpy.dtype`
+
+    :return: Generator of (first row, chunk)
+    """
+    for start in range(0, matrix.shape[0], chunk_size):
+        yield start, np.asarray(matrix[start:start + chunk_size], dtype=dtype)
+
+
+def kmeans(x, k, n_iter=20, seed=0):
+    """ Plain Lloyd's k-means, used to learn the product quantization codebooks
+
+    :param x: Training vectors (n x d)
+    :type x: `numpy.ndarray`
+    :param k: No of centroids
+    :type k: `int`
+    :param n_iter: No of iterations
+    :type n_iter: `int`
+    :param seed: Random seed
+    :type seed: `int`
+
+    :return: Centroids (k x d)
+    :rtype: `numpy.ndarray`
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_centroids(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        # Re-seed empty clusters with random training vectors
+        centroids[empty] = x[rng.choice(len(x), empty.sum())]
+    return centroids
+
+
+def assign_centroids(x, centroids):
+    """ Function to get the nearest centroid (L2) of each vector
+
+    :param x: Vectors (n x d)
+    :type x: `numpy.ndarray`
+    :param centroids: Centroids (k x d)
+    :type centroids: `numpy.ndarray`
+
+    :return: Index of the nearest centroid of each vector
+    :rtype: `numpy.ndarray`
+    """
+    distances = (centroids ** 2).sum(axis=1)[np.newaxis, :] - 2 * x @ centroids.T
+    return distances.argmin(axis=1)
+
+
+class QuantizedStore():
+    """ Base class of the compact vector stores. The codes are searched approximately,
+    then a shortlist is re-ranked exactly against the (float16, memory-mapped) embeddings.
+    All the files are loaded through memory maps so that several server workers share their pages.
+    """
+
+    name = None
+
+    def __init__(self, embeddings, codes, shortlist=200):
+        """ Constructor
+
+        :param embeddings: Memory-mapped embeddings used for re-ranking
+        :type embeddings: `numpy.memmap`
+        :param codes: Memory-mapped codes of the embeddings
+        :type codes: `numpy.memmap`
+        :param shortlist: No of candidates re-ranked with the embeddings
+        :type shortlist: `int`
+
+        :return: None
+        """
+        self.embeddings = embeddings
+        self.codes = codes
+        self.shortlist = shortlist
+
+    @property
+    def bytes_per_vector(self):
+        return self.codes.dtype.itemsize * int(np.prod(self.codes.shape[1:]))
+
+    def approximate_scores(self, query):
+        """ Approximate inner product of the query with every stored vector
+
+        :param query: Query vector
+        :type query: `numpy.ndarray`
+
+        :return: Approximate scores
+        :rtype: `numpy.ndarray`
+        """
+        raise NotImplementedError
+
+    def search(self, query, k):
+        """ Function to get the k stored vectors with the highest inner product with the query
+
+        :param query: Normalized query vector
+        :type query: `numpy.ndarray`
+        :param k: No of neighbours
+        :type k: `int`
+
+        :return: Tuple of (rows, inner products)
+        :rtype: `Tuple`
+        """
+        query = np.asarray(query, dtype=np.float32)
+        scores = self.approximate_scores(query)
+        n_candidates = min(max(k, self.shortlist), len(scores))
+        if n_candidates <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        candidates = np.sort(np.argpartition(-scores, n_candidates - 1)[:n_candidates])
+
+        exact = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-exact, k - 1)[:k]
+        return candidates[top], exact[top]
+
+
+class ScalarQuantizedStore(QuantizedStore):
+    """ int8 scalar quantization: each dimension is mapped linearly from its [min, max] range to 256 levels
+    """
+
+    name = 'int8'
+
+    def __init__(self, embeddings, codes, low, scale, shortlist=200):
+        super().__init__(embeddings, codes, shortlist)
+        self.low = low
+        self.scale = scale
+
+    @classmethod
+    def build(cls, embeddings, path, shortlist=200):
+        """ Function to quantize the embeddings and save the codes under `path`
+
+        :param embeddings: Embeddings (n x d)
+        :type embeddings: `numpy.ndarray`
+        :param path: Path of the codes, the quantizer parameters are saved next to it
+        :type path: `str`
+        :param shortlist: No of candidates re-ranked with the embeddings
+        :type shortlist: `int`
+
+        :return: Store
+        :rtype: class `ScalarQuantizedStore`
+        """
+        low = np.full(embeddings.shape[1], np.inf, dtype=np.float32)
+        high = np.full(embeddings.shape[1], -np.inf, dtype=np.float32)
+        for _, chunk in iter_chunks(embeddings):
+            low = np.minimum(low, chunk.min(axis=0))
+            high = np.maximum(high, chunk.max(axis=0))
+        scale = (high - low) / 255
+        scale[scale == 0] = 1.0
+
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        for start, chunk in iter_chunks(embeddings):
+            levels = np.rint((chunk - low) / scale)
+            codes[start:start + len(chunk)] = (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+        save_array(path, codes)
+        save_array(path + '.params.npy', np.stack([low, scale]))
+        return cls(embeddings, codes, low, scale, shortlist)
+
+    @classmethod
+    def load(cls, embeddings, path, shortlist=200):
+        low, scale = np.load(path + '.params.npy')
+        return cls(embeddings, np.load(path, mmap_mode='r'), low, scale, shortlist)
+
+    def approximate_scores(self, query):
+        # q . x ~= q . (low + scale * (code + 128))
+        weights = query * self.scale
+        offset = float(query @ self.low) + 128 * float(weights.sum())
+        return np.concatenate([chunk @ weights + offset
+                               for _, chunk in iter_chunks(self.codes)])
+
+
+class ProductQuantizedStore(QuantizedStore):
+    """ Product quantization: the vector is split into M sub-vectors, each one replaced by the
+    id (1 byte) of its nearest centroid among 256. Search uses asymmetric distance computation:
+    one lookup table of query / centroid inner products per sub-space.
+    """
+
+    name = 'pq'
+
+    def __init__(self, embeddings, codes, codebooks, shortlist=200):
+        super().__init__(embeddings, codes, shortlist)
+        self.codebooks = codebooks
+        self.splits = np.cumsum([c.shape[1] for c in codebooks])[:-1]
+
+    @classmethod
+    def build(cls, embeddings, path, n_subvectors=16, n_centroids=256,
+              n_train=50000, shortlist=200, seed=0):
+        """ Function to learn the codebooks, encode the embeddings and save the codes under `path`
+
+        :param embeddings: Embeddings (n x d)
+        :type embeddings: `numpy.ndarray`
+        :param path: Path of the codes, the codebooks are saved next to it
+        :type path: `str`
+        :param n_subvectors: No of sub-vectors (bytes per vector)
+        :type n_subvectors: `int`
+        :param n_centroids: No of centroids per sub-space (at most 256)
+        :type n_centroids: `int`
+        :param n_train: No of vectors sampled to learn the codebooks
+        :type n_train: `int`
+        :param shortlist: No of candidates re-ranked with the embeddings
+        :type shortlist: `int`
+        :param seed: Random seed
+        :type seed: `int`
+
+        :return: Store
+        :rtype: class `ProductQuantizedStore`
+        """
+        rng = np.random.default_rng(seed)
+        n = embeddings.shape[0]
+        sample = np.sort(rng.choice(n, min(n, n_train), replace=False))
+        train = np.asarray(embeddings[sample], dtype=np.float32)
+        sub_dims = np.array_split(np.arange(embeddings.shape[1]), n_subvectors)
+
+        codebooks = [kmeans(train[:, dims], n_centroids, seed=seed) for dims in sub_dims]
+        codes = np.empty((n, len(sub_dims)), dtype=np.uint8)
+        for start, chunk in iter_chunks(embeddings):
+            for m, dims in enumerate(sub_dims):
+                codes[start:start + len(chunk), m] = assign_centroids(
+                    chunk[:, dims], codebooks[m])
+
+        save_array(path, codes)
+        # One float32 array per sub-space: the sub-spaces differ in width when d is not a multiple of M
+        with atomic_output(path + '.codebooks.npz') as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **{'codebook_%d' % m: codebook.astype(np.float32)
+                               for m, codebook in enumerate(codebooks)})
+        return cls(embeddings, codes, codebooks, shortlist)
+
+    @classmethod
+    def load(cls, embeddings, path, shortlist=200):
+        with np.load(path + '.codebooks.npz', allow_pickle=False) as data:
+            codebooks = [data['codebook_%d' % m] for m in range(len(data.files))]
+        return cls(embeddings, np.load(path, mmap_mode='r'), codebooks, shortlist)
+
+    def approximate_scores(self, query):
+        tables = [codebook @ sub_query for codebook, sub_query in
+                  zip(self.codebooks, np.split(query, self.splits))]
+        scores = []
+        for _, chunk in iter_chunks(self.codes, dtype=np.intp):
+            chunk_scores = np.zeros(len(chunk), dtype=np.float32)
+            for m, table in enumerate(tables):
+                chunk_scores += table[chunk[:, m]]
+            scores.append(chunk_scores)
+        return np.concatenate(scores) if scores else np.zeros(0)
+
+
+VECTOR_STORES = {
+    'int8': ScalarQuantizedStore,
+    'pq': ProductQuantizedStore}
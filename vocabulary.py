@@ -0,0 +1,218 @@
+""" Interned token vocabulary of the scholar / proposal preprocessing.
+
+`helpers.tokenize` used to call the WordNet lemmatizer on every token of every text although a
+corpus only holds a few tens of thousands of distinct words. Each distinct token gets an integer id
+the first time it is seen; its stopword flag is stored with it and its lemma is computed once, on
+first use, and kept as the id of the lemma. The table can be saved to a `.npz` file so that the
+next run starts with the lemmas already known. Texts can also be kept as arrays of ids
+(`encode` / `decode`) instead of lists of strings.
+"""
+import os
+import hashlib
+
+import numpy as np
+
+
+class Vocabulary():
+    """ Table of {token : id} with the stopword flag and the lemma id of every token
+    """
+
+    def __init__(self, lemmatize, stopwords, lemmatizer_name=''):
+        """ Constructor
+
+        :param lemmatize: Function returning the lemma of a token
+        :type lemmatize: Function()
+        :param stopwords: Set of stopwords
+        :type stopwords: `Set`
+        :param lemmatizer_name: Name and version of the lemmatizer, saved with the table
+        :type lemmatizer_name: `str`
+
+        :return: None
+        """
+        self.lemmatize = lemmatize
+        self.stopwords = stopwords
+        self.signature = self.get_signature(stopwords, lemmatizer_name)
+        self.ids = {}
+        self.tokens = []
+        self.is_stopword = []
+        # -1 : lemma not computed yet
+        self.lemmas = []
+        # Ids lemmatized since the last `export`
+        self.lemmatized = []
+        # Lemmas computed / merged since the table was loaded or saved
+        self.modified = False
+
+    @staticmethod
+    def get_signature(stopwords, lemmatizer_name):
+        """ Function to compute the signature of the stopwords and of the lemmatizer: a saved table
+        is only reused with the same ones
+
+        :param stopwords: Set of stopwords
+        :type stopwords: `Set`
+        :param lemmatizer_name: Name and version of the lemmatizer
+        :type lemmatizer_name: `str`
+
+        :return: Signature
+        :rtype: `str`
+        """
+        digest = hashlib.sha1("\n".join(sorted(stopwords)).encode('utf-8')).hexdigest()
+        return "%s:%s" % (lemmatizer_name, digest)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def add(self, token):
+        """ Function to get the id of a token, interning it if it is new
+
+        :param token: Token
+        :type token: `str`
+
+        :return: Id of the token
+        :rtype: `int`
+        """
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.ids[token] = token_id
+            self.tokens.append(token)
+            self.is_stopword.append(token in self.stopwords)
+            self.lemmas.append(-1)
+        return token_id
+
+    def lemma_id(self, token_id):
+        """ Function to get the id of the lemma of a token, lemmatizing it on first use
+
+        :param token_id: Id of the token
+        :type token_id: `int`
+
+        :return: Id of the lemma
+        :rtype: `int`
+        """
+        lemma_id = self.lemmas[token_id]
+        if lemma_id < 0:
+            lemma_id = self.add(self.lemmatize(self.tokens[token_id]))
+            self.lemmas[token_id] = lemma_id
+            self.lemmatized.append(token_id)
+            self.modified = True
+        return lemma_id
+
+    def process(self, tokens, k=3):
+        """ Function to drop the stopwords and the tokens of `k` letters or less and to lemmatize
+        the other ones (same result as `PreProcessing.remove_stopwords`, `remove_letters(k)` and
+        `lemmatize`, one dictionary lookup per token once the vocabulary is warm)
+
+        :param tokens: Tokens
+        :type tokens: `List`
+        :param k: Minimum length for a words for it to be retained in the text
+        :type k: `int`
+
+        :return: Ids of the lemmas
+        :rtype: `List`
+        """
+        ids, is_stopword, lemmas = self.ids, self.is_stopword, self.lemmas
+        lemma_ids = []
+        for token in tokens:
+            token_id = ids.get(token)
+            if token_id is None:
+                token_id = self.add(token)
+            if is_stopword[token_id] or len(token) <= k:
+                continue
+            lemma_id = lemmas[token_id]
+            if lemma_id < 0:
+                lemma_id = self.lemma_id(token_id)
+            lemma_ids.append(lemma_id)
+        return lemma_ids
+
+    def encode(self, tokens):
+        """ Function to convert tokens to an array of ids
+
+        :param tokens: Tokens
+        :type tokens: `List`
+
+        :return: Ids
+        :rtype: `numpy.ndarray`
+        """
+        return np.fromiter((self.add(token) for token in tokens), dtype=np.int32, count=len(tokens))
+
+    def decode(self, token_ids):
+        """ Function to convert ids back to tokens
+
+        :param token_ids: Ids
+        :type token_ids: `List`
+
+        :return: Tokens
+        :rtype: `List`
+        """
+        tokens = self.tokens
+        return [tokens[token_id] for token_id in token_ids]
+
+    def export(self):
+        """ Function to get the lemmas computed since the last export, to be merged in the vocabulary
+        of another process (ids are local to a process, so the entries hold the tokens)
+
+        :return: List of (token, lemma)
+        :rtype: `List`
+        """
+        tokens, lemmas = self.tokens, self.lemmas
+        entries = [(tokens[token_id], tokens[lemmas[token_id]]) for token_id in self.lemmatized]
+        self.lemmatized = []
+        return entries
+
+    def merge(self, entries):
+        """ Function to merge entries exported by another process
+
+        :param entries: List of (token, lemma)
+        :type entries: `List`
+
+        :return: None
+        """
+        for token, lemma in entries:
+            token_id = self.add(token)
+            if self.lemmas[token_id] < 0:
+                self.lemmas[token_id] = self.add(lemma)
+                self.modified = True
+
+    def save(self, path):
+        """ Function to atomically save the table if lemmas were added since it was loaded
+
+        :param path: Path of the `.npz` file
+        :type path: `str`
+
+        :return: None
+        """
+        if not self.modified and os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=np.array(self.signature), tokens=np.array(self.tokens, dtype=str),
+                     lemmas=np.array(self.lemmas, dtype=np.int32))
+        os.replace(tmp_path, path)
+        self.modified = False
+
+    @classmethod
+    def load(cls, path, lemmatize, stopwords, lemmatizer_name=''):
+        """ Function to load a table saved by `save` (an empty vocabulary is returned if the file
+        is missing or was built with other stopwords or another lemmatizer)
+
+        :param path: Path of the `.npz` file
+        :type path: `str`
+        :param lemmatize: Function returning the lemma of a token
+        :type lemmatize: Function()
+        :param stopwords: Set of stopwords
+        :type stopwords: `Set`
+        :param lemmatizer_name: Name and version of the lemmatizer
+        :type lemmatizer_name: `str`
+
+        :return: Vocabulary
+        :rtype: class `Vocabulary`
+        """
+        vocabulary = cls(lemmatize, stopwords, lemmatizer_name)
+        if path is not None and os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['signature']) == vocabulary.signature:
+                    vocabulary.tokens = data['tokens'].tolist()
+                    vocabulary.lemmas = data['lemmas'].tolist()
+                    vocabulary.ids = {token: token_id for token_id, token in enumerate(vocabulary.tokens)}
+                    vocabulary.is_stopword = [token in stopwords for token in vocabulary.tokens]
+        return vocabulary